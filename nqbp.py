@@ -12,6 +12,11 @@ if __name__ == '__main__':
 	    sys.exit( "ERROR: The environment variable NQBP_BIN is not set!" )
 	sys.path.append( NQBP_BIN )
 
+	# Forward the build to the project's build daemon (when it is running)
+	from nqbplib import daemon
+	prjdir = os.path.dirname( os.path.abspath(__file__) )
+	daemon.client( sys.argv, prjdir )
+
 	# Find the Package & Workspace root
 	from nqbplib import utils
 	utils.set_pkg_and_wrkspace_roots(__file__)
@@ -19,5 +24,8 @@ if __name__ == '__main__':
 	# Call into core/common scripts
 	import mytoolchain
 	from nqbplib import mk
-	mk.build( sys.argv, mytoolchain.create() )
+	if ( daemon.is_daemon_request( sys.argv ) ):
+		daemon.run( prjdir, mytoolchain, mk.build )
+	else:
+		mk.build( sys.argv, mytoolchain.create() )
 
@@ -27,6 +27,30 @@ _BUILT_DIR_         - The build fields .firstobjs and .lastobjs, can be set (in
                             command shell does NOT process wildcards like a 
                             *nix shell.  
 
+Precompiled Headers
+--------------------
+The build field .pch can be set (in the mytoolchain.py file) to a list of
+header files (as they would appear in an #include statement).  The headers are 
+compiled once (per build variant and compiler flags) into a precompiled header
+that is used when compiling all C++ files.  For example:
+
+                      base_release.pch = 'Cpl/System/Api.h Cpl/Text/FString.h'
+
+Object Directories
+--------------------
+By default the object files are built in the project directory (the 'object
+root').  A toolchain can set _variant_obj_roots to True to give each build
+variant, and its debug (-g) and optimized builds, its own object root, i.e.
+.nqbp/obj/<variant>/debug|optimized in the project directory.  This means
+that switching between variants (or between debug and optimized builds) does
+not require a rebuild and that --bld-all builds the variants at the same 
+time.  The link is performed in the '_<variant>' sub-directory of the object
+root and the link outputs are then copied to the project's '_<variant>'
+directory.  Note: Paths in the link options that are relative to the 
+project directory (e.g. '-T ../linker.ld') do NOT work with per-variant 
+object roots, i.e. only opt in when the link options use absolute paths 
+(or paths relative to the object directories).
+
 """
 
 #
@@ -36,20 +60,35 @@ import os
 import shutil
 import sys
 import subprocess
+import hashlib
+import re
 
 #
 from . import utils
+from . import depends
+from . import history
+from . import remote
+from . import timeline
+from . import manifest
+from . import diagnostics
+from . import crash
 
 # Globals
 from .my_globals import NQBP_WORK_ROOT
 from .my_globals import NQBP_PKG_ROOT
 from .my_globals import NQBP_TEMP_EXT
+from .my_globals import NQBP_CMD_SIGNATURE_EXT
+from .my_globals import NQBP_DIAGNOSTICS_EXT
 from .my_globals import NQBP_VERSION
 from .my_globals import NQBP_PRJ_DIR
 from .my_globals import NQBP_WRKPKGS_DIRNAME
 from .my_globals import NQBP_XPKGS_SRC_ROOT
 from .my_globals import NQBP_NAME_LIBDIRS
+from .my_globals import NQBP_LINK_MANIFEST
+from .my_globals import NQBP_STATE_DIRNAME
 
+# Results of validate_cc() (key: compiler command and PATH)
+_validated_cc = {}
 
 # Structure for holding build-variant specific options
 class BuildValues:
@@ -65,6 +104,7 @@ class BuildValues:
         self.linkscript   = ''
         self.firstobjs    = ''
         self.lastobjs     = ''
+        self.pch          = ''
 
     def append(self,src):
         self.inc          += ' ' + src.inc        
@@ -78,6 +118,7 @@ class BuildValues:
         self.linkscript   += ' ' + src.linkscript 
         self.firstobjs    += ' ' + src.firstobjs 
         self.lastobjs     += ' ' + src.lastobjs 
+        self.pch          += ' ' + src.pch
   
         
     def copy(self):
@@ -93,6 +134,7 @@ class BuildValues:
         new.linkscript   = self.linkscript 
         new.firstobjs    = self.firstobjs 
         new.lastobjs     = self.lastobjs 
+        new.pch          = self.pch
        
         return new
             
@@ -135,13 +177,50 @@ class ToolChain:
         
         self._validate_cc_options = '-v'
         
-        self._clean_list     = ['o', 'd', 'lst', 'txt', 'map', 'obj', 'idb', 'pdb', 'out', 'pyc', NQBP_TEMP_EXT(), 'gcda', 'gcov', 'gcno', 'tmp' ]
+        # Options for generating header dependencies (used by incremental builds)
+        self._cc_depfile_option  = '-MMD'   # Compiler option to generate a make-style dependency file
+        self._asm_depfile_option = ''       # Assembler option to generate a make-style dependency file (empty string means not supported)
+        self._cc_show_includes   = False    # Set to True when the compiler only reports its header files via stdout (i.e. MSVC /showIncludes)
+        self._depfile_ext        = 'd'
+
+        # Options for the compile cache
+        self._cc_preprocess_option  = '-E'  # Compiler option to output the preprocessed source to stdout
+        self._asm_preprocess_option = ''    # Assembler option to output the preprocessed source to stdout (empty string means not supported)
+        self._cache                 = None
+        self._tool_identity         = {}
+
+        # Compiler diagnostics of the entire build (see diagnostics.py)
+        self._diagnostics = diagnostics.Collector()
+
+        # The number of concurrent jobs the compiler is stable at (see crash.py)
+        self._crash_stability = None
+
+        # Options for remote compiles (see remote.py)
+        self._remote            = None
+        self._remote_file_types = ['c', 'cpp']     # File types that can be compiled remotely (empty list means not supported)
+
+        # Options for precompiled headers. The '{hdr}', '{pch}', '{obj}', and '{src}' symbols are replaced by the file names
+        self._pch_create_option = '-x c++-header {src} -o {pch}'    # Compiler options (and file) to create the precompiled header
+        self._pch_use_option    = '-include {hdr}'                  # Compiler option to use the precompiled header (empty string means not supported)
+        self._pch_ext           = '.gch'                            # Appended to the header file name to name the precompiled header
+        self._pch_stub          = False                             # Set to True when the precompiled header is created by compiling a .cpp file that includes the header (i.e. MSVC /Yc)
+        self._pch_link_obj      = False                             # Set to True when the object file created with the precompiled header must be linked (i.e. MSVC /Yc)
+        self._pch_files         = None                              # (hdr, pch, obj, src, depfile) of the current variant. Constructed by pre_build()
+        self._pch_args          = ''
+
+        # Compile commands as argument lists, i.e. file type -> (argv, indexes of the ME_CC_BASE_FILENAME arguments). Constructed by pre_build()
+        self._cc_templates = {}
+
+        self._clean_list     = ['o', 'd', 'lst', 'txt', 'map', 'obj', 'idb', 'pdb', 'out', 'pyc', NQBP_TEMP_EXT(), NQBP_CMD_SIGNATURE_EXT(), 'gcda', 'gcov', 'gcno', 'tmp' ]
         self._clean_pkg_dirs = [ 'src' ]
         self._clean_ext_dirs = [ NQBP_WRKPKGS_DIRNAME() ]
         self._clean_abs_dirs = [ '__abs' ]
  
         self._ar_library_name = 'library.a'
         self._ar_options      = 'rc ' + self._ar_library_name
+        self._ar_incremental  = True    # Only adds/replaces new or changed objects in an existing archive (requires GNU ar)
+        self._ar_thin         = False   # Creates GNU 'thin' archives, i.e. the archive references the object files instead of copying them
+        self._link_objects    = False   # Links the object files directly, i.e. no archives are created
         
         self._link_lib_prefix       = ''
         self._linker_libgroup_start = '-Wl,--start-group'
@@ -149,6 +228,13 @@ class ToolChain:
         
         self._final_output_name = exename
         self._link_output       = '-o ' + exename
+        self._link_extra_inputs = []    # Additional files (relative to the build variant output directory) that trigger a re-link when changed
+
+        # Object directories (see 'Object Directories' above)
+        self._variant_obj_roots = False
+        self._obj_root          = prjdir
+        self._history_variant   = default_variant
+        self._manifest          = manifest.BuildManifest( utils.get_state_file( 'manifest', default_variant ) )   # Constructed by pre_build()
         
 
 
@@ -193,6 +279,95 @@ class ToolChain:
     def set_printer(self, printer):
         self._printer = printer
         
+    #--------------------------------------------------------------------------
+    def set_remote_compiler(self, compiler):
+        self._remote = compiler
+
+    def get_remote_compiler(self):
+        return self._remote
+
+    #--------------------------------------------------------------------------
+    def get_diagnostics(self):
+        return self._diagnostics
+
+    def set_crash_stability(self, stability):
+        self._crash_stability = stability
+
+    def get_crash_stability(self):
+        return self._crash_stability
+
+    #--------------------------------------------------------------------------
+    def set_compile_cache(self, cache):
+        self._cache = cache
+
+    def get_compile_cache(self):
+        return self._cache
+
+    #--------------------------------------------------------------------------
+    def get_obj_root(self):
+        """ Returns the root directory of the object files of the current variant"""
+        return self._obj_root
+
+    def get_obj_ext(self):
+        return self._obj_ext
+
+    def get_depfile_ext(self):
+        return self._depfile_ext
+
+    def get_archive_name(self):
+        return self._ar_library_name
+
+    def set_dir_objects(self, objdir, srcfiles):
+        """ Records (in the build manifest) the object files of the object
+            directory 'objdir', i.e. the objects of the source files 'srcfiles'
+        """
+        objs    = [ os.path.splitext( os.path.basename( f ) )[0] + '.' + self._obj_ext for f in srcfiles ]
+        archive = None if self._link_objects or os.path.abspath( objdir ) == os.path.abspath( self._obj_root ) else os.path.join( self._get_manifest_key( objdir ), self._ar_library_name )
+        self._manifest.set_objects( self._get_manifest_key( objdir ), objs, archive )
+
+    def add_dir_object(self, objdir, srcfile):
+        """ Adds the object file of the source file 'srcfile' to the build 
+            manifest entry of the object directory 'objdir' (e.g. a file that
+            was compiled by itself).  Nothing is done when the directory has
+            no entry, i.e. the directory is listed
+        """
+        key  = self._get_manifest_key( objdir )
+        objs = self._manifest.get_objects( key )
+        if ( objs != None ):
+            objs.append( os.path.splitext( os.path.basename( srcfile ) )[0] + '.' + self._obj_ext )
+            self._manifest.set_objects( key, objs, self._manifest.get_archive( key ) )
+
+    def get_dir_objects(self, objdir):
+        """ Returns the object files (file names) of the object directory 
+            'objdir' as recorded in the build manifest.  The directory is
+            listed when it has no manifest entry
+        """
+        objs = self._manifest.get_objects( self._get_manifest_key( objdir ) )
+        if ( objs == None ):
+            objs = utils.dir_list_filter_by_ext( objdir, [self._obj_ext], derivedDir=True )
+        return objs
+
+    def save_build_manifest(self):
+        self._manifest.save()
+
+    def get_include_dirs(self):
+        """ Returns the include directories (absolute paths) of the current 
+            variant.  Relative paths are relative to the object root
+        """
+        dirs   = []
+        tokens = self._all_opts.inc.split()
+        for i, t in enumerate( tokens ):
+            d = None
+            if ( t in ( '-I', '/I', '-isystem', '-iquote', '-idirafter' ) and i + 1 < len(tokens) ):
+                d = tokens[i+1]
+            elif ( t.startswith( '-I' ) or t.startswith( '/I' ) ):
+                d = t[2:]
+            if ( d != None ):
+                d = os.path.normpath( os.path.join( self._obj_root, d ) )
+                if ( d not in dirs ):
+                    dirs.append( d )
+        return dirs
+        
     #--------------------------------------------------------------------------
     def get_default_variant(self):
         return self._bld
@@ -212,42 +387,37 @@ class ToolChain:
         if ( blddir == True ):
             if ( not silent ):
                 self._printer.output( "= Cleaning Built artifacts..." )
-            # remove output/build variant directory
+            # remove output/build variant directory (and its link directory)
             vardir = '_' + self._bld
             self._printer.debug( '# Cleaning directory: {}'.format( vardir ) )
-            if ( os.path.exists(vardir) ):
-                shutil.rmtree( vardir, True )   
+            for d in ( vardir, os.path.join( self._obj_root, vardir ) ):
+                utils.remove_tree( d )
 
         if ( pkg == True ):
             if ( not silent ):
                 self._printer.output( "= Cleaning Project and local Package derived objects..." )
             self._printer.debug( '# Cleaning file extensions: {}'.format( self._clean_list ) )
-            utils.run_clean_dir_pre_processing( NQBP_PRJ_DIR(), self._printer )
-            utils.run_clean_pre_processing( self._printer, self.libdirs, clean_pkg=True, clean_local=True )
+            utils.run_clean_pre_processing( self._printer, self.libdirs, clean_pkg=True, clean_local=True, extra_dirs=[NQBP_PRJ_DIR()] )
             utils.del_files_by_ext( NQBP_PRJ_DIR(), self._clean_list )
+            if ( os.path.isdir( self._obj_root ) ):
+                utils.del_files_by_ext( self._obj_root, self._clean_list )
 
             self._printer.debug( '# Cleaning directories: {}'.format( self._clean_pkg_dirs ) )
-            for d in self._clean_pkg_dirs:
-                if ( os.path.exists(d) ):
-                    shutil.rmtree( d, True )
+            self._remove_obj_dirs( self._clean_pkg_dirs )
 
         if ( ext == True ):
             if ( not silent ):
                 self._printer.output( "= Cleaning External Package derived objects..." )
             self._printer.debug( '# Cleaning directories: {}'.format( self._clean_ext_dirs ) )
             utils.run_clean_pre_processing( self._printer, self.libdirs, clean_xpkgs=True )
-            for d in self._clean_ext_dirs:
-                if ( os.path.exists(d) ):
-                    shutil.rmtree( d, True )
+            self._remove_obj_dirs( self._clean_ext_dirs )
 
         if ( abs == True ):
             if ( not silent ):
                 self._printer.output( "= Cleaning Absolute Path derived objects..." )
             self._printer.debug( '# Cleaning directories: {}'.format( self._clean_abs_dirs ) )
             utils.run_clean_pre_processing( self._printer, self.libdirs, clean_absolute=True )
-            for d in self._clean_abs_dirs:
-                if ( os.path.exists(d) ):
-                    shutil.rmtree( d, True )
+            self._remove_obj_dirs( self._clean_abs_dirs )
                 
  
     #--------------------------------------------------------------------------
@@ -258,6 +428,10 @@ class ToolChain:
                 self._printer.output( "= Build Variant: " + b )
             self.pre_build( b, arguments )
             self.clean(True,True,True,silent)
+
+        # Remove the object trees of all variants (i.e. debug and optimized)
+        utils.remove_tree( os.path.join( NQBP_PRJ_DIR(), NQBP_STATE_DIRNAME(), 'obj' ) )
+        utils.remove_tree( os.path.join( NQBP_PRJ_DIR(), NQBP_STATE_DIRNAME(), 'manifest' ) )
     
 
     #--------------------------------------------------------------------------
@@ -303,6 +477,13 @@ class ToolChain:
         if ( bld_var not in self._bld_variants ):
             self._printer.output( 'ERROR: Invalid variant ({}) selected'.format( bld_var ) )
             sys.exit(1)
+
+        # Select the object tree
+        self._obj_root        = NQBP_PRJ_DIR()
+        self._history_variant = history.get_variant_name( bld_var, arguments['-g'] )
+        if ( self._variant_obj_roots ):
+            self._obj_root = os.path.join( NQBP_PRJ_DIR(), NQBP_STATE_DIRNAME(), 'obj', bld_var, 'debug' if arguments['-g'] else 'optimized' )
+        self._manifest = manifest.BuildManifest( utils.get_state_file( 'manifest', self._history_variant ) )
             
         self._printer.debug( '# Build Variant "{}" selected'.format( self._bld ) )
         if ( arguments['--debug'] ):
@@ -334,7 +515,7 @@ class ToolChain:
         base.asmflags += " {}BUILD_VARIANT_{} {}{}BUILD_NUMBER={}{} {}".format(self._asmflag_symdef,self._bld.upper(), self._asmflag_symdef, self._asmflag_symvalue_delimiter, arguments['--bldnum'],  self._asmflag_symvalue_delimiter, asm_self_defines );
 #        self._all_opts = base
 #        self._all_opts.append( bld.get('user_base', null ) )
-        self._all_opts = bld.get('user_base', null )
+        self._all_opts = bld.get('user_base', null ).copy()     # Copy, i.e. do NOT modify the toolchain's build values (e.g. when re-used by the build daemon)
         self._all_opts.append( base )
        
         
@@ -349,101 +530,270 @@ class ToolChain:
             self._printer.debug( "# Final 'all_opts'" )
             self._dump_options(  self._all_opts, True )
 
+        # Select the precompiled header and tokenize the compile commands (Note: the precompiled header changes the C++ command)
+        self._setup_pch()
+        self._build_cc_templates()
+
+        # Capture the compiler identities (once) for the compile cache
+        if ( self._cache != None and len(self._tool_identity) == 0 ):
+            for tool in (self._cc, self._asm):
+                self._tool_identity[tool] = self._get_tool_identity( tool )
+
         # Create the list of directories from libdirs.b file to run the pre-processing clean script against
         self.libdirs  = []
         self.libnames = []
         if ( not arguments['--clean-all'] ):        # Skip if doing a --clean-all
             inf = open( NQBP_NAME_LIBDIRS(), 'r' )
-            utils.create_working_libdirs( self._printer, inf, arguments, self.libdirs, self.libnames, 'local', bld_var )  
+            utils.load_working_libdirs( self._printer, inf, arguments, self.libdirs, self.libnames, 'local', bld_var )  
             inf.close()
 
     #--------------------------------------------------------------------------
-    def ar( self, arguments ):
-        # NOTE: Assumes archive is to be built in the current working dir
+    def ar( self, arguments, cwd=None ):
+        # NOTE: The archive is built in the 'cwd' directory (or the current working dir when 'cwd' is None)
+        objdir  = cwd if cwd != None else '.'
+        libname = os.path.join( objdir, self._ar_library_name )
+
+        # Nothing to do when linking the object files directly
+        if ( self._link_objects ):
+            return
+
         self._printer.output("=" )
         self._printer.output("= Archiving: {}".format( self._ar_library_name) )
         
-        # remove existing archive
-        utils.delete_file( self._ar_library_name )
-        
         # Get all object files
-        objs = utils.dir_list_filter_by_ext( ".", [self._obj_ext], derivedDir=True )
+        objs = self.get_dir_objects( objdir )
+
+        # Only update the new/changed members of an existing archive
+        if ( self._ar_incremental and os.path.isfile( libname ) ):
+            objs = self._get_changed_ar_members( arguments, libname, objs, cwd )
+            if ( objs == None ):
+                utils.delete_file( libname )
+                objs = self.get_dir_objects( objdir )
+            elif ( len(objs) == 0 ):
+                self._printer.verbose( "= Archive is up-to-date" )
+                return
+
+        # remove existing archive
+        else:
+            utils.delete_file( libname )
        
         # build archive string
-        cmd = self._ar + ' ' + self._ar_options
+        cmd = self._ar + ' ' + self._get_ar_options()
         for o in objs:
             cmd = cmd + ' ' + o
             
         # run command            
         if ( arguments['-v'] ):
             self._printer.output( cmd )
-        if (utils.run_shell(self._printer, cmd) ):
+        start = time.time()
+        if (utils.run_shell(self._printer, cmd, cwd=cwd) ):
             self._printer.output("=")
             self._printer.output("= Build Failed: archiver/librarian error")
             self._printer.output("=")
             sys.exit(1)
+        self._add_history_sample( 'archive', objdir, self._ar_library_name, time.time() - start )
         
                    
     #--------------------------------------------------------------------------
     def validate_cc( self ):
         cc = self._cc + ' ' + self._validate_cc_options
         self._printer.debug( '# Validating the Compiler using:: {}'.format( cc ) )
+
+        # Only validate once per process (i.e. per build daemon) unless the compiler or PATH changes
+        key = (cc, os.environ.get( 'PATH' ))
+        if ( key in _validated_cc ):
+            return _validated_cc[key]
+
         p  = subprocess.Popen( cc, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE )
         r  = p.communicate()
         if ( p.returncode ):
             self._printer.output( "ERROR: Cannot validate toolchain ({}) - check your path/environment variable(s)".format( self._ccname ) )
             sys.exit(1)
       
+        _validated_cc[key] = r
         return r
 
     #--------------------------------------------------------------------------
-    def cc( self, arguments, fullname ):
+    def cc( self, arguments, fullname, cwd=None, report_failure=True ):
+        # NOTE: The object file is built in the 'cwd' directory (or the current working dir when 'cwd' is None)
+        # NOTE: The diagnostics of a failed compile are not reported when 'report_failure' is False (i.e. the caller discards its output)
     
         # parse incoming name into its base
         basename = os.path.splitext( os.path.basename( fullname ) )[0]
+        objdir   = cwd if cwd != None else '.'
         
-        # construct compiler/assembler command
-        cc_base = ' {} {} {} '.format( self._cc,
-                                     self._all_opts.cflags,
-                                     self._all_opts.inc
-                                   )
-        cc = cc_base + self._all_opts.c_only_flags
-
-        if ( fullname.endswith('.c') ):
-            pass
-        elif ( fullname.endswith('.cpp') ):
-            cc = ' {} {} '.format(cc_base, self._all_opts.cppflags)
-        elif ( self.is_asm_file(fullname) ):
-            cc = ' {} {} {} '.format( self._asm,
-                                    self._all_opts.asmflags,
-                                    self._all_opts.asminc
-                                  )
-        else:
+        # Select the compile rule
+        file_type = self._get_file_type( fullname )
+        if ( file_type == None ):
             self._printer.output( "ERROR: No rule to compile the file: {}".format( os.path.basename(fullname) ) )
             sys.exit(1)
 
-        # Do any substitution of the 'ME_xxx' values
-        cc = cc.replace( 'ME_CC_BASE_FILENAME', basename )
-        
+        depfile_option    = self._asm_depfile_option    if file_type == 'asm' else self._cc_depfile_option
+        preprocess_option = self._asm_preprocess_option if file_type == 'asm' else self._cc_preprocess_option
 
         # ensure correct directory separator                                
         full_fname = utils.standardize_dir_sep( fullname )
 
-        cc += ' ' + full_fname
-        
+        # Generate header dependencies when doing an incremental build
+        incremental = arguments['--incremental']
+        extra_args  = depfile_option if incremental and depfile_option != '' else ''
+
+        # Construct the compiler/assembler command (and the command to preprocess the file)
+        template     = self._cc_templates.get( file_type )
+        remote_flags = None
+        if ( template != None ):
+            argv, indexes = template
+            argv = list( argv )
+            for i in indexes:
+                argv[i] = argv[i].replace( 'ME_CC_BASE_FILENAME', basename )
+            preprocess = argv + preprocess_option.split() + [full_fname]
+            cc         = argv + extra_args.split() + [full_fname]
+            cc_text    = ' '.join( cc )
+
+            # Remote compiles require a preprocessed file (and the preprocessor generates the dependency file)
+            if ( self._remote != None and file_type in self._remote_file_types and preprocess_option != '' ):
+                remote_flags = remote.make_remote_flags( argv[1:] )
+                if ( remote_flags != None ):
+                    preprocess = argv + extra_args.split() + preprocess_option.split() + [full_fname]
+
+        # Command requires a shell
+        else:
+            base       = self._get_cc_command( file_type ).replace( 'ME_CC_BASE_FILENAME', basename )
+            preprocess = base + ' ' + preprocess_option + ' ' + full_fname
+            cc         = base + ' ' + extra_args + ' ' + full_fname
+            cc_text    = cc
+
+        # Skip the file if it is up-to-date
+        objfile = os.path.join( objdir, basename + '.' + self._obj_ext )
+        depfile = os.path.join( objdir, basename + '.' + self._depfile_ext ) if incremental and depfile_option != '' else None
+        diagfile = os.path.join( objdir, basename + '.' + NQBP_DIAGNOSTICS_EXT() )
+        if ( incremental ):
+            sigfile   = os.path.join( objdir, basename + '.' + NQBP_CMD_SIGNATURE_EXT() )
+            signature = depends.make_signature( cc_text )
+            current, reason = depends.is_up_to_date( objfile, os.path.join( objdir, full_fname ), depfile, sigfile, signature, objdir )
+            if ( current ):
+                self._printer.verbose( "= Up-to-date: " + os.path.basename(fullname) )
+                for r in diagnostics.load_records( diagfile ):
+                    self._diagnostics.add( r, full_fname )
+                return
+            self._printer.debug( "# Rebuilding {}: {}".format( os.path.basename(fullname), reason ) )
+            utils.delete_file( sigfile )
+
+        # Preprocess the file (for the compile cache and remote compiles)
+        preprocessed = None
+        if ( (self._cache != None or remote_flags != None) and preprocess_option != '' ):
+            preprocessed = self._preprocess( preprocess, cwd )
+
+        # Attempt to restore the object file from the compile cache
+        cache_key = None
+        if ( self._cache != None and preprocessed != None ):
+            cache_key = self._get_cache_key( preprocessed, file_type, self._get_cache_flags( file_type ).replace( 'ME_CC_BASE_FILENAME', basename ) )
+            if ( self._cache.restore( cache_key, objfile, depfile ) ):
+                self._printer.verbose( "= Cached: " + os.path.basename(fullname) )
+                if ( incremental ):
+                    depends.write_signature( sigfile, signature )
+                return
+
         # Output Progress...
         if ( self._echo_cc ):
             self._printer.output("= Compiling: " + os.path.basename(fullname) )
         if ( arguments['-v'] ):
-            self._printer.output( cc )
+            self._printer.output( cc_text )
         
         # do the compile
-        if ( utils.run_shell(self._printer, cc) ):
+        includes      = []
+        show_includes = None
+        if ( depfile != None and self._cc_show_includes ):
+            show_includes = lambda text: depends.filter_show_includes( text, includes )
+        detector      = crash.CrashDetector( show_includes )
+        output_filter = diagnostics.OutputFilter( self._diagnostics, full_fname, os.path.abspath( objdir ), detector )
+        start = time.time()
+        rss   = None
+        if ( remote_flags != None and preprocessed != None and self._compile_remote( cc[0], remote_flags, file_type, preprocessed, objfile, output_filter ) ):
+            self._printer.verbose( "= Compiled remotely: " + os.path.basename(fullname) )
+        else:
+            failed  = utils.run_shell(self._printer, cc, output_filter=output_filter, cwd=cwd)
+            rss     = utils.get_last_peak_rss()
+            pending = output_filter.flush()
+            if ( pending != '' ):
+                self._printer.stream( pending )
+            if ( failed and report_failure ):
+                output_filter.commit()
+
+            # A crash is reported to the caller, i.e. the compile can be retried (but not when the build was cancelled)
+            if ( failed and crash.is_crash( failed, detector ) and not utils.processes_killed() ):
+                self._printer.output( "= Compiler crashed: " + os.path.basename(fullname) )
+                raise crash.CompilerCrash()
+            if ( failed ):
+                self._printer.output("=")
+                self._printer.output("= Build Failed: compiler error")
+                self._printer.output("=")
+                sys.exit(1)
+        self._add_history_sample( 'compile', objdir, os.path.basename(fullname), time.time() - start, rss )
+        output_filter.commit()
+
+        # Capture what was used to build the object file 
+        if ( incremental ):
+            diagnostics.save_records( diagfile, output_filter.records )
+        if ( show_includes != None ):
+            depends.write_depfile( depfile, os.path.basename(objfile), [full_fname] + includes )
+        if ( cache_key != None ):
+            self._cache.store( cache_key, objfile, depfile )
+        if ( incremental ):
+            depends.write_signature( sigfile, signature )
+
+
+    #--------------------------------------------------------------------------
+    def build_pch( self, arguments ):
+        """ Compiles the precompiled header (if there is one and it is 
+            out-of-date).  Must be called after pre_build() and before any C++
+            files are compiled
+        """
+        if ( self._pch_files == None ):
+            return
+
+        hdr, pch, obj, src, depfile = self._pch_files
+        pchdir = os.path.dirname( hdr )
+        os.makedirs( pchdir, exist_ok=True )
+
+        # Only update the wrapper header when its content changes (i.e. preserve its time stamp)
+        content = ''.join( [ '#include "{}"\n'.format( h ) for h in self._all_opts.pch.split() ] )
+        utils.write_file_if_changed( hdr, content )
+        if ( self._pch_stub ):
+            utils.write_file_if_changed( src, '#include "{}"\n'.format( hdr ) )
+
+        # Skip when up-to-date (Note: the build time is NOT defined so that the precompiled header can be used by subsequent incremental builds)
+        build_time = re.escape( self._cflag_symdef + self._cflag_symvalue_delimiter ) + r'BUILD_TIME_UTC=\d+' + re.escape( self._cflag_symvalue_delimiter )
+        base       = re.sub( build_time, '', self._get_cc_command( 'cpp', use_pch=False ) ).replace( 'ME_CC_BASE_FILENAME', 'nqbp_pch' )
+        cmd        = ' '.join( [ base, self._cc_depfile_option, self._pch_create_option.format( hdr=hdr, pch=pch, obj=obj, src=src ) ] )
+        sigfile    = os.path.join( pchdir, 'nqbp_pch.' + NQBP_CMD_SIGNATURE_EXT() )
+        signature  = depends.make_signature( cmd )
+        if ( depends.is_up_to_date( pch, src, depfile if self._cc_depfile_option != '' else None, sigfile, signature, pchdir )[0] ):
+            self._printer.verbose( "= Precompiled header is up-to-date" )
+            return
+
+        # Output Progress...
+        utils.delete_file( sigfile )
+        self._printer.output( "=====================" )
+        self._printer.output( "= Compiling Precompiled Header: " + self._all_opts.pch.strip() )
+        if ( arguments['-v'] ):
+            self._printer.output( cmd )
+
+        # do the compile
+        includes      = []
+        output_filter = None
+        if ( self._cc_show_includes ):
+            output_filter = lambda text: depends.filter_show_includes( text, includes )
+        argv = utils.split_command( cmd )
+        if ( utils.run_shell( self._printer, argv if argv != None else cmd, output_filter=output_filter, cwd=pchdir ) ):
             self._printer.output("=")
-            self._printer.output("= Build Failed: compiler error")
+            self._printer.output("= Build Failed: precompiled header error")
             self._printer.output("=")
             sys.exit(1)
 
+        if ( output_filter != None ):
+            depends.write_depfile( depfile, os.path.basename(pch), [src] + includes )
+        depends.write_signature( sigfile, signature )
 
 
     #--------------------------------------------------------------------------
@@ -455,7 +805,7 @@ class ToolChain:
         libdirs  = []
         libnames = []
         myargs   = { '-p':False, '-x':False, '-b':arguments['-b'], '--noabs':False, '-q':None, '-Q':None, '-c':None, '-C':None }
-        utils.create_working_libdirs( self._printer, inf, myargs, libdirs, libnames, local_external_setting, variant )  
+        utils.load_working_libdirs( self._printer, inf, myargs, libdirs, libnames, local_external_setting, variant )  
         
         # Expand any _BUILD_DIR.aaaa symbols for .firstobjs and .lastobjs
         self._all_opts.firstobjs = utils.replace_build_dir_symbols(self,  self._all_opts.firstobjs, libdirs, ".." )
@@ -472,46 +822,83 @@ class ToolChain:
         self._printer.output( "=====================" )
         self._printer.output("= Linking..." )
 
-        # create build variant output
-        vardir = '_' + self._bld
-        utils.create_subdirectory( self._printer, '.', vardir )
-        utils.push_dir( vardir )
+        # create build variant output (Note: the current working directory is NOT changed, i.e. other variants can be building at the same time)
+        vardir = self._get_link_dir()
+        os.makedirs( vardir, exist_ok=True )
         
         # construct link command
-        libs = self._build_library_list( libdirs )
-        startgroup = self._linker_libgroup_start if libs != '' else ''
-        endgroup   = self._linker_libgroup_end   if libs != '' else ''
-        ld = '{} {} {} {} {} {} {} {} {} {} {}'.format( 
-                                            self._ld,
-                                            self._link_output,
-                                            self._all_opts.firstobjs,
-                                            self._build_prjobjs_list(),
-                                            self._all_opts.linkflags,
-                                            self._all_opts.linkscript,
-                                            startgroup,
-                                            libs,
-                                            endgroup,
-                                            self._all_opts.linklibs,
-                                            self._all_opts.lastobjs
-                                            )
+        ld = self._build_link_command( libdirs )
                                           
         # do the compile
         if ( arguments['-v'] ):
             self._printer.output( ld )
-        if ( utils.run_shell(self._printer, ld) ):
+        if ( utils.run_shell(self._printer, ld, cwd=vardir) ):
             self._printer.output("=")
             self._printer.output("= Build Failed: linker error")
             self._printer.output("=")
             sys.exit(1)
+        
+    #--------------------------------------------------------------------------
+    def is_link_current( self, arguments, libdirs ):
+        """ Returns True if none of the link inputs (i.e. archives, object 
+            files, linker script, link command) and none of the link outputs
+            have changed since the last successful link
+        """
+        vardir = self._get_link_dir()
+        if ( not os.path.isfile( os.path.join( vardir, NQBP_LINK_MANIFEST() ) ) ):
+            return False
+
+        ld = self._build_link_command( libdirs )
+        return depends.is_manifest_current( os.path.join( vardir, NQBP_LINK_MANIFEST() ), self._get_link_signature( ld ), self._get_link_inputs( ld ), vardir )
+
+    def save_link_manifest( self, arguments, libdirs ):
+        """ Records the link inputs and outputs after a successful link
+            (including any post-link steps)
+        """
+        vardir  = self._get_link_dir()
+        ld      = self._build_link_command( libdirs )
+        outputs = [ f for f in os.listdir( vardir ) if os.path.isfile( os.path.join( vardir, f ) ) and f != NQBP_LINK_MANIFEST() ]
+        depends.write_manifest( os.path.join( vardir, NQBP_LINK_MANIFEST() ), self._get_link_signature( ld ), self._get_link_inputs( ld ), outputs, vardir )
+
+    def publish_link_outputs( self ):
+        """ Copies the new/changed link outputs from the link directory (in the
+            object root) to the project's '_<variant>' directory
+        """
+        vardir = '_' + self._bld
+        srcdir = self._get_link_dir()
+        dstdir = os.path.join( NQBP_PRJ_DIR(), vardir )
+        if ( self._obj_root == NQBP_PRJ_DIR() or not os.path.isdir( srcdir ) ):
+            return
 
-        # Return to project dir
-        utils.pop_dir()
+        os.makedirs( dstdir, exist_ok=True )
+        for f in os.listdir( srcdir ):
+            src = os.path.join( srcdir, f )
+            dst = os.path.join( dstdir, f )
+            if ( f == NQBP_LINK_MANIFEST() or not os.path.isfile( src ) ):
+                continue
+            if ( not os.path.isfile( dst ) or os.stat( src ).st_mtime_ns != os.stat( dst ).st_mtime_ns or os.path.getsize( src ) != os.path.getsize( dst ) ):
+                shutil.copy2( src, dst )
         
         
     #==========================================================================
     # Private Methods
     #==========================================================================
     
+    #--------------------------------------------------------------------------
+    def _remove_obj_dirs( self, dirs ):
+        # Removes the directories from the object root (and from the project directory, i.e. toolchain specific directories and a previous build without variant object roots)
+        for d in dirs:
+            for path in ( d, os.path.join( self._obj_root, d ) ):
+                utils.remove_tree( path )
+
+    def _get_manifest_key( self, objdir ):
+        # Object directory relative to the object root
+        return os.path.relpath( os.path.abspath( objdir ), self._obj_root )
+
+    def _add_history_sample( self, kind, objdir, fname, seconds, rss=None ):
+        dir = os.path.relpath( os.path.abspath( objdir ), self._obj_root )
+        history.add_sample( self._history_variant, kind, dir, fname, seconds, rss )
+
     #--------------------------------------------------------------------------
     def _format_custom_c_define( self, sym ):
         return self._cflag_symdef   + self._cflag_symvalue_delimiter   + sym + self._cflag_symvalue_delimiter + ' '
@@ -520,12 +907,179 @@ class ToolChain:
         return self._asmflag_symdef + self._asmflag_symvalue_delimiter + sym + self._asmflag_symvalue_delimiter + ' '
     
 
+    #--------------------------------------------------------------------------
+    def _get_file_type( self, fullname ):
+        if ( fullname.endswith('.c') ):
+            return 'c'
+        elif ( fullname.endswith('.cpp') ):
+            return 'cpp'
+        elif ( self.is_asm_file(fullname) ):
+            return 'asm'
+        return None
+
+    def _get_cc_command( self, file_type, use_pch=True ):
+        # Returns the compiler/assembler command (without the file name) for the specified file type
+        if ( file_type == 'asm' ):
+            return ' {} {} {} '.format( self._asm, self._all_opts.asmflags, self._all_opts.asminc )
+
+        cc_base = ' {} {} {} '.format( self._cc, self._all_opts.cflags, self._all_opts.inc )
+        if ( file_type == 'cpp' ):
+            return ' {} {} {} '.format( cc_base, self._all_opts.cppflags, self._pch_args if use_pch else '' )
+        return cc_base + self._all_opts.c_only_flags
+
+    def _setup_pch( self ):
+        # Selects the precompiled header files for the current variant and compiler flags
+        self._pch_files = None
+        self._pch_args  = ''
+        headers = self._all_opts.pch.split()
+        if ( len(headers) == 0 or self._pch_use_option == '' ):
+            return
+
+        # The precompiled header is specific to the compiler flags (and the list of headers)
+        key     = depends.make_signature( self._get_cc_command( 'cpp', use_pch=False ) + ' ' + ' '.join( headers ) )
+        pchdir  = os.path.join( self._obj_root, '_' + self._bld, 'pch', hashlib.sha1( key.encode() ).hexdigest()[:16] )
+        hdr     = os.path.join( pchdir, 'nqbp_pch.h' )
+        pch     = hdr + self._pch_ext
+        obj     = os.path.join( pchdir, 'nqbp_pch.' + self._obj_ext )
+        src     = os.path.join( pchdir, 'nqbp_pch.cpp' ) if self._pch_stub else hdr
+        depfile = os.path.join( pchdir, 'nqbp_pch.h.' + self._depfile_ext )
+        self._pch_files = (hdr, pch, obj, src, depfile)
+        self._pch_args  = self._pch_use_option.format( hdr=hdr, pch=pch, obj=obj, src=src )
+
+    def _get_cache_flags( self, file_type ):
+        # Returns the flags (i.e. no include paths) that are part of the compile cache key
+        if ( file_type == 'asm' ):
+            return ' '.join( [self._asm, self._all_opts.asmflags] )
+        if ( file_type == 'cpp' ):
+            return ' '.join( [self._cc, self._all_opts.cflags, self._all_opts.cppflags] )
+        return ' '.join( [self._cc, self._all_opts.cflags, self._all_opts.c_only_flags] )
+
+    def _build_cc_templates( self ):
+        # Tokenizes the compile commands (once per build variant). A template is None when the command requires a shell
+        self._cc_templates = {}
+        for file_type in ( 'c', 'cpp', 'asm' ):
+            argv = utils.split_command( self._get_cc_command( file_type ) )
+            if ( argv == None ):
+                self._printer.debug( "# Compile command for '{}' files requires a shell".format( file_type ) )
+                self._cc_templates[file_type] = None
+            else:
+                indexes = [ i for i, a in enumerate( argv ) if 'ME_CC_BASE_FILENAME' in a ]
+                self._cc_templates[file_type] = (argv, indexes)
+
+    #--------------------------------------------------------------------------
+    def _get_tool_identity( self, tool ):
+        cmd = tool + ' ' + self._validate_cc_options
+        p   = subprocess.Popen( cmd, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+        r   = p.communicate()
+        return '{} {} {}'.format( tool, r[0].decode(errors='replace'), r[1].decode(errors='replace') )
+
+    def _preprocess( self, preprocess_cmd, cwd ):
+        # Returns the preprocessed file (as bytes) or None on error. Note: Preprocessing errors are reported by the 'real' compile
+        p = utils.popen( preprocess_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=cwd )
+        r = p.communicate()
+        return r[0] if p.returncode == 0 else None
+
+    def _get_cache_key( self, preprocessed, file_type, flags ):
+        tool = self._asm if file_type == 'asm' else self._cc
+        return self._cache.make_key( self._tool_identity.get( tool, tool ), file_type, depends.make_signature( flags ), preprocessed )
+
+    def _compile_remote( self, compiler, flags, file_type, preprocessed, objfile, output_filter ):
+        # Returns True if the file was successfully compiled by a remote worker (the output is passed through 'output_filter', i.e. the same as a local compile)
+        with timeline.span( 'remote', os.path.basename( objfile ), os.path.dirname( objfile ) ):
+            result = self._remote.compile( compiler, flags, file_type, preprocessed )
+        if ( result == None ):
+            return False
+
+        obj, output = result
+        with open( objfile, 'wb' ) as f:
+            f.write( obj )
+        for line in output.splitlines():
+            line = output_filter( line.rstrip() ).rstrip()
+            if ( line != '' ):
+                self._printer.stream( line )
+        pending = output_filter.flush()
+        if ( pending != '' ):
+            self._printer.stream( pending )
+        return True
+
+    #--------------------------------------------------------------------------
+    def _get_link_dir( self ):
+        # The build variant output directory, i.e. the directory the link is performed in
+        return os.path.join( self._obj_root, '_' + self._bld )
+
+    def _build_link_command( self, libdirs ):
+        # NOTE: The paths are relative to the build variant output directory (see _get_link_dir())
+        libs = self._build_library_list( libdirs )
+        startgroup = self._linker_libgroup_start if libs != '' else ''
+        endgroup   = self._linker_libgroup_end   if libs != '' else ''
+        ld = '{} {} {} {} {} {} {} {} {} {} {}'.format( 
+                                            self._ld,
+                                            self._link_output,
+                                            self._all_opts.firstobjs,
+                                            self._build_prjobjs_list(),
+                                            self._all_opts.linkflags,
+                                            self._all_opts.linkscript,
+                                            startgroup,
+                                            libs,
+                                            endgroup,
+                                            self._all_opts.linklibs,
+                                            self._all_opts.lastobjs
+                                            )
+        return ld
+
+    def _get_link_signature( self, ld ):
+        return depends.make_signature( ld )
+
+    def _get_link_inputs( self, ld ):
+        # Any token (or the value of a 'name=value' token) in the link command that is an existing file is a link input
+        inputs = set()
+        vardir = self._get_link_dir()
+        for t in ld.split():
+            for f in ( t, t.split('=')[-1], t[2:] if t.startswith('-T') else t ):
+                if ( f != '' and os.path.isfile( os.path.join( vardir, f ) ) ):
+                    inputs.add( f )
+        for f in self._link_extra_inputs:
+            inputs.add( f )
+        return sorted( inputs )
+
+    #--------------------------------------------------------------------------
+    def _get_ar_options( self ):
+        # Add the 'T' modifier (to the operation/modifiers field) for thin archives
+        if ( self._ar_thin ):
+            tokens = self._ar_options.split( ' ', 1 )
+            if ( not 'T' in tokens[0] ):
+                tokens[0] += 'T'
+            return ' '.join( tokens )
+        return self._ar_options
+
+    def _get_changed_ar_members( self, arguments, libname, objs, cwd ):
+        # Returns the objects that are newer than the archive. Returns None if the archive contains stale members
+        cmd = '{} t {}'.format( self._ar, self._ar_library_name )
+        if ( arguments['-v'] ):
+            self._printer.output( cmd )
+        p = utils.popen( cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd )
+        r = p.communicate()
+        if ( p.returncode != 0 ):
+            return None
+        members = [ os.path.basename(m.strip()) for m in r[0].decode().splitlines() if m.strip() != '' ]
+        for m in members:
+            if ( m not in objs ):
+                return None
+
+        libtime = os.stat( libname ).st_mtime_ns
+        objdir  = os.path.dirname( libname )
+        return [ o for o in objs if o not in members or os.stat( os.path.join(objdir, o) ).st_mtime_ns >= libtime ]
+
     #--------------------------------------------------------------------------
     def _build_prjobjs_list( self ):
-        list = utils.dir_list_filter_by_ext( '..' + os.sep, [self._obj_ext], derivedDir=True )
+        list = self.get_dir_objects( self._obj_root )
         path = ''
         for i in list:
             path += ' ..' + os.sep + i
+
+        # Include the object file created with the precompiled header (when required)
+        if ( self._pch_link_obj and self._pch_files != None ):
+            path += ' ' + self._pch_files[2]
         
         return path
         
@@ -541,6 +1095,12 @@ class ToolChain:
             if ( f == 'absolute' ):
                 path += "__abs" + os.sep
                 
+            # Link the object files directly
+            if ( self._link_objects ):
+                objpath = (path + dirname).replace(':','',1)
+                result += ' '.join( [ os.path.join( objpath, o ) for o in self.get_dir_objects( os.path.join( self._get_link_dir(), objpath ) ) ] ) + ' '
+                continue
+
             lname   = path + dirname + os.sep + self._ar_library_name    
             lname   = lname.replace(':','',1)
             result += self._link_lib_prefix + lname + ' '
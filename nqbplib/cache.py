@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+"""Content-addressed local compile cache
+
+The cache stores object files keyed on a hash of:
+    o The compiler identity (i.e. the compiler's path and version info)
+    o The fully expanded compiler flags for the file type (c, cpp, asm)
+    o The preprocessed source file
+
+The cache is stored in a local directory and is trimmed to a maximum size
+(least recently used entries are evicted first).
+
+ENVIRONMENT VARIABLES
+---------------------
+    NQBP_CACHE_DIR      Directory where the cache is stored. The default is
+                        <home>/.nqbp_cache
+    NQBP_CACHE_SIZE     Maximum size, in MB, of the cache. The default is 2048
+"""
+
+import os
+import hashlib
+import shutil
+import multiprocessing
+
+#
+from . import utils
+
+
+#-----------------------------------------------------------------------------
+def get_store_dir():
+    """ Returns the cache directory (as specified by the environment)"""
+    store = os.environ.get( 'NQBP_CACHE_DIR' )
+    if ( store == None ):
+        store = os.path.join( os.path.expanduser('~'), '.nqbp_cache' )
+    return store
+
+
+def get_max_size():
+    """ Returns the maximum cache size, in bytes (as specified by the environment)"""
+    size = os.environ.get( 'NQBP_CACHE_SIZE' )
+    if ( size == None ):
+        size = '2048'
+    try:
+        return int(size) * 1024 * 1024
+    except ValueError:
+        exit( "ERROR: Invalid NQBP_CACHE_SIZE value ({})".format( size ) )
+
+
+#=============================================================================
+class CompileCache:
+    """ Local compile cache.  Note: The hit/miss/eviction counters are shared
+        across processes
+    """
+
+    #-------------------------------------------------------------------------
+    def __init__( self, store_dir, max_size ):
+        self.store_dir = store_dir
+        self.max_size  = max_size
+        self._hits      = multiprocessing.Value( 'i', 0 )
+        self._misses    = multiprocessing.Value( 'i', 0 )
+        self._evictions = multiprocessing.Value( 'i', 0 )
+
+    #-------------------------------------------------------------------------
+    def make_key( self, identity, file_type, flags, preprocessed ):
+        """ Returns the cache key. 'preprocessed' is the preprocessed source as a bytes object"""
+        h = hashlib.sha256()
+        for s in ( identity, file_type, flags ):
+            h.update( s.encode() )
+            h.update( b'\0' )
+        h.update( preprocessed )
+        return h.hexdigest()
+
+    def restore( self, key, objfile, depfile=None ):
+        """ Copies the cached object file (and the dependency file when
+            'depfile' is not None) to 'objfile'. Returns True on a cache hit
+        """
+        src    = self._entry_name( key, objfile )
+        srcdep = self._entry_name( key, depfile ) if depfile != None else None
+        if ( not os.path.isfile( src ) or (srcdep != None and not os.path.isfile( srcdep )) ):
+            self._increment( self._misses )
+            return False
+
+        try:
+            shutil.copyfile( src, objfile )
+            if ( srcdep != None ):
+                shutil.copyfile( srcdep, depfile )
+
+            # Update the time stamps for the LRU eviction
+            os.utime( src )
+            if ( srcdep != None ):
+                os.utime( srcdep )
+        except OSError:
+            utils.delete_file( objfile )
+            self._increment( self._misses )
+            return False
+
+        self._increment( self._hits )
+        return True
+
+    def store( self, key, objfile, depfile=None ):
+        """ Adds the object file (and optional dependency file) to the cache"""
+        try:
+            os.makedirs( os.path.dirname( self._entry_name( key, objfile ) ), exist_ok=True )
+            if ( depfile != None and os.path.isfile( depfile ) ):
+                self._copy_into( depfile, self._entry_name( key, depfile ) )
+            self._copy_into( objfile, self._entry_name( key, objfile ) )
+        except OSError:
+            # Failing to update the cache is NOT a build failure
+            pass
+
+    def trim( self ):
+        """ Evicts the least recently used entries until the cache is below
+            its maximum size.  Returns the number of files evicted
+        """
+        entries = []
+        total   = 0
+        for root, dirs, files in os.walk( self.store_dir ):
+            for f in files:
+                fname = os.path.join( root, f )
+                try:
+                    st = os.stat( fname )
+                except OSError:
+                    continue
+                entries.append( (st.st_mtime, st.st_size, fname) )
+                total += st.st_size
+
+        count = 0
+        if ( total > self.max_size ):
+            entries.sort()
+            for mtime, size, fname in entries:
+                if ( total <= self.max_size ):
+                    break
+                if ( utils.delete_file( fname ) ):
+                    total -= size
+                    count += 1
+
+        self._increment( self._evictions, count )
+        return count
+
+    def get_stats( self ):
+        """ Returns the tuple: (hits, misses, evictions)"""
+        return (self._hits.value, self._misses.value, self._evictions.value)
+
+    #-------------------------------------------------------------------------
+    def _entry_name( self, key, fname ):
+        ext = os.path.splitext( fname )[1]
+        return os.path.join( self.store_dir, key[:2], key + ext )
+
+    def _copy_into( self, src, dst ):
+        # Copy to a temporary file first so that a partial file is never visible in the cache
+        tmp = '{}.{}.tmp'.format( dst, os.getpid() )
+        shutil.copyfile( src, tmp )
+        os.replace( tmp, dst )
+
+    def _increment( self, counter, delta=1 ):
+        with counter.get_lock():
+            counter.value += delta
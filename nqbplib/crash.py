@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+"""Compiler crash detection and the parallelism that a toolchain is stable at
+
+Some compilers crash (instead of reporting an error) when too many of them
+run at the same time.  A compile 'crashed' when the compiler was terminated
+by a signal (or an abnormal Windows status code), or when its output
+contains one of the well known internal compiler error messages.  A genuine
+compile error is NOT a crash.
+
+A compile that crashed in a parallel build is retried with fewer concurrent
+jobs (half of the slots, then serially).  The level at which the retry
+succeeded is remembered per toolchain in the project's state directory and
+is used as the upper bound of the number of jobs of the following builds.
+After PROBE_BUILDS builds without a crash the bound is doubled, i.e. NQBP
+probes its way back to the full parallelism.
+"""
+
+import os
+import re
+import json
+import time
+
+#
+from . import utils
+
+
+# Number of crash free builds before the number of jobs is increased
+PROBE_BUILDS = 5
+
+# Compiler output that indicates a crash (i.e. not a compile error)
+_CRASH_REGEX = re.compile( r'internal compiler error|Segmentation fault|Bus error|Illegal instruction|Killed signal terminated program|'
+                           r'PLEASE submit a bug report|clang frontend command failed|virtual memory exhausted|out of memory allocating|'
+                           r'fatal error C1001|fatal error C1060|INTERNAL COMPILER ERROR', re.IGNORECASE )
+
+# Exit codes of a shell whose command was terminated by SIGILL, SIGABRT, SIGBUS, SIGKILL or SIGSEGV
+_SHELL_SIGNAL_CODES = ( 132, 134, 135, 137, 139 )
+
+# The result of a compile job that crashed (see mk.py)
+CRASHED = 'crashed'
+
+
+#=============================================================================
+class CompilerCrash( SystemExit ):
+    """ Raised (instead of sys.exit(1)) when the compiler crashed, i.e. code
+        that does not know about crashes sees a normal failure
+    """
+    def __init__( self ):
+        super().__init__( 1 )
+
+
+class CrashDetector:
+    """ Output filter (see utils.run_shell()) that checks the compiler output
+        for crash messages.  'inner' is an optional output filter that is
+        applied first
+    """
+    def __init__( self, inner=None ):
+        self.found  = False
+        self._inner = inner
+
+    def __call__( self, line ):
+        if ( self._inner != None ):
+            line = self._inner( line )
+        if ( not self.found and _CRASH_REGEX.search( line ) ):
+            self.found = True
+        return line
+
+
+#-----------------------------------------------------------------------------
+def is_crash( returncode, detector ):
+    """ Returns True if a failed compile crashed"""
+    if ( returncode < 0 or returncode >= 0xC0000000 or returncode in _SHELL_SIGNAL_CODES ):
+        return True
+    return detector.found
+
+
+def get_retry_levels( num_jobs ):
+    """ Returns the (decreasing) number of concurrent jobs of the retries of
+        a compile that crashed.  An empty list means no retries
+    """
+    return [ n for n in dict.fromkeys( [ max( 1, num_jobs // 2 ), 1 ] ) if n < num_jobs ]
+
+
+#=============================================================================
+class Stability:
+    """ The number of concurrent jobs that the toolchain is stable at"""
+
+    #-------------------------------------------------------------------------
+    def __init__( self, toolchain ):
+        cc         = toolchain._cc.split()
+        self.name  = '{} {}'.format( toolchain.get_ccname(), os.path.basename( cc[0] ) if len(cc) > 0 else '' )
+        self.fname = utils.get_state_file( 'stability', self.name )
+        self._data = {}
+        try:
+            with open( self.fname, 'r' ) as f:
+                self._data = json.load( f )
+        except (OSError, ValueError):
+            pass
+        self._crashed = False
+
+    def get_max_jobs( self ):
+        """ Returns the maximum number of concurrent jobs (None: no limit)"""
+        return self._data.get( 'jobs' )
+
+    def crashed( self, stable_jobs ):
+        """ Records that a compile crashed and that its retry succeeded with
+            at most 'stable_jobs' concurrent jobs
+        """
+        self._crashed = True
+        current       = self.get_max_jobs()
+        if ( current == None or stable_jobs < current ):
+            self._data = { 'jobs': stable_jobs, 'builds': 0, 'last_crash': time.time() }
+
+    def build_completed( self, num_jobs ):
+        """ Updates (and saves) the state at the end of a successful build
+            that ran with at most 'num_jobs' concurrent jobs
+        """
+        if ( not self._crashed and self.get_max_jobs() != None ):
+            self._data['builds'] = self._data.get( 'builds', 0 ) + 1
+            if ( self._data['builds'] >= PROBE_BUILDS ):
+                self._data['jobs']   = self._data['jobs'] * 2
+                self._data['builds'] = 0
+
+            # Probed all the way back
+            if ( self._data['jobs'] > num_jobs ):
+                self._data = {}
+        self._crashed = False
+        self.save()
+
+    def save( self ):
+        if ( len(self._data) == 0 ):
+            utils.delete_file( self.fname )
+            return
+        os.makedirs( os.path.dirname( self.fname ), exist_ok=True )
+        with open( self.fname, 'w' ) as f:
+            json.dump( self._data, f, indent=1 )
@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+"""Build daemon
+
+An optional, long-lived, per-project process that keeps the NQBP modules,
+the project's mytoolchain.py module, and the results of the start-up steps
+(compiler validation, source directory listings, the expanded libdirs.b
+list) in memory.  When the daemon is running, the project's nqbp.py script
+forwards its command line (and environment) to the daemon and streams the
+build output back, i.e. the fixed start-up cost of a build is only paid
+once.  This is most noticeable for edit-compile loops on a single file (-f)
+or directory (-d).
+
+    nqbp.py --daemon         Starts the daemon (runs in the foreground)
+    nqbp.py --daemon-stop    Stops the daemon
+
+The daemon only accepts connections from the local host.  Its port and a
+random token (that a client must present) are stored in the project's state
+directory (.nqbp/daemon.json).  The daemon executes one build at a time.
+
+Cached state is invalidated using file time stamps:
+    o The mytoolchain.py module is re-imported when the file changes.  The
+      toolchain is re-created (by calling mytoolchain.create()) for every
+      build.
+    o The daemon exits when any of the NQBP python files change.  The
+      request that detected the change is built by the client.
+    o Source directory listings are re-read when the directory (or its
+      sources.b file) changes.
+    o The expanded libdirs.b list uses the persistent libdirs cache.
+
+A build is executed by the client (i.e. without the daemon) when no daemon
+is running, when the daemon was started with a different NQBP_BIN, or when
+the environment variable NQBP_NO_DAEMON is set.
+"""
+
+import os
+import sys
+import json
+import socket
+import secrets
+import importlib
+import threading
+import socketserver
+
+# Globals
+from .my_globals import NQBP_STATE_DIRNAME
+
+
+# Maximum size of a request
+_MAX_REQUEST = 16 * 1024 * 1024
+
+
+#-----------------------------------------------------------------------------
+def get_info_file( prjdir ):
+    return os.path.join( prjdir, NQBP_STATE_DIRNAME(), 'daemon.json' )
+
+
+def is_daemon_request( argv ):
+    """ Returns True if 'argv' requests to start the daemon"""
+    return len(argv) > 1 and argv[1] == '--daemon'
+
+
+def client( argv, prjdir ):
+    """ Executes the client side of a nqbp.py invocation, i.e. stops the
+        daemon (--daemon-stop) or forwards the build request to the daemon.
+        Exits when the request was handled.  Returns when the build must be
+        executed locally (or when the daemon is being started)
+    """
+    if ( len(argv) > 1 and argv[1] == '--daemon-stop' ):
+        if ( not stop( prjdir ) ):
+            sys.exit( "No NQBP daemon is running" )
+        sys.exit()
+
+    if ( not is_daemon_request( argv ) ):
+        rc = forward( prjdir, argv )
+        if ( rc != None ):
+            sys.exit( rc )
+
+
+def forward( prjdir, argv ):
+    """ Forwards the build request 'argv' to the project's daemon and writes
+        the build output to stdout.  Returns the build's exit code, or None
+        when the build must be executed locally (e.g. no daemon is running)
+    """
+    if ( os.environ.get( 'NQBP_NO_DAEMON' ) != None ):
+        return None
+    info = _read_info( prjdir )
+    if ( info == None ):
+        return None
+
+    request = { 'token':info['token'], 'argv':argv, 'env':dict(os.environ), 'bin':os.environ.get( 'NQBP_BIN' ) }
+    try:
+        with socket.create_connection( ('127.0.0.1', info['port']) ) as sock:
+            sock.sendall( json.dumps( request ).encode() + b'\n' )
+            for reply in _read_replies( sock ):
+                if ( 'out' in reply ):
+                    sys.stdout.write( reply['out'] )
+                    sys.stdout.flush()
+                elif ( 'exit' in reply ):
+                    return reply['exit']
+                else:
+                    return None
+
+    # The daemon is NOT running (or died) -->remove its stale info file
+    except ConnectionRefusedError:
+        _remove_info( prjdir, info )
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def stop( prjdir ):
+    """ Stops the project's daemon.  Returns False if no daemon is running"""
+    info = _read_info( prjdir )
+    if ( info == None ):
+        return False
+    try:
+        with socket.create_connection( ('127.0.0.1', info['port']) ) as sock:
+            sock.sendall( json.dumps( { 'token':info['token'], 'stop':True } ).encode() + b'\n' )
+            for reply in _read_replies( sock ):
+                pass
+        return True
+    except (OSError, ValueError):
+        _remove_info( prjdir, info )
+        return False
+
+
+#-----------------------------------------------------------------------------
+def run( prjdir, toolchain_module, build ):
+    """ Runs the daemon until it is stopped (or an NQBP file changes).
+        'toolchain_module' is the project's (imported) mytoolchain module and
+        'build' is the build entry point, i.e. mk.build( argv, toolchain )
+    """
+    server = _Server( ('127.0.0.1', 0), _Handler )
+    server.prjdir    = prjdir
+    server.token     = secrets.token_hex( 16 )
+    server.module    = toolchain_module
+    server.build     = build
+    server.bin       = os.environ.get( 'NQBP_BIN' )
+    server.mystamp   = _get_module_stamp( toolchain_module )
+    server.nqbpstamp = _get_nqbp_stamp()
+
+    info = { 'port':server.server_address[1], 'token':server.token, 'pid':os.getpid() }
+    _write_info( prjdir, info )
+    print( "NQBP daemon listening on 127.0.0.1:{} (project: {})".format( info['port'], prjdir ) )
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        _remove_info( prjdir, info )
+
+
+class _Server( socketserver.TCPServer ):
+    allow_reuse_address = True
+
+
+class _Handler( socketserver.StreamRequestHandler ):
+    def handle( self ):
+        try:
+            request = json.loads( self.rfile.readline( _MAX_REQUEST ).decode() )
+        except (OSError, ValueError):
+            return
+        if ( not isinstance( request, dict ) or not secrets.compare_digest( str(request.get( 'token' )), self.server.token ) ):
+            return
+
+        # Stop request
+        server = self.server
+        if ( request.get( 'stop' ) ):
+            self._reply( { 'exit':0 } )
+            _shutdown( server )
+            return
+
+        # Build locally when the daemon's NQBP files are stale (and exit)
+        if ( _get_nqbp_stamp() != server.nqbpstamp ):
+            self._reply( { 'retry':'NQBP files changed' } )
+            _shutdown( server )
+            return
+        if ( request.get( 'bin' ) != server.bin ):
+            self._reply( { 'retry':'different NQBP_BIN' } )
+            return
+
+        # Re-import mytoolchain.py when it has changed
+        stamp = _get_module_stamp( server.module )
+        if ( stamp != server.mystamp ):
+            try:
+                server.module = importlib.reload( server.module )
+            except Exception:
+                self._reply( { 'retry':'cannot re-import the toolchain module' } )
+                return
+            server.mystamp = stamp
+
+        self._reply( { 'exit':self._build( request ) } )
+
+    #-------------------------------------------------------------------------
+    def _build( self, request ):
+        # Execute the build with the client's environment and stdout/stderr
+        stream  = _ClientStream( self.wfile )
+        environ = dict( os.environ )
+        cwd     = os.getcwd()
+        stdout  = sys.stdout
+        stderr  = sys.stderr
+        os.environ.clear()
+        os.environ.update( request.get( 'env', {} ) )
+        sys.stdout = sys.stderr = stream
+        try:
+            self.server.build( request.get( 'argv', [] ), self.server.module.create() )
+            return 0
+        except SystemExit as e:
+            if ( e.code == None or isinstance( e.code, int ) ):
+                return e.code if e.code != None else 0
+            print( e.code )
+            return 1
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            return 1
+        finally:
+            from . import output
+            output.close_all()
+            sys.stdout = stdout
+            sys.stderr = stderr
+            os.environ.clear()
+            os.environ.update( environ )
+            os.chdir( cwd )
+
+    def _reply( self, reply ):
+        try:
+            self.wfile.write( json.dumps( reply ).encode() + b'\n' )
+            self.wfile.flush()
+        except OSError:
+            pass
+
+
+class _ClientStream:
+    """ File like object that sends everything written to it to the client"""
+    def __init__( self, wfile ):
+        self._wfile = wfile
+        self._lock  = threading.Lock()
+        self._open  = True
+
+    def write( self, text ):
+        with self._lock:
+            # Keep building when the client goes away (e.g. Ctrl-C)
+            if ( self._open ):
+                try:
+                    self._wfile.write( json.dumps( { 'out':text } ).encode() + b'\n' )
+                except OSError:
+                    self._open = False
+        return len(text)
+
+    def flush( self ):
+        with self._lock:
+            if ( self._open ):
+                try:
+                    self._wfile.flush()
+                except OSError:
+                    self._open = False
+
+    def isatty( self ):
+        return False
+
+
+#-----------------------------------------------------------------------------
+def _shutdown( server ):
+    # Must be called from a thread other than the one running serve_forever()
+    threading.Thread( target=server.shutdown, daemon=True ).start()
+
+
+def _read_replies( sock ):
+    with sock.makefile( 'rb' ) as f:
+        for line in f:
+            yield json.loads( line.decode() )
+
+
+def _read_info( prjdir ):
+    try:
+        with open( get_info_file( prjdir ), 'r' ) as f:
+            info = json.load( f )
+        if ( isinstance( info, dict ) and isinstance( info.get( 'port' ), int ) and isinstance( info.get( 'token' ), str ) ):
+            return info
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _write_info( prjdir, info ):
+    # The info file contains the token -->only readable by the current user
+    fname = get_info_file( prjdir )
+    os.makedirs( os.path.dirname( fname ), exist_ok=True )
+    tmp = '{}.{}.tmp'.format( fname, os.getpid() )
+    fd  = os.open( tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 )
+    with os.fdopen( fd, 'w' ) as f:
+        json.dump( info, f )
+    os.replace( tmp, fname )
+
+
+def _remove_info( prjdir, info ):
+    # Only remove the file when it belongs to the specified daemon
+    current = _read_info( prjdir )
+    if ( current != None and current.get( 'token' ) == info.get( 'token' ) ):
+        try:
+            os.remove( get_info_file( prjdir ) )
+        except OSError:
+            pass
+
+
+def _get_module_stamp( module ):
+    try:
+        st = os.stat( module.__file__ )
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _get_nqbp_stamp():
+    # Time stamps of all of the NQBP python files
+    stamp = []
+    root  = os.path.dirname( os.path.abspath( __file__ ) )
+    for dirpath, dirnames, filenames in os.walk( root ):
+        dirnames[:] = [ d for d in dirnames if d != '__pycache__' ]
+        for f in filenames:
+            if ( f.endswith( '.py' ) ):
+                try:
+                    st = os.stat( os.path.join( dirpath, f ) )
+                    stamp.append( (os.path.join( dirpath, f ), st.st_mtime_ns, st.st_size) )
+                except OSError:
+                    pass
+    return sorted( stamp )
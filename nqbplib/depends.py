@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+"""Helper functions for the 'what-has-changed' checking of incremental builds
+
+A translation unit is considered up-to-date when ALL of the following are
+true:
+    o The object file exists
+    o The object file is newer than the source file
+    o The object file is newer than every header file listed in the
+      compiler generated dependency file (i.e. gcc -MMD, or a dependency
+      file synthesized from MSVC's /showIncludes output)
+    o The command line used to build the object file is the same as the
+      current command line (stored in a 'command signature' file)
+"""
+
+import os
+import re
+import json
+
+
+# Prefix of the lines generated by MSVC's /showIncludes option
+SHOW_INCLUDES_PREFIX = 'Note: including file:'
+
+# The build time stamp changes on every build -->it is NOT included in the signature
+_BUILD_TIME_REGEX = re.compile( r'BUILD_TIME_UTC=\d+' )
+
+
+#-----------------------------------------------------------------------------
+def make_signature( cmd ):
+    """ Returns the 'command signature' for the specified command line.  Note:
+        the BUILD_TIME_UTC symbol is excluded from the signature
+    """
+    return ' '.join( _BUILD_TIME_REGEX.sub( 'BUILD_TIME_UTC', cmd ).split() )
+
+
+def read_signature( fname ):
+    """ Returns the content of signature file. Returns None if the file does not exist"""
+    try:
+        with open( fname, 'r' ) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_signature( fname, signature ):
+    with open( fname, 'w' ) as f:
+        f.write( signature )
+
+
+#-----------------------------------------------------------------------------
+def parse_depfile( fname ):
+    """ Returns the list of prerequisites (i.e. source file and header files)
+        contained in a make-style dependency file. Returns None if the file
+        does not exist
+    """
+    try:
+        with open( fname, 'r' ) as f:
+            content = f.read()
+    except OSError:
+        return None
+
+    # Join continuation lines and remove the target (Note: 'C:\' is NOT a target separator)
+    content = content.replace( '\\\r\n', ' ' ).replace( '\\\n', ' ' )
+    deps    = []
+    for line in content.splitlines():
+        match = re.search( r':(\s|$)', line )
+        if ( match == None ):
+            continue
+        deps.extend( _split_make_words( line[match.end():] ) )
+
+    return deps
+
+
+def write_depfile( fname, target, deps ):
+    """ Creates a make-style dependency file"""
+    with open( fname, 'w' ) as f:
+        f.write( _escape_make_word(target) + ':' )
+        for d in deps:
+            f.write( ' \\\n  ' + _escape_make_word(d) )
+        f.write( '\n' )
+
+
+def filter_show_includes( text, includes ):
+    """ Removes the MSVC /showIncludes lines from 'text' and appends the
+        included file names to the 'includes' list.  Returns the filtered text
+    """
+    lines = []
+    for line in text.splitlines():
+        if ( line.startswith( SHOW_INCLUDES_PREFIX ) ):
+            includes.append( line[len(SHOW_INCLUDES_PREFIX):].strip() )
+        else:
+            lines.append( line )
+
+    return os.linesep.join( lines )
+
+
+#-----------------------------------------------------------------------------
+def is_up_to_date( objfile, srcfile, depfile, sigfile, signature, cwd='.' ):
+    """ Returns a tuple (current, reason) where 'current' is True if 'objfile'
+        does NOT need to be rebuilt.  When 'depfile' is None, no header file
+        checking is performed.  'reason' is a short human readable explanation
+        of why the object file is out-of-date.  Relative file names in the
+        dependency file are relative to the 'cwd' directory
+    """
+    objtime = _get_mtime( objfile )
+    if ( objtime == None ):
+        return (False, 'no object file')
+
+    if ( read_signature( sigfile ) != signature ):
+        return (False, 'command line changed')
+
+    srctime = _get_mtime( srcfile )
+    if ( srctime == None or srctime > objtime ):
+        return (False, 'source file changed')
+
+    if ( depfile != None ):
+        deps = parse_depfile( depfile )
+        if ( deps == None ):
+            return (False, 'no dependency file')
+        for d in deps:
+            t = _get_mtime( os.path.join( cwd, d ) )
+            if ( t == None or t > objtime ):
+                return (False, 'header file changed: ' + d )
+
+    return (True, 'up-to-date')
+
+
+#-----------------------------------------------------------------------------
+def get_file_stamps( files, cwd='.' ):
+    """ Returns a dictionary of file name -> [mtime, size]. Non-existent files
+        have a stamp of None.  Relative file names are relative to the 'cwd'
+        directory
+    """
+    stamps = {}
+    for f in files:
+        try:
+            st = os.stat( os.path.join( cwd, f ) )
+            stamps[f] = [st.st_mtime_ns, st.st_size]
+        except OSError:
+            stamps[f] = None
+    return stamps
+
+
+def write_manifest( fname, signature, inputs, outputs, cwd='.' ):
+    """ Creates a manifest file that captures the command signature and the
+        time stamps of the input and output files (relative to 'cwd')
+    """
+    manifest = { 'signature':signature, 'inputs':get_file_stamps( inputs, cwd ), 'outputs':get_file_stamps( outputs, cwd ) }
+    with open( fname, 'w' ) as f:
+        json.dump( manifest, f, indent=1 )
+
+
+def is_manifest_current( fname, signature, inputs, cwd='.' ):
+    """ Returns True if the signature and input files are the same as the
+        ones recorded in the manifest file AND none of the output files 
+        recorded in the manifest have changed.  Relative file names are 
+        relative to the 'cwd' directory
+    """
+    try:
+        with open( fname, 'r' ) as f:
+            manifest = json.load( f )
+    except (OSError, ValueError):
+        return False
+
+    if ( manifest.get( 'signature' ) != signature ):
+        return False
+    if ( manifest.get( 'inputs' ) != get_file_stamps( inputs, cwd ) ):
+        return False
+    outputs = manifest.get( 'outputs', {} )
+    return outputs == get_file_stamps( outputs.keys(), cwd )
+
+
+#-----------------------------------------------------------------------------
+def _get_mtime( fname ):
+    try:
+        return os.stat( fname ).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _split_make_words( text ):
+    words = []
+    word  = ''
+    idx   = 0
+    while( idx < len(text) ):
+        c = text[idx]
+        if ( c == '\\' and idx+1 < len(text) and text[idx+1] == ' ' ):
+            word += ' '
+            idx  += 1
+        elif ( c == '$' and idx+1 < len(text) and text[idx+1] == '$' ):
+            word += '$'
+            idx  += 1
+        elif ( c.isspace() ):
+            if ( word != '' ):
+                words.append( word )
+            word = ''
+        else:
+            word += c
+        idx += 1
+
+    if ( word != '' ):
+        words.append( word )
+    return words
+
+
+def _escape_make_word( word ):
+    return word.replace( '$', '$$' ).replace( ' ', '\\ ' )
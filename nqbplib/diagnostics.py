@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+"""Compiler diagnostics (errors and warnings)
+
+The output of each compile is parsed, line by line as it is streamed, into
+diagnostic records: (file, line, column, severity, flag, message).  The
+GCC/Clang ('file:line:col: warning: message [-Wflag]') and MSVC
+('file(line,col): warning C4100: message') formats are supported.
+
+The records are de-duplicated across all of the translation units (TUs) of
+the build, i.e. a warning in a header file is reported once no matter how
+many TUs include the header.  On the console (and in make.log) a repeated
+warning is suppressed along with its context lines (e.g. 'In file included
+from', source snippet, notes).  Errors are never suppressed.
+
+The records of a compile are buffered and only reported to the build (see
+OutputFilter.commit()) when the compile's output is kept, i.e. the records
+of a discarded attempt (e.g. a unity batch that fell back to compiling its
+files individually) are never reported.  A warning is repeated when it was
+reported by a previous compile, i.e. compiles that run at the same time can
+both output the same warning.
+
+At the end of the build the records can be written to a JSON or SARIF
+report (see the --diagnostics option).  For incremental builds the records
+of each TU are saved next to its object file, i.e. the diagnostics of
+up-to-date files are still included in the report.
+"""
+
+import os
+import re
+import json
+import pathlib
+import threading
+
+
+_GCC_REGEX     = re.compile( r'^(?P<file>.+?):(?P<line>\d+):(?:(?P<col>\d+):)?\s*(?P<sev>fatal error|error|warning|note):\s*(?P<msg>.*)$' )
+_MSVC_REGEX    = re.compile( r'^(?P<file>.+?)\((?P<line>\d+)(?:,(?P<col>\d+))?\)\s*:\s*(?P<sev>fatal error|error|warning|note)\s*(?P<flag>[A-Z]+\d+)?\s*:\s*(?P<msg>.*)$' )
+_GCC_FLAG      = re.compile( r'\s+\[(-W[^\]]+)\]$' )
+_CONTEXT_REGEX = re.compile( r'^(In file included from |\s+from |.*: In |.*: At |.*:\d+:(\d+:)?\s+(required|in) )' )
+
+
+#-----------------------------------------------------------------------------
+def parse_line( line, cwd=None ):
+    """ Returns the diagnostic record (a dictionary) of 'line' or None when
+        the line is not a diagnostic.  Relative file names are relative to
+        'cwd'
+    """
+    m = _MSVC_REGEX.match( line ) or _GCC_REGEX.match( line )
+    if ( m == None ):
+        return None
+
+    msg  = m.group( 'msg' ).strip()
+    flag = m.groupdict().get( 'flag' )
+    if ( flag == None ):
+        f = _GCC_FLAG.search( msg )
+        if ( f != None ):
+            msg  = msg[:f.start()]
+            flag = f.group( 1 ).replace( '-Werror=', '-W' )
+
+    fname = m.group( 'file' ).strip()
+    if ( not os.path.isabs( fname ) and cwd != None ):
+        fname = os.path.join( cwd, fname )
+    return { 'file':     os.path.normpath( fname ),
+             'line':     int( m.group( 'line' ) ),
+             'column':   int( m.group( 'col' ) ) if m.group( 'col' ) != None else 0,
+             'severity': 'error' if m.group( 'sev' ) == 'fatal error' else m.group( 'sev' ),
+             'flag':     flag,
+             'message':  msg }
+
+def load_records( fname ):
+    """ Returns the records saved by save_records() (an empty list on error)"""
+    try:
+        with open( fname, 'r' ) as f:
+            return json.load( f )
+    except (OSError, ValueError):
+        return []
+
+def save_records( fname, records ):
+    """ Saves the records of a TU.  The file is deleted when there are no records"""
+    try:
+        if ( len(records) == 0 ):
+            os.remove( fname )
+        else:
+            with open( fname, 'w' ) as f:
+                json.dump( records, f )
+    except OSError:
+        pass
+
+
+#=============================================================================
+class Collector:
+    """ De-duplicated diagnostics of the entire build (thread safe)"""
+
+    #-------------------------------------------------------------------------
+    def __init__( self ):
+        self._lock       = threading.Lock()
+        self._records    = {}       # key: (file, line, column, severity, flag, message), value: record
+        self._suppressed = 0
+
+    def clear( self ):
+        with self._lock:
+            self._records    = {}
+            self._suppressed = 0
+
+    def add( self, record, tu ):
+        """ Adds the diagnostic 'record' reported when compiling 'tu'.  Returns
+            True if the diagnostic has NOT been reported before
+        """
+        key = _get_key( record )
+        with self._lock:
+            entry = self._records.get( key )
+            if ( entry == None ):
+                self._records[key] = dict( record, tus=[tu] )
+                return True
+            if ( tu not in entry['tus'] ):
+                entry['tus'].append( tu )
+            return False
+
+    def is_reported( self, record ):
+        """ Returns True if the diagnostic 'record' has been reported before"""
+        with self._lock:
+            return _get_key( record ) in self._records
+
+    def suppressed( self, count=1 ):
+        """ Counts suppressed (console) diagnostics"""
+        with self._lock:
+            self._suppressed += count
+
+    def get_counts( self ):
+        """ Returns (unique errors, unique warnings, suppressed duplicates)"""
+        with self._lock:
+            errors   = sum( 1 for r in self._records.values() if r['severity'] == 'error' )
+            warnings = sum( 1 for r in self._records.values() if r['severity'] == 'warning' )
+            return (errors, warnings, self._suppressed)
+
+    def get_records( self ):
+        """ Returns the records sorted by file, line and column"""
+        with self._lock:
+            return sorted( self._records.values(), key=lambda r: (r['file'], r['line'], r['column'], r['message']) )
+
+    #-------------------------------------------------------------------------
+    def write( self, fname, toolname ):
+        """ Writes the report.  The SARIF format is used when 'fname' ends
+            with '.sarif', else JSON
+        """
+        records = self.get_records()
+        if ( fname.endswith( '.sarif' ) ):
+            data = _make_sarif( records, toolname )
+        else:
+            errors, warnings, suppressed = self.get_counts()
+            data = { 'tool': toolname, 'errors': errors, 'warnings': warnings, 'diagnostics': records }
+
+        dir = os.path.dirname( fname )
+        if ( dir != '' ):
+            os.makedirs( dir, exist_ok=True )
+        with open( fname, 'w' ) as f:
+            json.dump( data, f, indent=1 )
+
+
+#=============================================================================
+class OutputFilter:
+    """ Output filter (see utils.run_shell()) for a single compile.  Records
+        the compiler's diagnostics and removes repeated warnings (and their
+        context lines) from the output.  'inner' is an optional output filter
+        that is applied first.  The records of the compile are stored in the
+        'records' member and are added to the collector by commit()
+    """
+
+    #-------------------------------------------------------------------------
+    def __init__( self, collector, tu, cwd, inner=None ):
+        self.records     = []
+        self._collector  = collector
+        self._tu         = tu
+        self._cwd        = cwd
+        self._inner      = inner
+        self._pending    = []       # Context lines of the next diagnostic
+        self._dropping   = False
+        self._seen       = set()    # Keys of the records of the compile
+        self._suppressed = 0
+
+    def __call__( self, line ):
+        if ( self._inner != None ):
+            line = self._inner( line )
+            if ( line.strip() == '' ):
+                return ''
+
+        record = parse_line( line, self._cwd )
+        if ( record != None and record['severity'] != 'note' ):
+            key            = _get_key( record )
+            new            = key not in self._seen and not self._collector.is_reported( record )
+            self._dropping = not new and record['severity'] == 'warning'
+            self.records.append( record )
+            self._seen.add( key )
+            if ( self._dropping ):
+                self._suppressed += 1
+                self._pending = []
+                return ''
+            return self._release( line )
+
+        if ( record == None and _CONTEXT_REGEX.match( line ) ):
+            self._pending.append( line )
+            return ''
+
+        # Notes and source snippets belong to the previous diagnostic
+        if ( record != None or line[:1].isspace() ):
+            return '' if self._dropping else self._release( line )
+
+        self._dropping = False
+        return self._release( line )
+
+    def flush( self ):
+        """ Returns the context lines that were not followed by a diagnostic"""
+        return self._release( '' ).rstrip()
+
+    def commit( self ):
+        """ Reports the records (and the suppressed count) of the compile to
+            the collector.  Call once the compile's output is known to be kept
+        """
+        for r in self.records:
+            self._collector.add( r, self._tu )
+        self._collector.suppressed( self._suppressed )
+
+    #-------------------------------------------------------------------------
+    def _release( self, line ):
+        lines         = self._pending + [line]
+        self._pending = []
+        return '\n'.join( lines )
+
+
+#-----------------------------------------------------------------------------
+def _get_key( record ):
+    return (record['file'], record['line'], record['column'], record['severity'], record['flag'], record['message'])
+
+def _make_sarif( records, toolname ):
+    rules   = sorted( set( r['flag'] for r in records if r['flag'] != None ) )
+    results = []
+    for r in records:
+        result = { 'level':     r['severity'],
+                   'message':   { 'text': r['message'] },
+                   'locations': [ { 'physicalLocation': { 'artifactLocation': { 'uri': _get_uri( r['file'] ) },
+                                                          'region': { 'startLine': r['line'] } } } ] }
+        if ( r['column'] > 0 ):
+            result['locations'][0]['physicalLocation']['region']['startColumn'] = r['column']
+        if ( r['flag'] != None ):
+            result['ruleId'] = r['flag']
+        if ( len(r['tus']) > 1 ):
+            result['occurrenceCount'] = len(r['tus'])
+        results.append( result )
+
+    return { 'version': '2.1.0',
+             '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+             'runs':    [ { 'tool':    { 'driver': { 'name': toolname, 'rules': [ { 'id': f } for f in rules ] } },
+                            'results': results } ] }
+
+def _get_uri( fname ):
+    if ( os.path.isabs( fname ) ):
+        return pathlib.Path( fname ).as_uri()
+    return fname.replace( os.sep, '/' )
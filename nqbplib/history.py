@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+"""Compile time history
+
+The wall time (and the peak memory usage) of every compile and archive step
+is recorded (keyed by build variant, libdirs.b entry, and file) in a SQLite
+database in the project's state directory.  The history is used to report
+the slowest translation units/directories, to detect compile time
+regressions, and to estimate the cost of the build's jobs (i.e. the longest
+work is started first, and compiles are only started when their memory is
+expected to be available, see throttle.py).
+
+Notes:
+    o Samples are collected in memory during the build and written to the
+      database by the main thread at the end of the build, i.e. there is
+      no database access from the worker threads.
+    o Files that were NOT compiled (e.g. up-to-date files or files restored
+      from the compile cache) are not recorded.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+# Globals
+from .my_globals import NQBP_PRJ_DIR
+from .my_globals import NQBP_STATE_DIRNAME
+
+
+# A regression is a most recent time that is at least REGRESSION_RATIO times
+# the historical median AND at least REGRESSION_MIN_DELTA seconds longer
+REGRESSION_RATIO     = 1.25
+REGRESSION_MIN_DELTA = 0.1
+
+# Minimum number of previous samples required to detect a regression
+REGRESSION_MIN_HISTORY = 3
+
+# Maximum number of previous samples used to compute the historical median
+REGRESSION_MAX_HISTORY = 10
+
+# Estimated compile time (in seconds) per byte of source for files without history
+SECONDS_PER_BYTE = 1.0 / (32 * 1024)
+
+# Estimated peak memory (in bytes) of a compile when there is no history
+DEFAULT_MEMORY = 256 * 1024 * 1024
+
+# Samples of the current build(s): (variant, kind, dir, file, seconds, rss)
+_samples = []
+_lock    = threading.Lock()
+
+
+#-----------------------------------------------------------------------------
+def get_db_name():
+    return os.path.join( NQBP_PRJ_DIR(), NQBP_STATE_DIRNAME(), 'history.sqlite' )
+
+
+def get_variant_name( variant, debug ):
+    """ Returns the name that the samples of a build are recorded under"""
+    # Debug builds are recorded separately from release builds
+    return variant + ' (debug)' if debug else variant
+
+
+def add_sample( variant, kind, dir, fname, seconds, rss=None ):
+    """ Records the wall time (and the peak resident memory in bytes, None
+        if unknown) of a 'compile' or 'archive' step.  'variant' is the name
+        returned by get_variant_name() and 'dir' is the object directory of
+        the libdirs.b entry (relative to the variant's object root)
+    """
+    with _lock:
+        _samples.append( (variant, kind, dir, fname, seconds, rss) )
+
+
+def save( variant ):
+    """ Writes (and discards) the samples of the current build of 'variant'
+        to the database
+    """
+    global _samples
+    with _lock:
+        samples  = [ s[1:] for s in _samples if s[0] == variant ]
+        _samples = [ s for s in _samples if s[0] != variant ]
+    if ( len(samples) == 0 ):
+        return
+
+    try:
+        os.makedirs( os.path.dirname( get_db_name() ), exist_ok=True )
+        db = _open()
+        with db:
+            build = db.execute( 'INSERT INTO builds (started, variant) VALUES (?,?)', (time.time(), variant) ).lastrowid
+            db.executemany( 'INSERT INTO samples (build, kind, dir, file, seconds, rss) VALUES (?,?,?,?,?,?)', [ (build,) + s for s in samples ] )
+        db.close()
+
+    # Failing to update the history is NOT a build failure
+    except (OSError, sqlite3.Error):
+        pass
+
+
+#-----------------------------------------------------------------------------
+def query_slowest( variant, count ):
+    """ Returns a tuple (files, dirs) of the 'count' slowest translation units
+        and directories based on the most recent compile time of each file.
+        'files' is a list of (seconds, dir, file) and 'dirs' is a list of
+        (seconds, dir, num_files)
+    """
+    latest = _get_latest_times( variant, 'compile' )
+    files  = sorted( [ (t, d, f) for (d, f), t in latest.items() ], reverse=True )
+
+    totals = {}
+    for (d, f), t in latest.items():
+        total, num = totals.get( d, (0.0, 0) )
+        totals[d]  = (total + t, num + 1)
+    dirs = sorted( [ (t, d, n) for d, (t, n) in totals.items() ], reverse=True )
+
+    return files[:count], dirs[:count]
+
+
+def query_regressions( variant ):
+    """ Returns the list of (kind, dir, file, latest, median) for all compile
+        and archive steps whose most recent time is significantly longer
+        than their historical median time
+    """
+    history = {}
+    for kind, dir, fname, seconds in _get_samples( variant ):
+        history.setdefault( (kind, dir, fname), [] ).append( seconds )
+
+    regressions = []
+    for (kind, dir, fname), times in history.items():
+        if ( len(times) <= REGRESSION_MIN_HISTORY ):
+            continue
+
+        latest   = times[-1]
+        previous = sorted( times[-(REGRESSION_MAX_HISTORY+1):-1] )
+        median   = previous[len(previous)//2] if len(previous) % 2 else (previous[len(previous)//2-1] + previous[len(previous)//2]) / 2
+        if ( latest >= median * REGRESSION_RATIO and latest - median >= REGRESSION_MIN_DELTA ):
+            regressions.append( (kind, dir, fname, latest, median) )
+
+    return sorted( regressions, key=lambda r: r[3] - r[4], reverse=True )
+
+
+#=============================================================================
+class CostEstimator:
+    """ Estimates the compile time of files and directories.  The most 
+        recent compile time is used when a file has history, otherwise the
+        time is estimated from the file's size. 'dir' is the object directory
+        of the libdirs.b entry (relative to the variant's object root)
+    """
+
+    #-------------------------------------------------------------------------
+    def __init__( self, variant ):
+        self._times  = _get_latest_times( variant, 'compile' )
+        self._memory = _get_latest_memory( variant, 'compile' )
+        self._dirs   = {}
+        for (d, f), t in self._times.items():
+            self._dirs[d] = self._dirs.get( d, 0.0 ) + t
+
+        # Files without history are assumed to use the median of the known peak memory
+        known = sorted( self._memory.values() )
+        self._default_memory = known[len(known)//2] if len(known) > 0 else DEFAULT_MEMORY
+
+    def get_file_cost( self, dir, fname ):
+        """ 'fname' is the path of the source file"""
+        t = self._times.get( (dir, os.path.basename( fname )) )
+        return t if t != None else _get_size( fname ) * SECONDS_PER_BYTE
+
+    def get_file_memory( self, dir, fname ):
+        """ Returns the estimated peak memory (in bytes) of compiling 'fname'"""
+        m = self._memory.get( (dir, os.path.basename( fname )) )
+        return m if m != None else self._default_memory
+
+    def get_dir_cost( self, dir, srcpath, exts ):
+        """ Returns the estimated time to compile all files in 'srcpath'
+            with one of the extensions in 'exts'
+        """
+        t = self._dirs.get( dir )
+        if ( t != None ):
+            return t
+        total = 0
+        try:
+            with os.scandir( srcpath ) as it:
+                for e in it:
+                    if ( os.path.splitext( e.name )[1][1:] in exts and e.is_file() ):
+                        total += e.stat().st_size
+        except OSError:
+            pass
+        return total * SECONDS_PER_BYTE
+
+
+#-----------------------------------------------------------------------------
+def _get_size( fname ):
+    try:
+        return os.path.getsize( fname )
+    except OSError:
+        return 0
+
+
+def _open():
+    db = sqlite3.connect( get_db_name() )
+    db.execute( 'CREATE TABLE IF NOT EXISTS builds (id INTEGER PRIMARY KEY, started REAL, variant TEXT)' )
+    db.execute( 'CREATE TABLE IF NOT EXISTS samples (build INTEGER, kind TEXT, dir TEXT, file TEXT, seconds REAL)' )
+    db.execute( 'CREATE INDEX IF NOT EXISTS samples_key ON samples (kind, dir, file)' )
+
+    # Databases created before the peak memory was recorded
+    if ( 'rss' not in [ c[1] for c in db.execute( 'PRAGMA table_info(samples)' ) ] ):
+        db.execute( 'ALTER TABLE samples ADD COLUMN rss INTEGER' )
+    return db
+
+
+def _get_samples( variant, kind=None ):
+    # Returns the samples (oldest first) for the specified variant
+    if ( not os.path.isfile( get_db_name() ) ):
+        return []
+
+    sql  = 'SELECT s.kind, s.dir, s.file, s.seconds FROM samples s JOIN builds b ON s.build = b.id WHERE b.variant = ?'
+    args = [variant]
+    if ( kind != None ):
+        sql += ' AND s.kind = ?'
+        args.append( kind )
+    sql += ' ORDER BY b.id'
+
+    try:
+        db   = _open()
+        rows = db.execute( sql, args ).fetchall()
+        db.close()
+        return rows
+    except sqlite3.Error:
+        return []
+
+
+def _get_latest_times( variant, kind ):
+    latest = {}
+    for k, dir, fname, seconds in _get_samples( variant, kind ):
+        latest[(dir, fname)] = seconds
+    return latest
+
+
+def _get_latest_memory( variant, kind ):
+    # Returns the most recent peak memory of each file (files without a recorded peak are omitted)
+    if ( not os.path.isfile( get_db_name() ) ):
+        return {}
+    try:
+        db   = _open()
+        rows = db.execute( 'SELECT s.dir, s.file, s.rss FROM samples s JOIN builds b ON s.build = b.id WHERE b.variant = ? AND s.kind = ? AND s.rss IS NOT NULL ORDER BY b.id', (variant, kind) ).fetchall()
+        db.close()
+    except sqlite3.Error:
+        return {}
+    return { (dir, fname): rss for dir, fname, rss in rows }
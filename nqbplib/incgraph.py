@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+"""Include graph (used by the --qry-affected and --qry-includers options)
+
+The graph contains every translation unit (TU) of the expanded libdirs.b
+list (and the project directory) and the header files they include.  The
+includes of a TU are taken from its compiler generated dependency file (see
+depends.py) when the dependency file is newer than the TU.  Otherwise the TU
+is scanned for #include statements, which are resolved using the directory
+of the including file and the include paths of the current build variant
+(i.e. headers that cannot be resolved, e.g. system headers, are ignored).
+The scanner does NOT evaluate preprocessor conditionals, i.e. it can report
+more includes than the compiler would.
+
+The graph is stored in the project's state directory (one file per build
+variant) and only the files that have changed since the previous query are
+re-scanned.
+"""
+
+import os
+import re
+import json
+
+#
+from . import utils
+from . import depends
+
+# Globals
+from .my_globals import NQBP_PKG_ROOT
+from .my_globals import NQBP_WORK_ROOT
+from .my_globals import NQBP_PRJ_DIR
+from .my_globals import NQBP_WRKPKGS_DIRNAME
+from .my_globals import NQBP_NAME_SOURCES
+
+
+# Format version of the graph file
+_VERSION = 1
+
+_INCLUDE_REGEX = re.compile( r'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\r\n]+)[>"]', re.MULTILINE )
+
+
+#-----------------------------------------------------------------------------
+def get_graph_file( variant ):
+    return utils.get_state_file( 'incgraph', variant )
+
+
+def load( printer, toolchain, variant ):
+    """ Returns the (updated) include graph of the current build variant.
+        'variant' is the name the graph is stored under (e.g. the history
+        variant name)
+    """
+    graph = IncludeGraph( toolchain.get_include_dirs() )
+    graph.read( get_graph_file( variant ) )
+    graph.update( _get_translation_units( printer, toolchain ) )
+    if ( graph.changed ):
+        graph.write( get_graph_file( variant ) )
+    return graph
+
+
+#=============================================================================
+class IncludeGraph:
+    """ Translation units and the files that they include"""
+
+    #-------------------------------------------------------------------------
+    def __init__( self, incdirs ):
+        self.incdirs  = incdirs
+        self.tus      = {}      # key: TU, value: (display directory, object file, archive or None)
+        self.changed  = False
+        self._files   = {}      # key: scanned file, value: [time stamp, includes]
+        self._deps    = {}      # key: dependency file, value: [time stamp, includes]
+        self._edges   = {}      # key: file, value: list of (direct) includes
+
+    def read( self, fname ):
+        try:
+            with open( fname, 'r' ) as f:
+                data = json.load( f )
+        except (OSError, ValueError):
+            return
+
+        # Scanned files depend on the include paths -->discard them when the include paths have changed
+        if ( data.get( 'version' ) == _VERSION ):
+            self._deps = data.get( 'deps', {} )
+            if ( data.get( 'incdirs' ) == self.incdirs ):
+                self._files = data.get( 'files', {} )
+
+    def write( self, fname ):
+        os.makedirs( os.path.dirname( fname ), exist_ok=True )
+        tmp = fname + '.tmp'
+        with open( tmp, 'w' ) as f:
+            json.dump( { 'version':_VERSION, 'incdirs':self.incdirs, 'files':self._files, 'deps':self._deps }, f )
+        os.replace( tmp, fname )
+        self.changed = False
+
+    #-------------------------------------------------------------------------
+    def update( self, tus ):
+        """ Builds the graph for the specified TUs, i.e. a list of (TU,
+            display directory, object file, dependency file, archive).  Only
+            changed files are re-scanned
+        """
+        self.tus    = {}
+        self._edges = {}
+        used_files  = set()
+        used_deps   = set()
+        pending     = []
+        stamps      = {}
+        for tu, display, objfile, depfile, archive in tus:
+            self.tus[tu] = (display, objfile, archive)
+            tu_stamp     = _get_stamp( tu )
+            dep_stamp    = _get_stamp( depfile ) if depfile != None else None
+
+            # Use the compiler's dependency file when it is newer than the TU and all of its headers
+            includes = None
+            if ( tu_stamp != None and dep_stamp != None and dep_stamp[0] >= tu_stamp[0] ):
+                includes = self._get_depfile_includes( depfile, dep_stamp )
+                used_deps.add( depfile )
+                if ( any( _get_cached_stamp( f, stamps, dep_stamp[0] ) > dep_stamp[0] for f in includes ) ):
+                    includes = None
+            if ( includes != None ):
+                self._edges[tu] = includes
+            else:
+                pending.append( tu )
+
+        # Scan the remaining TUs (and the headers they include)
+        while( len(pending) > 0 ):
+            fname = pending.pop()
+            if ( fname in self._edges ):
+                continue
+            includes            = self._get_scanned_includes( fname )
+            self._edges[fname]  = includes
+            used_files.add( fname )
+            pending.extend( [ f for f in includes if f not in self._edges ] )
+
+        # Drop the entries of files that are no longer used
+        for cache, used in ( (self._files, used_files), (self._deps, used_deps) ):
+            for f in [ f for f in cache if f not in used ]:
+                del cache[f]
+                self.changed = True
+
+    def get_includers( self, fname ):
+        """ Returns the set of files (TUs and headers) that include 'fname',
+            directly or transitively (including 'fname')
+        """
+        reverse = {}
+        for f, includes in self._edges.items():
+            for i in includes:
+                reverse.setdefault( i, [] ).append( f )
+
+        found   = set( [fname] )
+        pending = [fname]
+        while( len(pending) > 0 ):
+            for f in reverse.get( pending.pop(), [] ):
+                if ( f not in found ):
+                    found.add( f )
+                    pending.append( f )
+        return found
+
+    def get_affected_tus( self, fname ):
+        """ Returns the sorted list of TUs that must be recompiled when 'fname' changes"""
+        return sorted( f for f in self.get_includers( fname ) if f in self.tus )
+
+    def find_files( self, name ):
+        """ Returns the list of files in the graph that match 'name', i.e. an
+            absolute path, a path relative to the current directory, or the
+            trailing part of a path (e.g. 'Cpl/System/Api.h')
+        """
+        nodes = set( self._edges )
+        for includes in self._edges.values():
+            nodes.update( includes )
+        path = os.path.normpath( os.path.abspath( name ) )
+        if ( path in nodes ):
+            return [path]
+        suffix = os.sep + os.path.normpath( name ).lstrip( os.sep )
+        return sorted( f for f in nodes if f.endswith( suffix ) )
+
+    #-------------------------------------------------------------------------
+    def _get_depfile_includes( self, depfile, stamp ):
+        entry = self._deps.get( depfile )
+        if ( entry != None and entry[0] == list(stamp) ):
+            return entry[1]
+
+        # Paths in the dependency file are relative to the object directory (the first entry is the TU)
+        objdir   = os.path.dirname( depfile )
+        includes = [ os.path.normpath( os.path.join( objdir, f ) ) for f in (depends.parse_depfile( depfile ) or [])[1:] ]
+        self._deps[depfile] = [list(stamp), includes]
+        self.changed        = True
+        return includes
+
+    def _get_scanned_includes( self, fname ):
+        stamp = _get_stamp( fname )
+        entry = self._files.get( fname )
+        if ( entry != None and stamp != None and entry[0] == list(stamp) ):
+            return entry[1]
+
+        includes = []
+        try:
+            with open( fname, 'r', errors='replace' ) as f:
+                content = f.read()
+        except OSError:
+            content = ''
+        curdir = os.path.dirname( fname )
+        for kind, name in _INCLUDE_REGEX.findall( content ):
+            path = self._resolve( curdir if kind == '"' else None, name.strip() )
+            if ( path != None and path not in includes ):
+                includes.append( path )
+
+        self._files[fname] = [list(stamp) if stamp != None else None, includes]
+        self.changed       = True
+        return includes
+
+    def _resolve( self, curdir, name ):
+        for d in ( [curdir] if curdir != None else [] ) + self.incdirs:
+            path = os.path.normpath( os.path.join( d, name ) )
+            if ( os.path.isfile( path ) ):
+                return path
+        return None
+
+
+#-----------------------------------------------------------------------------
+def _get_translation_units( printer, toolchain ):
+    # Returns the list of: (TU, display directory, object file, dependency file, archive)
+    tus     = []
+    objroot = toolchain.get_obj_root()
+    for d, entry in toolchain.libdirs:
+        srcpath, display, dir = utils.derive_src_path( NQBP_PKG_ROOT(), NQBP_WORK_ROOT(), NQBP_WRKPKGS_DIRNAME(), entry, d )
+        if ( os.path.isdir( srcpath ) ):
+            objdir  = os.path.join( objroot, dir[0] )
+            archive = os.path.join( objdir, toolchain.get_archive_name() )
+            for f in utils.get_and_filter_files_to_build( printer, toolchain, dir, srcpath, NQBP_NAME_SOURCES() ):
+                tus.append( _make_tu( toolchain, os.path.join( srcpath, f ), display, objdir, archive ) )
+
+    # The project directory's object files are linked directly (i.e. no archive)
+    for f in utils.get_files_to_build( printer, toolchain, NQBP_PRJ_DIR(), NQBP_NAME_SOURCES() ):
+        tus.append( _make_tu( toolchain, os.path.join( NQBP_PRJ_DIR(), f ), '.', objroot, None ) )
+    return tus
+
+
+def _make_tu( toolchain, fname, display, objdir, archive ):
+    basename = os.path.splitext( os.path.basename( fname ) )[0]
+    objfile  = os.path.join( objdir, basename + '.' + toolchain.get_obj_ext() )
+    depfile  = os.path.join( objdir, basename + '.' + toolchain.get_depfile_ext() )
+    return (os.path.normpath( os.path.abspath( fname ) ), display, objfile, depfile, archive)
+
+
+def _get_cached_stamp( fname, stamps, missing ):
+    # Returns the modification time of 'fname' ('missing' when the file does not exist)
+    if ( fname not in stamps ):
+        stamp         = _get_stamp( fname )
+        stamps[fname] = stamp[0] if stamp != None else missing
+    return stamps[fname]
+
+
+def _get_stamp( fname ):
+    try:
+        st = os.stat( fname )
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+"""Build manifest
+
+Records, for each object directory (i.e. each libdirs.b entry and the
+project directory), the object files that the directory's source files are
+compiled to and the directory's archive.  The entry of a directory is
+recorded from the results of its compile jobs, i.e. the objects that were
+actually produced (e.g. the individual objects of a unity batch that fell
+back to compiling its files one at a time).  The archive, link, and
+_BUILT_DIR_ steps use the manifest instead of listing the object
+directories, i.e. a stale object file (e.g. of a deleted source file) is
+never archived or linked.
+
+The manifest of each build variant is saved in the project's state
+directory, i.e. a partial build (e.g. -d, -l) uses the saved entries of the
+directories that it did not build.  A directory that has no entry (e.g. it
+was built by a previous version of NQBP) is listed instead.
+"""
+
+import os
+import json
+
+
+# Format version of the manifest file
+_VERSION = 1
+
+
+#=============================================================================
+class BuildManifest:
+    """ Object directories (relative to the object root) and their objects"""
+
+    #-------------------------------------------------------------------------
+    def __init__( self, fname ):
+        self.fname    = fname
+        self._dirs    = {}      # key: object directory, value: {'objects':[...], 'archive':<path>|None}
+        self._changed = False
+        try:
+            with open( fname, 'r' ) as f:
+                data = json.load( f )
+            if ( data.get( 'version' ) == _VERSION ):
+                self._dirs = data.get( 'dirs', {} )
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def set_objects( self, objdir, objects, archive ):
+        """ Sets the object files (file names) and the archive (path relative
+            to the object root, or None) of the object directory 'objdir'
+        """
+        entry = { 'objects':list( dict.fromkeys( objects ) ), 'archive':archive }
+        if ( self._dirs.get( objdir ) != entry ):
+            self._dirs[objdir] = entry
+            self._changed      = True
+
+    def get_objects( self, objdir ):
+        """ Returns the list of object files of 'objdir'.  Returns None if
+            the directory has no entry
+        """
+        entry = self._dirs.get( objdir )
+        return list( entry['objects'] ) if entry != None else None
+
+    def get_archive( self, objdir ):
+        entry = self._dirs.get( objdir )
+        return entry['archive'] if entry != None else None
+
+    def save( self ):
+        if ( not self._changed ):
+            return
+        os.makedirs( os.path.dirname( self.fname ), exist_ok=True )
+        tmp = self.fname + '.tmp'
+        with open( tmp, 'w' ) as f:
+            json.dump( { 'version':_VERSION, 'dirs':self._dirs }, f, indent=1 )
+        os.replace( tmp, self.fname )
+        self._changed = False
@@ -16,7 +16,6 @@ import sys
 import os
 import logging
 import time
-from multiprocessing import Process
 
 #
 from .docopt.docopt import docopt
@@ -24,7 +23,18 @@ from .base import ToolChain
 from .output import Printer
 from . import base
 from . import utils
+from . import cache
+from . import scheduler
+from . import throttle
+from . import crash
+from . import timeline
+from . import history
+from . import remote
+from . import watch
+from . import depends
+from . import incgraph
 import multiprocessing
+import copy
 
     
 # Globals
@@ -38,6 +48,8 @@ from .my_globals import NQBP_NAME_SOURCES
 from .my_globals import NQBP_PRE_PROCESS_SCRIPT
 from .my_globals import NQBP_PRE_PROCESS_SCRIPT_ARGS
 from .my_globals import NQBP_NAME_LIBDIRS
+from .my_globals import NQBP_CMD_SIGNATURE_EXT
+from .my_globals import NQBP_DIAGNOSTICS_EXT
 
 
 
@@ -58,7 +70,9 @@ Arguments:
                    mytoolchain.py script.
   --try variant    Same as the '-b' option, except that if the variant does not
                    exist - the script does not report a failure on exit.
-  --bld-all        Builds all variants.  Does NOT build variants that start 
+  --bld-all        Builds all variants (at the same time when the toolchain
+                   uses per-variant object trees, the variants share the 
+                   '--jobs' budget).  Does NOT build variants that start 
                    with a leading '_'.
   -d DIR           Compile ONLY the specified directory relative to the pkg 
                    root. If 'DIR' starts with a directory seperator ('\\' or 
@@ -94,7 +108,47 @@ Arguments:
   -l               Link ONLY (can be combinded with '-mpxdfseqQ' options).
   -k               Cleans only the package's objects/files (use with '-p')
   -j               Cleans only the external objects/files (use with '-x').
-  -1               Suppresses the use of multiple processes when building.
+  -1               Suppresses the use of multiple processes when building, i.e.
+                   same as '--jobs 1'.
+  -J N, --jobs N   Runs at most 'N' compile/archive/link jobs at the same time.
+                   The default is the number of CPUs.
+  --fixed-jobs     Always runs '--jobs' jobs at the same time, i.e. disables 
+                   the memory and load aware throttling of compiles.
+  --keep-going     Continues building after a compile/archive failure, i.e. 
+                   builds everything that does not depend on the failure.
+  -i, --incremental
+                   Incremental build, i.e. only compiles files whose object 
+                   file is out-of-date with respect to its source file, its 
+                   header files, or its compiler command line. No implicit 
+                   CLEAN ALL is performed.
+  --cache          Uses the local compile cache, i.e. object files are restored 
+                   from the cache when the preprocessed source file, compiler
+                   flags, and compiler are the same as a previous compile.
+  --remote         Compiles C/C++ files on the remote workers specified by the
+                   NQBP_WORKERS environment variable (see nqbp-worker.py). A
+                   file is compiled locally when its remote compile fails.
+                   Use the '--jobs' option to increase the number of 
+                   concurrent compiles.
+  --unity N        Compiles the C and C++ files of each libdirs.b directory in 
+                   'unity' batches, i.e. a generated file that includes (at 
+                   most) 'N' of the directory's source files.  C and C++ files
+                   are batched separately.  A batch that fails to compile is
+                   re-compiled one file at a time.
+  --watch          Builds and then watches the source directories (i.e. the 
+                   libdirs.b directories, the directories of the header files 
+                   used by the previous build, and the project directory) and
+                   incrementally rebuilds and re-links every time a source or
+                   header file changes.  Changes made while building (e.g. 
+                   files generated by pre-processing scripts) are ignored.
+                   Implies '-i'. Press Ctrl-C to exit.
+  --diagnostics FILE
+                   Writes the de-duplicated compiler errors and warnings of
+                   the build to 'FILE'.  The SARIF format is used when 'FILE'
+                   ends with '.sarif', else JSON.
+  --trace FILE     Writes a timeline of the build (i.e. a span for each
+                   compile, archive, link, etc.) to 'FILE' using the 
+                   trace-event JSON format (e.g. open 'FILE' with 
+                   chrome://tracing or ui.perfetto.dev).
   --bldnum M       Passes 'M' as build number information for the build. 
                    [Default: 0].          
   --def1 SYM1      Defines (as a compiler option) the preprocessor 'SYM1'.
@@ -102,7 +156,8 @@ Arguments:
   --def3 SYM3      Defines (as a compiler option) the preprocessor 'SYM3'.
   --def4 SYM4      Defines (as a compiler option) the preprocessor 'SYM4'.
   --def5 SYM5      Defines (as a compiler option) the preprocessor 'SYM5'.
-  -t, --turbo      Uses multiple process to build directories in parallel.
+  -t, --turbo      Obsolete. Directories are always built in parallel (see 
+                   '--jobs').  Overrides the '-1' option.
   -z, --clean-all  Cleans ALL files for ALL build configurations and then exits
   --debug          Enables debug info internally to NQBP.
   --qry            Outputs the current project directory (does nothing else)
@@ -114,19 +169,87 @@ Arguments:
                    build variant) referenced in the libdirs.b file.
   --qry-dirs2      Same as --qry-dirs with the addition of the any source file
                    include/exclude info
+  --qry-slowest N  Displays the 'N' slowest files and directories (for the 
+                   selected build variant) based on the compile times recorded
+                   by previous builds (no build is performed).
+  --qry-regressions
+                   Displays the files and archives whose most recent compile
+                   time is significantly longer than their historical compile
+                   time (no build is performed).
+  --qry-affected FILE
+                   Displays the object files, directories and archives (for
+                   the selected build variant) that would be rebuilt if FILE
+                   (a source or header file) changed (no build is performed).
+  --qry-includers HEADER
+                   Displays the translation units that include HEADER,
+                   directly or transitively (no build is performed).
   -h,--help        Display help.
   --version        Display version number.
 
 Notes:
     Default operation is to do an implicit BUILD ALL and CLEAN ALL on each 
     build.  The exception to this rule is when one of the following options are  
-    specified: -d, -f, -s, -e, -p, -x, -m, -l, -k, -j -q -Q -c -C
+    specified: -d, -f, -s, -e, -p, -x, -m, -l, -k, -j -q -Q -c -C -i
   
-    By default, NQBP will attempt to build all files in a single directory in
-    parallel. However, not all compilers deal well with parallel building (i.e
-    the crash). The '-1' option will suppress all parallel building.  In addition 
-    the environment variable NQBP_CMD_OPTIONS (when set to '-1') can be used to
-    apply the '-1' option to every build.
+    Incremental builds (-i) use the header dependencies generated by the 
+    compiler (e.g. gcc -MMD, MSVC /showIncludes) and the compiler's command 
+    line to determine if a file needs to be recompiled.  The environment 
+    variable NQBP_CMD_OPTIONS (when set to '-i') can be used to make all 
+    builds incremental builds.
+
+    The location and maximum size of the compile cache (--cache) are set by
+    the environment variables NQBP_CACHE_DIR and NQBP_CACHE_SIZE (in MB). 
+    The default location is <home>/.nqbp_cache and the default maximum size
+    is 2048MB.  The least recently used entries are evicted first.
+  
+    By default, NQBP will attempt to build all files in all directories in
+    parallel, i.e. all compiles, archives and the link are scheduled as jobs 
+    with at most '--jobs N' running at the same time. However, not all 
+    compilers deal well with parallel building (i.e the crash). A compile 
+    that crashes (i.e. the compiler was terminated by a signal or reported 
+    an internal compiler error) is retried with half of the concurrent jobs
+    and then by itself.  The number of concurrent jobs at which the retry 
+    succeeded is remembered (per toolchain) and used by the following 
+    builds (after 5 builds without a crash the number is doubled).  The '-1'
+    option will suppress all parallel building.  In addition the environment
+    variable NQBP_CMD_OPTIONS (when set to '-1') can be used to apply the '-1'
+    option to every build.  The directories and files with the longest 
+    (estimated) compile times are started first, i.e. based on the compile
+    times of previous builds or on the size of the source files.  This does
+    NOT change the link order.
+
+    A compile is only started when its peak memory (learned from previous
+    builds) is expected to fit into the available memory and when the 
+    machine is not already busy with other work (load average), i.e. the 
+    '--jobs' value is an upper bound.  The environment variable 
+    NQBP_MEM_RESERVE sets the memory (in MB) that is left for other 
+    programs (default is 256MB).  Use '-v' to see the throttling decisions.
+
+    By default, the first compile/archive failure stops the build, i.e. 
+    all running compiler/tool processes are killed and the job that failed
+    is reported.  The compiler output is displayed as it is generated.  Use
+    the '--keep-going' option to build as much as possible and to report 
+    all failures.
+
+    Compiler warnings are de-duplicated across the entire build, i.e. a 
+    warning in a header file is displayed (and counted) once, not once per
+    file that includes the header.
+
+    A toolchain can opt in (see _variant_obj_roots in base.py) to each build
+    variant (and its debug build) having its own object tree in the 
+    project's .nqbp/obj directory, i.e. switching between variants or between
+    debug and release builds does not require a rebuild.  The link outputs 
+    are copied to the project's _<variant> directory.
+
+    Cleaning moves the derived directories into the project's .nqbp/trash 
+    directory, i.e. compiling starts immediately and the trash is deleted in
+    the background (anything left over is deleted by the next build).
+
+    The start-up cost of a build (loading NQBP and the toolchain, validating
+    the compiler, etc.) can be avoided by running a per-project build daemon,
+    i.e. 'nqbp.py --daemon' (stop it with 'nqbp.py --daemon-stop').  While the
+    daemon is running, nqbp.py forwards its command line to the daemon. Set
+    the environment variable NQBP_NO_DAEMON to bypass the daemon.
        
 Examples:
 
@@ -139,8 +262,11 @@ def build( argv, toolchain ):
     # ensure that I am executing in the project directory
     os.chdir( NQBP_PRJ_DIR() )
 
+    # Remove what a previous build left in the trash directory (in the background)
+    utils.empty_trash()
+
     # Append options from optional environment variable
-    rawinput = sys.argv[1:]
+    rawinput = argv[1:]
     NQBP_CMD_OPTIONS = os.environ.get('NQBP_CMD_OPTIONS')
     if ( NQBP_CMD_OPTIONS != None ):
         rawinput.extend( NQBP_CMD_OPTIONS.split(' '))
@@ -154,9 +280,26 @@ def build( argv, toolchain ):
 
     # Create printer (and tell the toolchain about it)
     logfile = os.path.join( os.getcwd(), 'make.log' )
-    printer = Printer( multiprocessing.Lock(), logfile, start_new_file=True );
+    printer = Printer( log_file_name=logfile, start_new_file=True )
     toolchain.set_printer( printer )
 
+    # Enable the compile cache
+    if ( arguments['--cache'] ):
+        toolchain.set_compile_cache( cache.CompileCache( cache.get_store_dir(), cache.get_max_size() ) )
+
+    # Enable remote compiles
+    if ( arguments['--remote'] ):
+        workers = remote.get_workers()
+        if ( len(workers) == 0 ):
+            sys.exit( "ERROR: The --remote option requires the NQBP_WORKERS environment variable" )
+        toolchain.set_remote_compiler( remote.RemoteCompiler( workers, remote.get_timeout() ) )
+
+    # Validate the unity batch size (before any jobs are scheduled)
+    get_unity_size( arguments )
+
+    # The number of concurrent jobs the compiler is stable at
+    toolchain.set_crash_stability( crash.Stability( toolchain ) )
+
     # Does the specified variant exist
     if ( arguments['--try'] != None ):
         if ( not arguments['--try'] in toolchain.get_variants() ):
@@ -195,22 +338,129 @@ def build( argv, toolchain ):
         toolchain.clean_all( arguments )
         printer.remove_log_file()
         sys.exit()
+
+    if ( arguments['--qry-slowest'] != None ):
+        list_slowest( printer, get_history_variant( arguments, arguments['-b'] ), arguments['--qry-slowest'] )
+        sys.exit()
+
+    if ( arguments['--qry-regressions'] ):
+        list_regressions( printer, get_history_variant( arguments, arguments['-b'] ) )
+        sys.exit()
+
+    if ( arguments['--qry-affected'] != None or arguments['--qry-includers'] != None ):
+        toolchain.pre_build( arguments['-b'], arguments )
+        graph = incgraph.load( printer, toolchain, get_history_variant( arguments, arguments['-b'] ) )
+        if ( arguments['--qry-affected'] != None ):
+            list_affected( printer, toolchain, graph, arguments['--qry-affected'] )
+        else:
+            list_includers( printer, graph, arguments['--qry-includers'] )
+        sys.exit()
         
     # Validate Compiler toolchain is set properly (ONLY after non-build options have been processed, i.e. don't have to have an 'active' toolchain for non-build options to work)
     toolchain.validate_cc()
         
+    # Record the build's timeline (when requested)
+    if ( arguments['--trace'] != None ):
+        timeline.enable()
+
     # Start the selected build(s)
-    if ( arguments['--bld-all'] ):
-        for b in toolchain.get_variants():
-            if ( not b.startswith("_") ):
-                do_build( printer, toolchain, arguments, b )
-    else: 
-        do_build( printer, toolchain, arguments, arguments['-b'] )        
+    try:
+        if ( arguments['--watch'] ):
+            watch_and_build( printer, toolchain, arguments )
+        else:
+            build_variants( printer, toolchain, arguments )
+
+    # Write the timeline even when the build fails
+    finally:
+        if ( timeline.is_enabled() ):
+            timeline.write( arguments['--trace'] )
+            timeline.disable()
             
            
 
 #-----------------------------------------------------------------------------
+def build_variants( printer, toolchain, arguments ):
+    # Write the diagnostics report even when the build fails
+    toolchain.get_diagnostics().clear()
+    try:
+        if ( arguments['--bld-all'] ):
+            variants = [ b for b in toolchain.get_variants() if not b.startswith("_") ]
+            do_concurrent_builds( printer, toolchain, arguments, variants )
+        else: 
+            do_build( printer, toolchain, arguments, arguments['-b'] )        
+    finally:
+        if ( arguments['--diagnostics'] != None ):
+            toolchain.get_diagnostics().write( arguments['--diagnostics'], toolchain.get_ccname() )
+
 def do_build( printer, toolchain, arguments, variant ):
+    sched = scheduler.Scheduler( printer, get_build_jobs( printer, toolchain, arguments ), arguments['--keep-going'], get_throttle( printer, arguments ) )
+    if ( not add_build_jobs( sched, printer, toolchain, arguments, variant ) ):
+        return
+
+    # Run the build (and record the compile times)
+    success = sched.run()
+    history.save( get_history_variant( arguments, variant ) )
+    toolchain.save_build_manifest()
+    if ( not success ):
+        toolchain.get_crash_stability().save()
+        report_failed_jobs( printer, sched, arguments )
+        sys.exit(1)
+    toolchain.get_crash_stability().build_completed( get_num_jobs( arguments ) )
+    finish_build( printer, toolchain )
+
+def do_concurrent_builds( printer, toolchain, arguments, variants ):
+    """ Builds the variants at the same time, i.e. the jobs of all variants
+        share the same job budget (--jobs).  Each variant is built by its own
+        copy of the toolchain.  The variants are built one after another when
+        the toolchain does not use per-variant object trees
+    """
+    if ( not toolchain._variant_obj_roots ):
+        for b in variants:
+            do_build( printer, toolchain, arguments, b )
+        return
+
+    sched  = scheduler.Scheduler( printer, get_build_jobs( printer, toolchain, arguments ), arguments['--keep-going'], get_throttle( printer, arguments ) )
+    builds = []
+    for b in variants:
+        tc = copy.copy( toolchain )
+        if ( add_build_jobs( sched, printer, tc, arguments, b ) ):
+            builds.append( (b, tc) )
+
+    success = sched.run()
+    for b, tc in builds:
+        history.save( get_history_variant( arguments, b ) )
+        tc.save_build_manifest()
+    if ( not success ):
+        toolchain.get_crash_stability().save()
+        report_failed_jobs( printer, sched, arguments )
+        sys.exit(1)
+    toolchain.get_crash_stability().build_completed( get_num_jobs( arguments ) )
+    for b, tc in builds:
+        finish_build( printer, tc )
+
+def report_failed_jobs( printer, sched, arguments ):
+    # Note: Fail fast builds stop at the first failure, i.e. only the job that failed first is listed
+    failed = sched.get_failed_jobs()
+    if ( len(failed) > 0 ):
+        printer.output( "=" )
+        printer.output( "= Build Failed: {} job(s) failed".format( len(failed) ) )
+        for j in failed:
+            printer.output( "=   {}".format( j.name if j.dir == None or j.dir == j.name else "{}: {}".format( j.dir, j.name ) ) )
+        printer.output( "=" )
+
+def finish_build( printer, toolchain ):
+    # Enforce the compile cache's size limit
+    if ( toolchain.get_compile_cache() != None ):
+        toolchain.get_compile_cache().trim()
+                            
+    # Output end banner
+    end_banner(printer, toolchain)
+
+#-----------------------------------------------------------------------------
+def add_build_jobs( sched, printer, toolchain, arguments, variant ):
+    """ Adds the jobs to build the specified variant to the scheduler.
+        Returns False if there is nothing to build (i.e. a query option)
+    """
     # Set the build variant (Note: The method constructs the libdirs.b directory list)
     toolchain.pre_build( variant, arguments )
 
@@ -230,7 +480,7 @@ def do_build( printer, toolchain, arguments, variant ):
         for dir, flag in toolchain.libdirs:
             d,s,sl = dir
             printer.output( "{:<5}  {}".format( str(flag), d)  )
-        return
+        return False
 
     # Display my full set of directories with Source include/exclude info
     if ( arguments['--qry-dirs2'] ):
@@ -240,7 +490,7 @@ def do_build( printer, toolchain, arguments, variant ):
                 printer.output( "{:<5}  {}".format( str(flag), d)  )
             else:
                 printer.output( "{:<5}  {}  {}{}{} {} ".format( str(flag), d, s,s,s, sl)  )
-        return
+        return False
     
     # Set default operations
     clean_pkg = True
@@ -255,6 +505,10 @@ def do_build( printer, toolchain, arguments, variant ):
     if ( arguments['-p'] or arguments['-x'] or arguments['-s']  or arguments['-e'] or arguments['--noabs'] or arguments['-q'] or arguments['-Q'] or arguments['-c'] or arguments['-C']):
         clean_pkg = clean_ext = clean_abs = False
         
+    # Incremental builds only rebuild what has changed
+    if ( arguments['--incremental'] ):
+        clean_pkg = clean_ext = clean_abs = False
+
     # Compile only a single file    
     if ( arguments['-f'] ):
         clean_pkg = clean_ext = clean_abs = bld_prj = do_link = bld_libs = False
@@ -265,6 +519,7 @@ def do_build( printer, toolchain, arguments, variant ):
         bld_prj = do_link = False
 
     # Compile only a single directory    
+    single_dir = None
     if ( arguments['-d'] ):
         clean_pkg = clean_ext = clean_abs = bld_prj = do_link = bld_libs = False
         dir_path  = utils.standardize_dir_sep( arguments['-d'] )
@@ -288,7 +543,7 @@ def do_build( printer, toolchain, arguments, variant ):
 
         # Attempt to find the specified entry in the libdirs list to GET the 'source list' for the specified directory
         found,dir,entry = utils.find_libdir_entry( toolchain.libdirs, dir_path, entry_type=entry )
-        build_single_directory( printer, arguments, toolchain, dir, entry, NQBP_PKG_ROOT(), NQBP_WORK_ROOT(), NQBP_WRKPKGS_DIRNAME(), NQBP_PRJ_DIR(), NQBP_PRE_PROCESS_SCRIPT(), NQBP_PRE_PROCESS_SCRIPT_ARGS() )
+        single_dir = (dir, entry)
 
     # Trap compile just the project directory
     if ( arguments['-m'] ):
@@ -323,8 +578,23 @@ def do_build( printer, toolchain, arguments, variant ):
             
                         
     # Clean before the build starts
-    toolchain.clean( clean_pkg, clean_ext, clean_abs )
+    with timeline.span( 'clean', 'clean', '.' ):
+        toolchain.clean( clean_pkg, clean_ext, clean_abs, blddir=clean_pkg or clean_ext or clean_abs )
+
+    # Compile the precompiled header (before any C++ files are compiled)
+    if ( bld_libs or bld_prj or single_dir != None ):
+        with timeline.span( 'pch', 'precompiled header', '.' ):
+            toolchain.build_pch( arguments )
     
+    # All of the work is scheduled as jobs (the jobs with the longest estimated duration are started first)
+    lib_jobs  = []
+    prj_jobs  = []
+    estimator = history.CostEstimator( get_history_variant( arguments, variant ) )
+
+    # Build a single directory
+    if ( single_dir != None ):
+        lib_jobs.append( add_directory_jobs( sched, printer, arguments, toolchain, estimator, single_dir[0], single_dir[1] ) )
+
     # Build libdirs.b
     stopped = False
     if ( bld_libs ):
@@ -374,77 +644,116 @@ def do_build( printer, toolchain, arguments, variant ):
 
         # Build directories    
         if ( build != None ):
-            # Build one directory at time
-            if ( arguments['-1'] or not arguments['--turbo'] ):
-                for d in build:
-                    process_entry_build_directory( printer, arguments, toolchain, d[0], d[1], NQBP_PKG_ROOT(), NQBP_WORK_ROOT(), NQBP_WRKPKGS_DIRNAME(), NQBP_PRJ_DIR(), NQBP_PRE_PROCESS_SCRIPT(), NQBP_PRE_PROCESS_SCRIPT_ARGS() )
-
-            # Build multiple directories at the same time (limited to building at most 2 directories at a time)
-            else:
-                # Housekeeping
-                max     = len(build)
-                index   = 0
-                busy    = 0
-                cpus    = multiprocessing.cpu_count() // 2 + 1 
-                handles = []
-                for h in range(0,cpus):
-                    handles.append( None )
-
-                # Process 'n' directories at a time
-                while( index < max or busy > 0 ):
-                    # Start multiple processes
-                    for i in range(0, cpus):
-                        if ( handles[i] == None and index < max ):
-                            d,e        = build[index]
-                            index     += 1
-                            busy      += 1
-                            handles[i] = Process(target=process_entry_build_directory, args=(printer, arguments, toolchain, d, e, NQBP_PKG_ROOT(), NQBP_WORK_ROOT(), NQBP_WRKPKGS_DIRNAME(), NQBP_PRJ_DIR(), NQBP_PRE_PROCESS_SCRIPT(), NQBP_PRE_PROCESS_SCRIPT_ARGS() ))
-                            handles[i].start()
-
-                    # Poll for processes being done
-                    for i in range(0, cpus):
-                        if ( handles[i] != None and not handles[i].is_alive() ):
-                            if ( handles[i].exitcode != 0 ):
-                                exit( handles[i].exitcode )
-                            handles[i] = None
-                            busy      -= 1
-
-                    # sleep for 10ms before polling to see if a process has completed
-                    if ( busy >= cpus ):
-                        time.sleep( 0.010 )
-
+            for d in build:
+                lib_jobs.append( add_directory_jobs( sched, printer, arguments, toolchain, estimator, d[0], d[1] ) )
     
     # Build project dir
     if ( bld_prj and not stopped ):
-        # Banner 
-        printer.output( "=====================" )
-        printer.output( "= Building Project Directory:" )
+        prj_jobs.append( add_project_jobs( sched, printer, arguments, toolchain, estimator ) )
     
-        # Check/run the PreProcessing script
-        utils.run_pre_processing_script( printer, NQBP_PRJ_DIR(), NQBP_WORK_ROOT(), NQBP_PKG_ROOT(), NQBP_PRJ_DIR(), NQBP_PRE_PROCESS_SCRIPT(), NQBP_PRE_PROCESS_SCRIPT_ARGS(),  verbose=arguments['-v'] )
-        
-        # check for existing 'sources.b' file 
-        files = utils.get_files_to_build( printer, toolchain, '.', NQBP_NAME_SOURCES() )
-
-        # compile files
-        for f in files:
-            toolchain.cc( arguments, '.' + os.sep + f )
-    
-    # Peform link
+    # Peform link (after all directories have been built)
     if ( do_link ):
-       inf = open( NQBP_NAME_LIBDIRS(), 'r' )
-       link_libdirs = toolchain.pre_link( arguments, inf, 'local', variant )
-       inf.close()
-       
-       toolchain.link( arguments, link_libdirs, 'local', variant )
-                            
-    # Output end banner
-    end_banner(printer, toolchain)
+        sched.add_job( scheduler.Job( 'link', link_project, (printer, arguments, toolchain, variant), main_thread=True, category='link', dir='.' ), lib_jobs + prj_jobs )
+    return True
      
            
-# Internal helper method to invoke building a single directory
-def process_entry_build_directory( printer, arguments, toolchain, dir, entry, pkg_root, work_root, pkgs_dirname, prj_dirname, preprocess_script, preprocess_args ):
-    build_single_directory( printer, arguments, toolchain, dir, entry, pkg_root, work_root, pkgs_dirname, prj_dirname, preprocess_script, preprocess_args )
+#-----------------------------------------------------------------------------
+# Extensions of the files (in addition to the toolchain's assembler files) that trigger a rebuild in watch mode
+WATCH_EXTENSIONS = [ 'c', 'cpp', 'cc', 'cxx', 'h', 'hpp', 'hh', 'hxx', 'inc' ]
+
+def watch_and_build( printer, toolchain, arguments ):
+    """ Builds the selected variant(s) and then incrementally re-builds them
+        every time a watched file changes (until Ctrl-C is pressed)
+    """
+    # All builds are incremental builds (i.e. the dependency files are generated)
+    arguments['--incremental'] = True
+    watcher = watch.create_watcher( WATCH_EXTENSIONS + toolchain.get_asm_extensions() + [NQBP_NAME_LIBDIRS(), NQBP_NAME_SOURCES()] )
+    try:
+        while( True ):
+            # A failed build does NOT stop watching
+            try:
+                build_variants( printer, toolchain, arguments )
+            except SystemExit as e:
+                if ( e.code != None and not isinstance( e.code, int ) ):
+                    printer.output( str(e.code) )
+
+            # Changes made while building (e.g. the sources generated by pre-processing scripts) do NOT trigger a rebuild
+            watcher.update( get_watch_dirs( toolchain ) )
+            watcher.discard()
+            printer.output( "= Watching {} directories for changes (press Ctrl-C to exit)...".format( watcher.get_num_dirs() ) )
+            printer.flush()
+            changes = watcher.wait()
+            printer.output( "= Changed: {}".format( ' '.join( [ os.path.basename(f) for f in changes ] ) ) )
+
+    except KeyboardInterrupt:
+        printer.output( "= Stopped watching" )
+    finally:
+        watcher.close()
+
+def get_watch_dirs( toolchain ):
+    """ Returns the list of directories to watch, i.e. the source directories
+        of the current libdirs.b list, the directories of the header files
+        listed in the dependency files of their object directories, and the
+        project directory.  Generated header files (i.e. in a sub-directory of
+        the project directory) are not watched
+    """
+    dirs = [ NQBP_PRJ_DIR() ]
+    gen  = os.path.join( NQBP_PRJ_DIR(), '' )
+    for d, entry in toolchain.libdirs:
+        srcpath, display, dir = utils.derive_src_path( NQBP_PKG_ROOT(), NQBP_WORK_ROOT(), NQBP_WRKPKGS_DIRNAME(), entry, d )
+        objdir                = os.path.join( toolchain.get_obj_root(), dir[0] )
+        dirs.append( os.path.abspath( srcpath ) )
+        if ( os.path.isdir( objdir ) ):
+            for f in utils.dir_list_filter_by_ext( objdir, [toolchain._depfile_ext], derivedDir=True ):
+                for p in depends.parse_depfile( os.path.join( objdir, f ) ) or []:
+                    hdrdir = os.path.dirname( os.path.abspath( os.path.join( objdir, p ) ) )
+                    if ( not hdrdir.startswith( gen ) ):
+                        dirs.append( hdrdir )
+
+    # Remove duplicates (but keep the order)
+    return list( dict.fromkeys( dirs ) )
+
+#-----------------------------------------------------------------------------
+def get_num_jobs( arguments ):
+    if ( arguments['-1'] ):
+        return 1
+    if ( arguments['--jobs'] != None ):
+        try:
+            return max( 1, int(arguments['--jobs']) )
+        except ValueError:
+            sys.exit( "ERROR: Invalid --jobs value ({})".format( arguments['--jobs'] ) )
+    return multiprocessing.cpu_count()
+
+def get_build_jobs( printer, toolchain, arguments ):
+    # Limit the parallelism when the compiler crashed in previous builds (see crash.py)
+    num_jobs = get_num_jobs( arguments )
+    limit    = toolchain.get_crash_stability().get_max_jobs()
+    if ( limit != None and limit < num_jobs ):
+        printer.output( "= Running at most {} concurrent jobs (the compiler crashed in a previous build)".format( limit ) )
+        return limit
+    return num_jobs
+
+def get_throttle( printer, arguments ):
+    # Nothing to throttle for a serial build.  Remote compiles use (almost) no local memory/CPU
+    if ( arguments['--fixed-jobs'] or arguments['--remote'] or get_num_jobs( arguments ) == 1 ):
+        return None
+    return throttle.Throttle( printer )
+
+# Internal helper method to link the project
+def link_project( printer, arguments, toolchain, variant ):
+    inf = open( NQBP_NAME_LIBDIRS(), 'r' )
+    link_libdirs = toolchain.pre_link( arguments, inf, 'local', variant )
+    inf.close()
+   
+    # Skip the link (and all post-link steps) when nothing has changed (Note: the link is performed in the object root's '_<variant>' directory, the current working directory is NOT changed)
+    if ( toolchain.is_link_current( arguments, link_libdirs ) ):
+        printer.output( "=====================" )
+        printer.output( "= Link is up-to-date" )
+    else:
+        toolchain.link( arguments, link_libdirs, 'local', variant )
+        toolchain.save_link_manifest( arguments, link_libdirs )
+
+    toolchain.publish_link_outputs()
 
 
 #-----------------------------------------------------------------------------
@@ -492,9 +801,78 @@ def end_banner(printer, toolchain):
     printer.output( '= Toolchain:           {}'.format( toolchain.get_ccname()) )
     printer.output( '= Build Configuration: {}'.format( toolchain.get_build_variant()) )
     printer.output( '= Elapsed Time (hh mm:ss): {:02d} {:02d}:{:02d}'.format(hhh, mm, ss) )
+    if ( toolchain.get_compile_cache() != None ):
+        hits, misses, evictions = toolchain.get_compile_cache().get_stats()
+        printer.output( '= Compile Cache:       {} hits, {} misses, {} evictions'.format(hits, misses, evictions) )
+    if ( toolchain.get_remote_compiler() != None ):
+        compiles, fallbacks = toolchain.get_remote_compiler().get_stats()
+        printer.output( '= Remote Compiles:     {} remote, {} local fallbacks'.format(compiles, fallbacks) )
+    errors, warnings, suppressed = toolchain.get_diagnostics().get_counts()
+    printer.output( '= Diagnostics:         {} errors, {} warnings ({} repeated warnings suppressed)'.format(errors, warnings, suppressed) )
     printer.output( '=' * 80 );
 
     
+#-----------------------------------------------------------------------------
+def get_history_variant( arguments, variant ):
+    return history.get_variant_name( variant, arguments['-g'] )
+
+def list_slowest( printer, variant, count ):
+    try:
+        count = int(count)
+    except ValueError:
+        sys.exit( "ERROR: Invalid --qry-slowest value ({})".format( count ) )
+
+    files, dirs = history.query_slowest( variant, count )
+    printer.output( "= Slowest files (build variant: {}):".format( variant ) )
+    for t, d, f in files:
+        printer.output( "{:>9.3f}s  {}".format( t, os.path.join( d, f ) ) )
+    printer.output( "= Slowest directories (build variant: {}):".format( variant ) )
+    for t, d, n in dirs:
+        printer.output( "{:>9.3f}s  {}  ({} files)".format( t, d, n ) )
+
+def list_regressions( printer, variant ):
+    regressions = history.query_regressions( variant )
+    printer.output( "= Compile time regressions (build variant: {}):".format( variant ) )
+    for kind, d, f, latest, median in regressions:
+        printer.output( "{:>9.3f}s (was {:.3f}s)  {:<7}  {}".format( latest, median, kind, os.path.join( d, f ) ) )
+    if ( len(regressions) == 0 ):
+        printer.output( "= None" )
+
+
+def list_affected( printer, toolchain, graph, name ):
+    for fname in find_graph_files( printer, graph, name ):
+        tus      = graph.get_affected_tus( fname )
+        objects  = [ graph.tus[f][1] for f in tus ]
+        dirs     = list( dict.fromkeys( graph.tus[f][0] for f in tus ) )
+        archives = list( dict.fromkeys( graph.tus[f][2] for f in tus if graph.tus[f][2] != None ) )
+        printer.output( "= Affected by: {}".format( fname ) )
+        printer.output( "= Objects:" )
+        for o in objects:
+            printer.output( "    " + os.path.relpath( o, toolchain.get_obj_root() ) )
+        printer.output( "= Directories:" )
+        for d in dirs:
+            printer.output( "    " + d )
+        printer.output( "= Archives:" )
+        for a in archives:
+            printer.output( "    " + os.path.relpath( a, toolchain.get_obj_root() ) )
+        printer.output( "= {} objects, {} directories, {} archives{}".format( len(objects), len(dirs), len(archives), " (requires a link)" if len(objects) > 0 else "" ) )
+
+def list_includers( printer, graph, name ):
+    for fname in find_graph_files( printer, graph, name ):
+        tus = [ f for f in graph.get_affected_tus( fname ) if f != fname ]
+        printer.output( "= Translation units that include: {}".format( fname ) )
+        for f in tus:
+            printer.output( "    " + f )
+        printer.output( "= {} translation units".format( len(tus) ) )
+
+def find_graph_files( printer, graph, name ):
+    # A file that is not in the include graph is NOT used by the project (i.e. nothing is affected)
+    files = graph.find_files( name )
+    if ( len(files) == 0 ):
+        printer.output( "= Not used by the project: {}".format( name ) )
+    return files
+
+
 #-----------------------------------------------------------------------------
 def build_single_file( printer, arguments, toolchain ):
 
@@ -520,13 +898,16 @@ def build_single_file( printer, arguments, toolchain ):
         
     # create object directory 
     if ( is_project_dir ):
-        dir = os.getcwd()
+        dir = utils.create_subdirectory( printer, toolchain.get_obj_root(), '' )
     else:
-        dir = utils.create_subdirectory_from_file( printer, os.getcwd(), fname )
+        dir = utils.create_subdirectory_from_file( printer, toolchain.get_obj_root(), fname )
     
     # call toolchain compile method
+    toolchain.build_pch( arguments )
     utils.push_dir( dir )
-    toolchain.cc( arguments, srcpath + fname )
+    with timeline.span( 'compile', fname, dir ):
+        toolchain.cc( arguments, srcpath + fname )
+    toolchain.add_dir_object( '.', fname )
 
     # build archive (when not compiling a file in the project directory)
     if ( not is_project_dir ):
@@ -579,13 +960,214 @@ def filter_dir_list( printer, fulllist, startdir, stopdir ):
     return buildlist, skiplist
 
 #-----------------------------------------------------------------------------
-def build_single_directory( printer, arguments, toolchain, dir, entry, pkg_root, work_root, pkgs_dirname, prj_dirname, preprocess_script, preprocess_args ):
-   
-    srcpath, display, dir = utils.derive_src_path( pkg_root, work_root, pkgs_dirname, entry, dir )
+def add_directory_jobs( sched, printer, arguments, toolchain, estimator, dir, entry ):
+    """ Adds the jobs to build a single directory (i.e. pre-processing, 
+        compiling all of its files, and archiving) to the scheduler.  Returns
+        the job that completes building the directory
+    """
+    srcpath, display, dir = utils.derive_src_path( NQBP_PKG_ROOT(), NQBP_WORK_ROOT(), NQBP_WRKPKGS_DIRNAME(), entry, dir )
+    objdir                = os.path.join( toolchain.get_obj_root(), dir[0] )
+    histdir               = os.path.normpath( dir[0] )
+    cost                  = estimator.get_dir_cost( histdir, srcpath, get_source_extensions( toolchain ) )
+    prep                  = scheduler.Job( display, prepare_directory, (printer, arguments, toolchain, srcpath, display, dir, entry), category='prepare', dir=display, priority=cost )
+    archive               = scheduler.Job( display + ' (archive)', archive_directory, (arguments, toolchain, objdir, [], {}), category='archive', dir=display, priority=cost )
+
+    # Compile the files once the source list is known
+    def add_compile_jobs( job ):
+        files, batches = split_unity_batches( arguments, job.result )
+        remove_stale_unity_files( toolchain, objdir, len(batches) )
+        names        = files + [ '{}{}.{}'.format( UNITY_PREFIX, i, t ) for i, (t, b) in enumerate( batches ) ]
+        objects      = {}
+        archive.args = (arguments, toolchain, objdir, names, objects)
+        for f in files:
+            fname = srcpath + os.sep + f
+            add_compile_job( sched, printer, toolchain, scheduler.Job( f, toolchain.cc, (arguments, fname, objdir), category='compile', dir=display, priority=estimator.get_file_cost( histdir, fname ), memory=estimator.get_file_memory( histdir, fname ) ), [job], archive, objects )
+        for i, (file_type, batch) in enumerate( batches ):
+            name = '{}{}.{}'.format( UNITY_PREFIX, i, file_type )
+            cost = sum( estimator.get_file_cost( histdir, os.path.join( srcpath, f ) ) for f in batch )
+            add_compile_job( sched, printer, toolchain, scheduler.Job( name, compile_unity_batch, (printer, arguments, toolchain, srcpath, objdir, name, batch), category='compile', dir=display, priority=cost, memory=estimator.get_file_memory( histdir, name ) ), [job], archive, objects )
+
+    prep.on_done = add_compile_jobs
+    sched.add_job( prep )
+    sched.add_job( archive, [prep] )
+    return archive
+
+def add_project_jobs( sched, printer, arguments, toolchain, estimator ):
+    """ Adds the jobs to compile the project directory to the scheduler.  
+        Returns the job that completes building the directory
+    """
+    cost = estimator.get_dir_cost( '.', NQBP_PRJ_DIR(), get_source_extensions( toolchain ) )
+    prep = scheduler.Job( 'project', prepare_project_directory, (printer, arguments, toolchain), category='prepare', dir='.', priority=cost )
+    done = scheduler.Job( 'project (done)', set_dir_objects, (toolchain, toolchain.get_obj_root(), [], {}), category='prepare', dir='.' )
+
+    # Compile the files once the source list is known
+    def add_compile_jobs( job ):
+        objects   = {}
+        done.args = (toolchain, toolchain.get_obj_root(), job.result, objects)
+        for f in job.result:
+            src  = os.path.join( os.path.relpath( NQBP_PRJ_DIR(), toolchain.get_obj_root() ), f )
+            cost = estimator.get_file_cost( '.', os.path.join( NQBP_PRJ_DIR(), f ) )
+            add_compile_job( sched, printer, toolchain, scheduler.Job( f, toolchain.cc, (arguments, src, toolchain.get_obj_root()), category='compile', dir='.', priority=cost, memory=estimator.get_file_memory( '.', f ) ), [job], done, objects )
+
+    prep.on_done = add_compile_jobs
+    sched.add_job( prep )
+    sched.add_job( done, [prep] )
+    return done
+
+def add_compile_job( sched, printer, toolchain, job, deps, dependent, objects, levels=None ):
+    """ Adds the compile 'job' (that 'dependent' depends on) to the 
+        scheduler.  When the job completes, the source files whose objects
+        it produced are stored in 'objects' (key: job name), i.e. the job's
+        result or, when the job has no result, the job's source file.  When 
+        the compiler crashes, the compile is retried with fewer concurrent 
+        jobs (see crash.get_retry_levels())
+    """
+    if ( levels == None ):
+        levels = crash.get_retry_levels( sched.get_num_slots() )
+    func, args = job.func, job.args
+    job.func   = run_compile
+    job.args   = (printer, func, args, len(levels) > 0)
+
+    def retry_on_crash( j ):
+        if ( j.result != crash.CRASHED ):
+            objects[j.name] = j.result if j.result != None else [j.name]
+            if ( j.max_parallel != None ):
+                toolchain.get_crash_stability().crashed( j.max_parallel )
+            return
+        printer.output( "= Retrying {} with at most {} concurrent job(s)".format( j.name, levels[0] ) )
+        retry = scheduler.Job( j.name, func, args, category=j.category, dir=j.dir, priority=j.priority, memory=j.memory, max_parallel=levels[0] )
+        add_compile_job( sched, printer, toolchain, retry, [], dependent, objects, levels[1:] )
+
+    job.on_done = retry_on_crash
+    sched.add_job( job, deps )
+    sched.add_dependency( dependent, job )
+
+def set_dir_objects( toolchain, objdir, names, objects ):
+    """ Records (in the build manifest) the objects that the compile jobs
+        'names' (in order) produced, see add_compile_job()
+    """
+    toolchain.set_dir_objects( objdir, [ f for n in names for f in objects.get( n, [] ) ] )
+
+def archive_directory( arguments, toolchain, objdir, names, objects ):
+    set_dir_objects( toolchain, objdir, names, objects )
+    toolchain.ar( arguments, objdir )
+
+def run_compile( printer, func, args, can_retry ):
+    # Returns crash.CRASHED (instead of failing) when the compiler crashed and the compile can be retried
+    try:
+        return func( *args )
+    except crash.CompilerCrash:
+        if ( can_retry ):
+            return crash.CRASHED
+        printer.output("=")
+        printer.output("= Build Failed: compiler crashed")
+        printer.output("=")
+        raise
+
+def get_source_extensions( toolchain ):
+    return ['c', 'cpp'] + toolchain.get_asm_extensions()
 
-    # Banner 
+#-----------------------------------------------------------------------------
+# Base file name of the generated unity files
+UNITY_PREFIX = 'nqbp_unity_'
+
+def get_unity_size( arguments ):
+    """ Returns the maximum number of files of a unity batch (None when unity
+        builds are not enabled)
+    """
+    if ( arguments['--unity'] == None ):
+        return None
+    try:
+        size = int( arguments['--unity'] )
+    except ValueError:
+        size = 0
+    if ( size < 1 ):
+        sys.exit( "ERROR: Invalid --unity value ({}), must be a positive integer".format( arguments['--unity'] ) )
+    return size
+
+def split_unity_batches( arguments, files ):
+    """ Returns a tuple (files, batches) where 'files' is the list of files
+        to compile individually and 'batches' is a list of (file_type, 
+        files) unity batches
+    """
+    size = get_unity_size( arguments )
+    if ( size == None ):
+        return files, []
+
+    # Batch the C and C++ files separately (all other files are compiled individually)
+    single  = [ f for f in files if not f.endswith('.c') and not f.endswith('.cpp') ]
+    batches = []
+    for file_type in ( 'c', 'cpp' ):
+        group = [ f for f in files if f.endswith( '.' + file_type ) ]
+        for i in range( 0, len(group), size ):
+            batch = group[i:i+size]
+            if ( len(batch) > 1 ):
+                batches.append( (file_type, batch) )
+            else:
+                single.extend( batch )
+
+    return single, batches
+
+def remove_stale_unity_files( toolchain, objdir, num_batches ):
+    """ Removes the unity files (and their derived files) of the batches 
+        that are no longer used, i.e. from a previous build
+    """
+    if ( not os.path.isdir( objdir ) ):
+        return
+    for f in os.listdir( objdir ):
+        if ( f.startswith( UNITY_PREFIX ) ):
+            index = f[len(UNITY_PREFIX):].split('.')[0]
+            if ( not index.isdigit() or int(index) >= num_batches ):
+                utils.delete_file( os.path.join( objdir, f ) )
+
+def compile_unity_batch( printer, arguments, toolchain, srcpath, objdir, name, batch ):
+    """ Compiles a unity batch.  When the unity file fails to compile, the
+        files are compiled individually.  Returns the list of the source 
+        files whose objects were produced (i.e. the unity file or the batch)
+    """
+    fname   = os.path.join( objdir, name )
+    content = ''.join( [ '#include "{}"\n'.format( os.path.join( srcpath, f ).replace( '\\', '/' ) ) for f in batch ] )
+    utils.write_file_if_changed( fname, content )
+    printer.verbose( "= Unity batch {}: {}".format( name, ' '.join( batch ) ) )
+
+    # Compile the batch (but discard its output and diagnostics when it fails)
+    success = False
+    printer.begin_capture()
+    try:
+        toolchain.cc( arguments, fname, objdir, report_failure=False )
+        success = True
+    except SystemExit as e:
+        success = e.code == None or e.code == 0
+    finally:
+        printer.end_capture( discard=not success )
+
+    # Remove the object files of the individual files (i.e. from a previous non-unity build)
+    if ( success ):
+        for f in batch:
+            remove_object_files( toolchain, objdir, f )
+        return [name]
+
+    # Fall back to compiling the files one at a time
+    printer.output( "= Unity build failed for: {} (compiling the files individually)".format( ' '.join( batch ) ) )
+    remove_object_files( toolchain, objdir, name )
+    for f in batch:
+        toolchain.cc( arguments, srcpath + os.sep + f, objdir )
+    return list( batch )
+
+def remove_object_files( toolchain, objdir, fname ):
+    basename = os.path.splitext( os.path.basename( fname ) )[0]
+    for ext in ( toolchain._obj_ext, toolchain._depfile_ext, NQBP_CMD_SIGNATURE_EXT(), NQBP_DIAGNOSTICS_EXT() ):
+        utils.delete_file( os.path.join( objdir, basename + '.' + ext ) )
+
+#-----------------------------------------------------------------------------
+def prepare_directory( printer, arguments, toolchain, srcpath, display, dir, entry ):
+    """ Creates the object directory, runs the pre-processing script, and 
+        returns the list of source files to build for the directory
+    """
+
+    # Banner (includes the variant when building all variants at the same time)
     printer.output( "=====================" )
-    printer.output( "= Building Directory: " + display )
+    printer.output( "= Building Directory: " + display + get_variant_label( arguments, toolchain ) )
 
     # Debug info
     printer.debug( "#   entry  = {}".format( entry ) )
@@ -601,39 +1183,27 @@ def build_single_directory( printer, arguments, toolchain, dir, entry, pkg_root,
         sys.exit(1)
         
     # create object directory 
-    d = utils.create_subdirectory( printer, os.getcwd(), dir[0] )
-    utils.push_dir( d )
+    d = utils.create_subdirectory( printer, toolchain.get_obj_root(), dir[0] )
 
     # Check/run the PreProcessing script
-    utils.run_pre_processing_script( printer, srcpath, work_root, pkg_root, prj_dirname, preprocess_script, preprocess_args, verbose=arguments['-v'] )
+    utils.run_pre_processing_script( printer, srcpath, NQBP_WORK_ROOT(), NQBP_PKG_ROOT(), NQBP_PRJ_DIR(), NQBP_PRE_PROCESS_SCRIPT(), NQBP_PRE_PROCESS_SCRIPT_ARGS(), verbose=arguments['-v'], cwd=d )
 
     # Get/Construct the source file list and filter it (if needed) for the specified directory
-    files = utils.get_and_filter_files_to_build( printer, toolchain, dir, srcpath, NQBP_NAME_SOURCES() )
-    
-    # compile using a single process
-    if ( arguments['-1'] ):
-        for f in files:
-            process_entry_cc( toolchain, arguments, srcpath + os.sep + f )
+    return utils.get_and_filter_files_to_build( printer, toolchain, dir, srcpath, NQBP_NAME_SOURCES() )
 
-    # compile files using multiple processes (one process per file)
-    else:
-        p = []
-        for f in files:
-            hdl = Process(target=process_entry_cc, args=(toolchain, arguments, srcpath + os.sep + f))
-            p.append( hdl )
-            hdl.start()
-            
-        # Wait for all files to be compiled and exit if there was an error
-        for f in p:
-            f.join()
-            if ( f.exitcode != 0 ):
-                exit( f.exitcode )
-        
-    # build archive
-    toolchain.ar( arguments )
-    utils.pop_dir()
+def get_variant_label( arguments, toolchain ):
+    return " ({})".format( toolchain.get_build_variant() ) if arguments['--bld-all'] else ''
 
-# Internal helper method to invoke the CC operation on my toolchain
-def process_entry_cc( toolchain, arguments, path ):
-    toolchain.cc( arguments, path )
-        
+def prepare_project_directory( printer, arguments, toolchain ):
+    """ Runs the pre-processing script and returns the list of source files 
+        to build for the project directory
+    """
+    # Banner 
+    printer.output( "=====================" )
+    printer.output( "= Building Project Directory:" + get_variant_label( arguments, toolchain ) )
+
+    # Check/run the PreProcessing script
+    utils.run_pre_processing_script( printer, NQBP_PRJ_DIR(), NQBP_WORK_ROOT(), NQBP_PKG_ROOT(), NQBP_PRJ_DIR(), NQBP_PRE_PROCESS_SCRIPT(), NQBP_PRE_PROCESS_SCRIPT_ARGS(),  verbose=arguments['-v'], cwd=NQBP_PRJ_DIR() )
+    
+    # check for existing 'sources.b' file 
+    return utils.get_files_to_build( printer, toolchain, NQBP_PRJ_DIR(), NQBP_NAME_SOURCES() )
@@ -23,6 +23,22 @@ def NQBP_VERSION():
 def NQBP_TEMP_EXT():
     return '_temp_nqbp'
 
+#
+def NQBP_CMD_SIGNATURE_EXT():
+    return 'cmd_nqbp'
+
+#
+def NQBP_DIAGNOSTICS_EXT():
+    return 'diag_nqbp'
+
+#
+def NQBP_STATE_DIRNAME():
+    return '.nqbp'
+
+#
+def NQBP_LINK_MANIFEST():
+    return 'link_manifest.nqbp'
+
 #
 def NQBP_NAME_LIBDIRS():
     return 'libdirs.b'
@@ -1,33 +1,79 @@
 #!/usr/bin/python3
-"""Output class"""
+"""Output class
+
+All output is written to the console and the log file by a single writer
+thread that keeps the log file open.  A thread can 'capture' its output,
+i.e. buffer its output and hand the buffered output to the writer thread as
+a single block.  This guarantees that the output of a job (e.g. the
+diagnostics from compiling a single file) is NOT interleaved with the
+output of other concurrent jobs.
+
+The output of a tool (e.g. the compiler's diagnostics) is 'streamed', i.e.
+output line by line as it arrives.  The first capturing thread that streams
+becomes the owner of the output until its capture ends, i.e. the owner's
+output is written immediately and the output blocks of all other threads
+are held back until the owner's capture ends.
+"""
 
 import os
-import multiprocessing
+import sys
+import queue
+import atexit
+import threading
 from . import utils
 
 
+# Printers that have not been closed
+_printers = []
+
+
 class Printer:
     def __init__(self, mutex=None, log_file_name='make.log', start_new_file=False):
         self.fname = log_file_name
-        self.mutex = mutex
+        self.mutex = mutex          # Not used. Retained for backwards compatibility
         self.verbose_on = False
         self.debug_on = False
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._logfile = None
+        self._lock = threading.Lock()
+        self._owner = None          # Thread that owns the output (see stream())
+        self._held = []             # Output blocks held back while another thread owns the output
 
         # Create an empty file when asked
         if (start_new_file):
             open(self.fname, 'w').close()
 
+        # Start the writer thread
+        self._writer = threading.Thread(target=self._write_blocks, daemon=True)
+        self._writer.start()
+        _printers.append(self)
+
     def remove_log_file(self):
+        self._sync(self._close_log)
         utils.delete_file(self.fname)
 
     def output(self,line):
-        self.mutex.acquire()
-        print(line)
-        with open(self.fname, 'a') as f:
-            f.write(line)
-            f.write(os.linesep)
-        f.close()
-        self.mutex.release()
+        captures = getattr(self._local, 'captures', None)
+        if (captures):
+            captures[-1].append(line)
+            if (len(captures) == 1 and self._owner == threading.get_ident()):
+                self._stream_buffer(captures[0])
+        else:
+            self._put(line)
+
+    def stream(self, line):
+        """ Outputs a line of a tool's output immediately (when no other
+            thread owns the output).  Output of a nested capture is NOT
+            streamed, i.e. it can still be discarded
+        """
+        captures = getattr(self._local, 'captures', None)
+        if (captures):
+            captures[-1].append(line)
+            if (len(captures) == 1):
+                self._stream_buffer(captures[0])
+        else:
+            self._put(line)
 
     def verbose(self, line):
         if (self.verbose_on):
@@ -36,11 +82,136 @@ class Printer:
     def debug(self, line):
         if (self.debug_on):
             self.output(line)
-    
+
     def enable_debug(self):
         self.debug_on = True
-    
+
     def enable_verbose(self):
         self.verbose_on = True
-    
 
+    def begin_capture(self):
+        """ Starts buffering the output of the calling thread.  Captures can
+            be nested
+        """
+        captures = getattr(self._local, 'captures', None)
+        if (captures == None):
+            captures = self._local.captures = []
+        captures.append([])
+
+    def end_capture(self, discard=False):
+        """ Stops buffering the output of the calling thread and outputs the
+            buffered output as a single block (or hands it to the enclosing
+            capture).  When 'discard' is True, the buffered output is dropped
+        """
+        captures = self._local.captures
+        buffer   = captures.pop()
+        if (discard):
+            buffer = []
+        if (captures):
+            captures[-1].extend(buffer)
+            if (len(captures) == 1 and len(buffer) > 0 and self._owner == threading.get_ident()):
+                self._stream_buffer(captures[0])
+            return
+
+        # Release the ownership of the output (and output the held back blocks)
+        with self._lock:
+            if (len(buffer) > 0):
+                self._put_locked('\n'.join(buffer))
+            if (self._owner == threading.get_ident()):
+                self._owner = None
+                for b in self._held:
+                    self._queue.put(b)
+                self._held = []
+
+    def flush(self):
+        """ Blocks until all pending output has been written"""
+        self._sync(None)
+
+    def close(self):
+        """ Writes all pending output and stops the writer thread"""
+        with self._lock:
+            self._owner = None
+            for b in self._held:
+                self._queue.put(b)
+            self._held = []
+        if (self._writer.is_alive()):
+            self._queue.put(None)
+            self._writer.join()
+        self._close_log()
+        if (self in _printers):
+            _printers.remove(self)
+
+    #--------------------------------------------------------------------------
+    def _stream_buffer(self, buffer):
+        # Takes the ownership of the output (if possible) and outputs the buffered lines
+        with self._lock:
+            if (self._owner == None):
+                self._owner = threading.get_ident()
+            if (self._owner == threading.get_ident()):
+                self._queue.put('\n'.join(buffer))
+                buffer.clear()
+
+    def _put(self, block):
+        with self._lock:
+            self._put_locked(block)
+
+    def _put_locked(self, block):
+        if (self._owner != None and self._owner != threading.get_ident()):
+            self._held.append(block)
+        else:
+            self._queue.put(block)
+
+    def _sync(self, func):
+        # Execute 'func' in the writer thread once all pending output has been written
+        if (not self._writer.is_alive()):
+            if (func != None):
+                func()
+            return
+
+        done = threading.Event()
+        self._queue.put((func, done))
+        done.wait()
+
+    def _close_log(self):
+        if (self._logfile != None):
+            self._logfile.close()
+            self._logfile = None
+
+    def _write_blocks(self):
+        while (True):
+            block = self._queue.get()
+            if (block == None):
+                self._flush_streams()
+                return
+
+            # Synchronization request
+            if (isinstance(block, tuple)):
+                self._flush_streams()
+                func, done = block
+                if (func != None):
+                    func()
+                done.set()
+                continue
+
+            sys.stdout.write(block + '\n')
+            if (self._logfile == None):
+                self._logfile = open(self.fname, 'a')
+            self._logfile.write(block + '\n')
+
+            # Only flush when there is no more pending output
+            if (self._queue.empty()):
+                self._flush_streams()
+
+    def _flush_streams(self):
+        sys.stdout.flush()
+        if (self._logfile != None):
+            self._logfile.flush()
+
+
+#------------------------------------------------------------------------------
+def close_all():
+    """ Writes all pending output and stops the writer thread of all printers"""
+    for p in list(_printers):
+        p.close()
+
+atexit.register(close_all)
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+"""In-process pre-processing scripts
+
+By default a directory's pre-processing script (see NQBP_PRE_PROCESS_SCRIPT)
+is executed as a separate process.  A python script can opt-in to being
+imported and called in-process (i.e. no interpreter start-up per directory)
+by defining the following module level function:
+
+    def nqbp_run( argv, cwd ):
+        'argv' is the script's command line, i.e. argv[0] is the script and
+        argv[1:] are the standard pre-processing arguments (build|clean,
+        verbose|terse, <workspace-dir>, ...).  'cwd' is the directory that
+        the script would have been executed in.  The current working
+        directory is NOT changed.  Returns the script's exit code (None is
+        the same as 0).  An exception is reported as a failure.
+
+The script can also declare the files it reads and writes.  The 'build'
+step is skipped when all of the outputs exist and are newer than all of the
+inputs (and the script itself).  Relative paths are relative to the
+<current-dir> argument.
+
+    def nqbp_inputs( argv ):    Returns the list of input files
+    def nqbp_outputs( argv ):   Returns the list of output files
+
+Notes:
+    o The script's module level code is executed once when it is imported,
+      i.e. the script MUST use the "if __name__ == '__main__':" idiom for
+      its command line code.  A script is re-imported when it changes.
+    o In-process scripts are executed one at a time.  The script's output
+      (stdout/stderr) is displayed as a single block.
+    o A script is only imported if its file contains 'def nqbp_run('.
+"""
+
+import os
+import re
+import sys
+import threading
+import traceback
+import importlib.util
+
+
+# Imported scripts (key: script path, value: (time stamp, module))
+_modules = {}
+
+# Only one in-process script is executed at a time
+_lock = threading.Lock()
+
+_ENTRY_REGEX = re.compile( r'^def\s+nqbp_run\s*\(', re.MULTILINE )
+
+
+#-----------------------------------------------------------------------------
+def is_in_process_script( script ):
+    """ Returns True if 'script' supports being called in-process"""
+    if ( not script.endswith( '.py' ) ):
+        return False
+    try:
+        with open( script, 'r', errors='replace' ) as f:
+            return _ENTRY_REGEX.search( f.read() ) != None
+    except OSError:
+        return False
+
+
+def is_up_to_date( script, argv ):
+    """ Returns True if the script declares its outputs and all of its
+        outputs are newer than its inputs
+    """
+    module = _import( script )
+    if ( not hasattr( module, 'nqbp_outputs' ) ):
+        return False
+    curdir  = argv[6]
+    outputs = [ os.path.join( curdir, f ) for f in module.nqbp_outputs( argv ) ]
+    inputs  = [ os.path.join( curdir, f ) for f in module.nqbp_inputs( argv ) ] if hasattr( module, 'nqbp_inputs' ) else []
+    if ( len(outputs) == 0 ):
+        return False
+    try:
+        oldest = min( os.stat( f ).st_mtime_ns for f in outputs )
+        newest = max( os.stat( f ).st_mtime_ns for f in inputs + [script] )
+    except OSError:
+        return False
+    return oldest >= newest
+
+
+def run( printer, script, argv, cwd ):
+    """ Executes the script in-process.  Returns the script's exit code"""
+    module = _import( script )
+    with _lock:
+        out = _ScriptOutput( sys.stdout )
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = out
+        try:
+            rc = module.nqbp_run( argv, cwd )
+            rc = 0 if rc == None else rc
+        except SystemExit as e:
+            rc = 0 if e.code == None else e.code
+            if ( not isinstance( rc, int ) ):
+                out.write( str(rc) + '\n' )
+                rc = 1
+        except Exception:
+            out.write( traceback.format_exc() )
+            rc = 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    text = out.getvalue().rstrip()
+    if ( text != '' ):
+        printer.output( text )
+    return rc
+
+
+#-----------------------------------------------------------------------------
+def _import( script ):
+    st    = os.stat( script )
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        entry = _modules.get( script )
+        if ( entry != None and entry[0] == stamp ):
+            return entry[1]
+
+        # Each script gets a unique module name (the scripts in different directories have the same file name)
+        name   = 'nqbp_preprocess_{}'.format( len(_modules) )
+        spec   = importlib.util.spec_from_file_location( name, script )
+        module = importlib.util.module_from_spec( spec )
+        spec.loader.exec_module( module )
+        _modules[script] = (stamp, module)
+        return module
+
+
+class _ScriptOutput:
+    """ Captures the output of the calling thread.  The output of all other
+        threads is passed through to 'stream'
+    """
+    def __init__( self, stream ):
+        self._stream = stream
+        self._owner  = threading.get_ident()
+        self._buffer = []
+
+    def write( self, text ):
+        if ( threading.get_ident() == self._owner ):
+            self._buffer.append( text )
+        else:
+            self._stream.write( text )
+        return len(text)
+
+    def flush( self ):
+        if ( threading.get_ident() != self._owner ):
+            self._stream.flush()
+
+    def isatty( self ):
+        return False
+
+    def getvalue( self ):
+        return ''.join( self._buffer )
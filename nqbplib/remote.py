@@ -0,0 +1,294 @@
+#!/usr/bin/python3
+"""Remote (distributed) compiles
+
+A file is preprocessed locally and the preprocessed source (plus the
+compiler flags that are not preprocessor flags) is sent to a worker daemon
+(see other/nqbp-worker.py) over TCP.  The worker compiles the file and sends
+back the object file and the compiler output.  The file is compiled locally
+when the remote compile fails for ANY reason (worker not reachable,
+timeout, compiler error, etc.).
+
+Only GCC-like compilers are supported.  A worker only executes the
+compilers named in ALLOWED_COMPILERS with the flags that match the
+allow-list of code generation, optimization, debug, language standard, and
+warning flags (see _ALLOWED_FLAGS).  All other flags (e.g. flags that load
+plugins/specs or read/write additional files) and flag values that contain
+a path are rejected, i.e. the file is compiled locally.  Workers should
+ONLY be run on a trusted network.
+
+Message format (both directions): a 4 byte (big endian) length of a JSON
+header, the JSON header, and then a binary payload whose length is specified
+in the header ('size').
+
+ENVIRONMENT VARIABLES
+---------------------
+    NQBP_WORKERS         Comma separated list of workers, e.g.
+                         'buildbox1:7878,buildbox2:7878,127.0.0.1:7879'
+    NQBP_REMOTE_TIMEOUT  Maximum time, in seconds, to wait for a remote
+                         compile. The default is 120
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import socket
+import struct
+import fnmatch
+import tempfile
+import threading
+import subprocess
+import socketserver
+
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT     = 7878
+
+# Compilers (i.e. the base file name) that a worker is allowed to execute
+ALLOWED_COMPILERS = [ 'gcc', 'g++', 'cc', 'c++', 'clang', 'clang++', '*-gcc', '*-g++', 'gcc-*', 'g++-*', 'clang-*', 'clang++-*' ]
+
+# Preprocessor options that are NOT sent to the worker (the second list contains options that have a separate argument)
+_PREPROCESSOR_PREFIXES = [ '-I', '-D', '-U', '-MMD', '-MD', '-MP', '-MF', '-MT', '-MQ', '-include', '-imacros', '-isystem', '-iquote', '-idirafter' ]
+_PREPROCESSOR_WITH_ARG = [ '-I', '-D', '-U', '-MF', '-MT', '-MQ', '-include', '-imacros', '-isystem', '-iquote', '-idirafter' ]
+
+# The (non preprocessor) options that can be compiled remotely
+_ALLOWED_FLAGS = re.compile( r'^(-c|-w|-pipe|-pthread|-ansi|-pedantic|-pedantic-errors|-O[\w]*|-g[\w-]*|-std=[\w+]+|'
+                             r'-W(?![alp],)[\w=+.-]+|-f[\w=+.,-]+|-m[\w=+.,-]+|--param=[\w=+.-]+)$' )
+
+# '-f' options that load code or read/write additional files (the prefix of the option name)
+_DENIED_F_FLAGS = [ '-fplugin', '-fdump-', '-fprofile', '-fauto-profile', '-fcoverage', '-ftest-coverage', '-fopt-info', '-fsave-optimization-record',
+                    '-fcallgraph-info', '-fstack-usage', '-fsanitize-blacklist', '-fsanitize-ignorelist', '-fdiagnostics-format', '-fdebug-prefix-map',
+                    '-ffile-prefix-map', '-fmacro-prefix-map', '-fprofile-prefix-map', '-frandom-seed' ]
+
+# Time (in seconds) that a worker is not used after it failed to respond
+_RETRY_DELAY = 30
+
+# Maximum size of a message header
+_MAX_HEADER = 1024 * 1024
+
+
+#-----------------------------------------------------------------------------
+def get_workers():
+    """ Returns the list of workers, i.e. (host, port), as specified by the environment"""
+    workers = []
+    for w in os.environ.get( 'NQBP_WORKERS', '' ).split( ',' ):
+        w = w.strip()
+        if ( w == '' ):
+            continue
+        host, sep, port = w.rpartition( ':' )
+        try:
+            workers.append( (host, int(port)) if sep != '' else (w, DEFAULT_PORT) )
+        except ValueError:
+            exit( "ERROR: Invalid NQBP_WORKERS entry ({})".format( w ) )
+    return workers
+
+
+def get_timeout():
+    """ Returns the remote compile timeout, in seconds (as specified by the environment)"""
+    timeout = os.environ.get( 'NQBP_REMOTE_TIMEOUT', '120' )
+    try:
+        return float(timeout)
+    except ValueError:
+        exit( "ERROR: Invalid NQBP_REMOTE_TIMEOUT value ({})".format( timeout ) )
+
+
+def make_remote_flags( args ):
+    """ Returns the compiler arguments (excluding the compiler and the file
+        name) to send to a worker, i.e. the preprocessor options are removed.
+        Returns None if the arguments cannot be compiled remotely
+    """
+    flags = []
+    skip  = False
+    for a in args:
+        if ( skip ):
+            skip = False
+        elif ( a in _PREPROCESSOR_WITH_ARG ):
+            skip = True
+        elif ( any( a.startswith( p ) for p in _PREPROCESSOR_PREFIXES ) ):
+            pass
+        elif ( is_allowed_flag( a ) ):
+            flags.append( a )
+        else:
+            return None
+    return flags
+
+
+def is_allowed_flag( flag ):
+    """ Returns True if 'flag' (a non preprocessor option) can be compiled remotely"""
+    if ( _ALLOWED_FLAGS.match( flag ) == None ):
+        return False
+    return not any( flag.startswith( p ) for p in _DENIED_F_FLAGS )
+
+
+def is_allowed_compiler( compiler ):
+    name = os.path.basename( compiler )
+    if ( name.lower().endswith( '.exe' ) ):
+        name = name[:-4]
+    return any( fnmatch.fnmatchcase( name, p ) for p in ALLOWED_COMPILERS )
+
+
+#=============================================================================
+class RemoteCompiler:
+    """ Client that dispatches compiles to the workers (round robin).  A
+        worker that fails to respond is not used for _RETRY_DELAY seconds
+    """
+
+    #-------------------------------------------------------------------------
+    def __init__( self, workers, timeout ):
+        self.workers    = workers
+        self.timeout    = timeout
+        self._lock      = threading.Lock()
+        self._next      = 0
+        self._down      = {}
+        self._remote    = 0
+        self._fallbacks = 0
+
+    #-------------------------------------------------------------------------
+    def compile( self, compiler, flags, file_type, source ):
+        """ Compiles the preprocessed 'source' (bytes) on a worker.  Returns
+            the tuple (object, output) on success, where 'object' is the
+            content of the object file.  Returns None on failure, i.e. the
+            file must be compiled locally
+        """
+        worker = self._select_worker()
+        if ( worker != None and is_allowed_compiler( compiler ) ):
+            header = { 'version':PROTOCOL_VERSION, 'compiler':compiler, 'flags':flags, 'type':file_type }
+            try:
+                with socket.create_connection( worker, timeout=self.timeout ) as sock:
+                    _send_message( sock, header, source )
+                    reply, obj = _recv_message( sock )
+                if ( reply.get( 'returncode' ) == 0 and reply.get( 'error' ) == None ):
+                    with self._lock:
+                        self._remote += 1
+                    return (obj, reply.get( 'output', '' ))
+
+            # Do not use the worker for a while
+            except (OSError, ValueError):
+                with self._lock:
+                    self._down[worker] = time.time() + _RETRY_DELAY
+
+        with self._lock:
+            self._fallbacks += 1
+        return None
+
+    def get_stats( self ):
+        """ Returns the tuple: (remote compiles, local fallbacks)"""
+        with self._lock:
+            return (self._remote, self._fallbacks)
+
+    #-------------------------------------------------------------------------
+    def _select_worker( self ):
+        now = time.time()
+        with self._lock:
+            for i in range( len(self.workers) ):
+                worker     = self.workers[self._next % len(self.workers)]
+                self._next = (self._next + 1) % len(self.workers)
+                if ( self._down.get( worker, 0 ) <= now ):
+                    return worker
+        return None
+
+
+#=============================================================================
+# Worker
+#=============================================================================
+def serve( host, port, max_jobs, log=None ):
+    """ Creates (but does not start) a worker server.  At most 'max_jobs'
+        compiles are executed at the same time.  'log' is an optional
+        function that is called with a message for each request
+    """
+    server = _Server( (host, port), _Handler )
+    server.jobs = threading.Semaphore( max(1, max_jobs) )
+    server.log  = log
+    return server
+
+
+class _Server( socketserver.ThreadingTCPServer ):
+    allow_reuse_address = True
+    daemon_threads      = True
+
+
+class _Handler( socketserver.BaseRequestHandler ):
+    def handle( self ):
+        try:
+            header, source = _recv_message( self.request )
+        except (OSError, ValueError):
+            return
+
+        with self.server.jobs:
+            reply, obj = _compile_request( header, source )
+        if ( self.server.log != None ):
+            self.server.log( "{} {} -> {}".format( self.client_address[0], header.get( 'compiler' ), reply.get( 'error' ) or reply.get( 'returncode' ) ) )
+        try:
+            _send_message( self.request, reply, obj )
+        except OSError:
+            pass
+
+
+def _compile_request( header, source ):
+    # Returns the tuple (reply header, object file content)
+    if ( header.get( 'version' ) != PROTOCOL_VERSION ):
+        return ({ 'error':'unsupported protocol version' }, b'')
+
+    compiler  = header.get( 'compiler', '' )
+    flags     = header.get( 'flags', [] )
+    file_type = header.get( 'type' )
+    if ( not isinstance( flags, list ) or make_remote_flags( flags ) != flags ):
+        return ({ 'error':'unsupported flags' }, b'')
+    if ( file_type not in ( 'c', 'cpp' ) ):
+        return ({ 'error':'unsupported file type' }, b'')
+    if ( not is_allowed_compiler( compiler ) ):
+        return ({ 'error':'compiler not allowed' }, b'')
+
+    # Use the same compiler path as the client (when it exists) otherwise search the PATH
+    if ( not os.path.isfile( compiler ) ):
+        compiler = shutil.which( os.path.basename( compiler ) )
+        if ( compiler == None ):
+            return ({ 'error':'compiler not found' }, b'')
+
+    tmpdir = tempfile.mkdtemp( prefix='nqbp-worker-' )
+    try:
+        src = os.path.join( tmpdir, 'nqbp_remote.' + ('i' if file_type == 'c' else 'ii') )
+        obj = os.path.join( tmpdir, 'nqbp_remote.o' )
+        with open( src, 'wb' ) as f:
+            f.write( source )
+        p = subprocess.run( [compiler] + flags + ['-o', obj, src], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=tmpdir )
+        output = p.stdout.decode( errors='replace' )
+        if ( p.returncode != 0 or not os.path.isfile( obj ) ):
+            return ({ 'returncode':p.returncode if p.returncode != 0 else 1, 'output':output }, b'')
+        with open( obj, 'rb' ) as f:
+            return ({ 'returncode':0, 'output':output }, f.read())
+    except OSError as e:
+        return ({ 'error':str(e) }, b'')
+    finally:
+        shutil.rmtree( tmpdir, True )
+
+
+#-----------------------------------------------------------------------------
+def _send_message( sock, header, payload ):
+    header         = dict( header )
+    header['size'] = len(payload)
+    data           = json.dumps( header ).encode()
+    sock.sendall( struct.pack( '>I', len(data) ) + data )
+    sock.sendall( payload )
+
+
+def _recv_message( sock ):
+    size = struct.unpack( '>I', _recv_exact( sock, 4 ) )[0]
+    if ( size > _MAX_HEADER ):
+        raise ValueError( 'message header too large' )
+    header = json.loads( _recv_exact( sock, size ).decode() )
+    if ( not isinstance( header, dict ) ):
+        raise ValueError( 'invalid message header' )
+    return header, _recv_exact( sock, int( header.get( 'size', 0 ) ) )
+
+
+def _recv_exact( sock, size ):
+    chunks = []
+    while( size > 0 ):
+        chunk = sock.recv( min( size, 1024 * 1024 ) )
+        if ( not chunk ):
+            raise ValueError( 'connection closed' )
+        chunks.append( chunk )
+        size -= len(chunk)
+    return b''.join( chunks )
@@ -0,0 +1,286 @@
+#!/usr/bin/python3
+"""Job scheduler for building (compile, archive, link, etc.)
+
+All of the work for a build is expressed as Jobs in a single dependency
+graph.  Jobs are executed, once all of their dependencies have completed, by
+a bounded pool of worker threads (i.e. 'N' slots).  The worker threads
+launch the compiler/tool processes directly, i.e. there is no intermediate
+Python process per job.
+
+Notes:
+    o A Job has failed when its function raises an exception (including
+      SystemExit with a non-zero exit code, i.e. the function called
+      sys.exit(1)).
+    o The 'on_done' callback of a Job is called (from the thread that called
+      Scheduler.run()) BEFORE any of its dependent jobs are released.  This
+      allows the callback to add new jobs and new dependencies to jobs that
+      have not yet been released.
+    o Jobs flagged as 'main_thread' are executed by the thread that called
+      Scheduler.run(). Use this for jobs that change the current working
+      directory (e.g. the link step).
+    o Jobs MUST NOT change the current working directory unless they are
+      'main_thread' jobs.
+    o The printer output of a job is buffered and output as a single block
+      when the job completes, i.e. the output of concurrent jobs is never
+      interleaved.  Tool output (see utils.run_shell()) is streamed while
+      the job is running (see output.Printer.stream()).
+    o By default the build 'fails fast', i.e. when a job fails all of the
+      running tool processes are killed (see utils.kill_processes()) and
+      the output of the jobs that were cancelled is discarded.  When
+      'keep_going' is set, all jobs that do not depend on a failed job are
+      executed.
+    o Ready jobs are started in 'priority' order, highest first (e.g. the
+      estimated duration of the job, i.e. longest job first).  Jobs with
+      the same priority are started in the order they became ready.
+    o When a 'throttle' is specified, a job is only started when the
+      throttle admits it (see throttle.py), i.e. the number of slots is the
+      upper bound of the number of concurrent jobs.
+    o A job with 'max_parallel' set is only started when less than
+      'max_parallel' jobs are running, and no other job is started while it
+      is running that would exceed its 'max_parallel' limit (e.g. 1 means
+      the job runs by itself).
+"""
+
+import threading
+import queue
+import heapq
+import traceback
+
+#
+from . import timeline
+from . import utils
+from . import throttle
+
+
+#-----------------------------------------------------------------------------
+def is_failure( e, printer=None ):
+    """ Returns True if the SystemExit exception 'e' is a failure.  The message
+        of a sys.exit("message") (i.e. a non-integer exit code) is output via
+        'printer', i.e. the same as when it terminates the script
+    """
+    if ( e.code != None and not isinstance( e.code, int ) and printer != None ):
+        printer.output( str( e.code ) )
+    return e.code != None and e.code != 0
+
+
+#=============================================================================
+class Job:
+    """ A unit of work. 'func' is called with 'args'. The return value of the
+        function is stored in the 'result' member.  'category' and 'dir' are
+        used to label the job in the build timeline.  'memory' is the
+        estimated peak memory (in bytes) of the job (None if unknown).
+        'max_parallel' limits the number of concurrent jobs while the job
+        is running (None: no limit)
+    """
+
+    def __init__( self, name, func, args=(), main_thread=False, on_done=None, category='job', dir=None, priority=0, memory=None, max_parallel=None ):
+        self.name         = name
+        self.priority     = priority
+        self.memory       = memory
+        self.max_parallel = max_parallel
+        self.func         = func
+        self.args         = args
+        self.main_thread  = main_thread
+        self.on_done      = on_done
+        self.category     = category
+        self.dir          = dir
+        self.result       = None
+        self.failed       = False
+        self.done         = False
+        self.slot         = None
+        self._pending     = 0
+        self._dependents  = []
+        self._released    = False
+
+    def run( self, slot, printer=None ):
+        """ Executes the job. Returns True if the job completed successfully.
+            The message of a sys.exit("message") is output via 'printer'
+        """
+        self.slot = slot
+        try:
+            self.result = self.func( *self.args )
+        except SystemExit as e:
+            self.failed = is_failure( e, printer )
+        except Exception:
+            traceback.print_exc()
+            self.failed = True
+
+        return not self.failed
+
+
+#=============================================================================
+class Scheduler:
+    """ Executes a dependency graph of Jobs using at most 'num_slots'
+        concurrent worker threads
+    """
+
+    #-------------------------------------------------------------------------
+    def __init__( self, printer, num_slots, keep_going=False, throttle=None ):
+        self._printer    = printer
+        self._num_slots  = max( 1, num_slots )
+        self._keep_going = keep_going
+        self._throttle   = throttle
+        self._active     = []
+        self._cancelled  = False
+        self._jobs       = []
+        self._ready      = []           # Heap of (-priority, sequence number, job)
+        self._sequence   = 0
+        self._work       = queue.Queue()
+        self._completed  = queue.Queue()
+        self._running    = 0
+        self._failed     = []
+
+    #-------------------------------------------------------------------------
+    def add_job( self, job, deps=[] ):
+        """ Adds 'job' to the graph. The job will not be started until all of
+            the jobs in 'deps' have completed. Returns 'job'
+        """
+        self._jobs.append( job )
+        for d in deps:
+            self.add_dependency( job, d )
+        if ( job._pending == 0 ):
+            self._make_ready( job )
+        return job
+
+    def add_dependency( self, job, dep ):
+        """ Adds 'dep' as dependency of 'job'. 'job' must not have been
+            released yet
+        """
+        if ( job._released ):
+            raise RuntimeError( "Cannot add a dependency to the released job: " + job.name )
+        if ( not dep.done ):
+            job._pending += 1
+            dep._dependents.append( job )
+
+    def get_failed_jobs( self ):
+        return self._failed
+
+    def get_num_slots( self ):
+        return self._num_slots
+
+    #-------------------------------------------------------------------------
+    def run( self ):
+        """ Runs all jobs. Returns True if all jobs completed successfully.
+            When a job fails, no new jobs are started, the running jobs are
+            cancelled, and the method returns once all of the running jobs
+            have exited (unless 'keep_going' is set)
+        """
+        workers = []
+        for i in range( self._num_slots ):
+            t = threading.Thread( target=self._worker, args=(i+1,), daemon=True )
+            t.start()
+            workers.append( t )
+
+        try:
+            while( True ):
+                # Start as many jobs as possible
+                held = False
+                while( not self._cancelled and len(self._ready) > 0 ):
+                    job = self._ready[0][2]
+                    if ( job.main_thread ):
+                        heapq.heappop( self._ready )
+                        self._running += 1
+                        self._execute( job, 0 )
+                    elif ( self._running < self._get_slot_limit( job ) ):
+                        if ( self._throttle != None and not self._throttle.can_start( job, self._active ) ):
+                            held = True
+                            break
+                        heapq.heappop( self._ready )
+                        self._running += 1
+                        self._active.append( job )
+                        self._work.put( job )
+                    else:
+                        break
+
+                # All done
+                if ( self._running == 0 ):
+                    break
+
+                # Wait for a job to complete (re-evaluate a held job periodically)
+                try:
+                    self._job_completed( self._completed.get( timeout=throttle.POLL_INTERVAL if held else None ) )
+                except queue.Empty:
+                    pass
+
+        # Ctrl-C, etc. -->do not leave orphaned tool processes behind
+        except BaseException:
+            self._cancel()
+            raise
+
+        finally:
+            for t in workers:
+                self._work.put( None )
+
+        # All of the killed processes have exited -->allow new processes (e.g. the next build of the daemon)
+        utils.allow_processes()
+
+        return len(self._failed) == 0 and all( j.done for j in self._jobs )
+
+    #-------------------------------------------------------------------------
+    def _worker( self, slot ):
+        while( True ):
+            job = self._work.get()
+            if ( job == None ):
+                return
+            self._execute( job, slot )
+
+    def _execute( self, job, slot ):
+        timeline.set_slot( slot )
+        self._printer.begin_capture()
+        discard = False
+        try:
+            with timeline.span( job.category, job.name, job.dir ):
+                job.run( slot, self._printer )
+        finally:
+            # The job 'failed' because it was cancelled -->its output is just noise
+            discard = self._cancelled and job.failed
+            self._printer.end_capture( discard )
+        self._completed.put( job )
+
+    def _job_completed( self, job ):
+        self._running -= 1
+        job.done       = True
+        if ( job in self._active ):
+            self._active.remove( job )
+        if ( job.failed ):
+            self._job_failed( job )
+            return
+
+        if ( job.on_done != None ):
+            try:
+                job.on_done( job )
+            except SystemExit as e:
+                job.failed = is_failure( e, self._printer )
+            except Exception:
+                traceback.print_exc()
+                job.failed = True
+            if ( job.failed ):
+                self._job_failed( job )
+                return
+
+        for d in job._dependents:
+            d._pending -= 1
+            if ( d._pending == 0 ):
+                self._make_ready( d )
+
+    def _get_slot_limit( self, job ):
+        # Returns the number of slots that can be in use when 'job' is started
+        limits = [ j.max_parallel for j in self._active + [job] if j.max_parallel != None ]
+        return min( [self._num_slots] + limits )
+
+    def _job_failed( self, job ):
+        # Jobs that fail after the build was cancelled are casualties, not failures
+        if ( self._cancelled and len(self._failed) > 0 ):
+            return
+        self._failed.append( job )
+        if ( not self._keep_going ):
+            self._cancel()
+
+    def _cancel( self ):
+        self._cancelled = True
+        utils.kill_processes()
+
+    def _make_ready( self, job ):
+        job._released   = True
+        self._sequence += 1
+        heapq.heappush( self._ready, (-job.priority, self._sequence, job) )
@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+"""Memory and load aware admission of compile jobs
+
+The scheduler's slots (--jobs) are the upper bound of the number of
+concurrent jobs.  Before a compile job is started the throttle checks that:
+
+    o The job's expected peak memory (learned from previous builds, see
+      history.py) fits into the memory that is available, i.e. the
+      available memory (MemAvailable) plus the memory currently used by
+      the running jobs' processes, minus the expected peak memory of the
+      running compiles, minus a reserve (NQBP_MEM_RESERVE, in MB, the
+      default is 256MB).
+    o The machine is not oversubscribed, i.e. the load average that is NOT
+      caused by the build (approximated by subtracting the build's recent
+      peak number of running jobs) plus the running jobs is less than the
+      number of CPUs.
+
+A job that does not fit is held until a running job completes or until the
+memory/load changes.  A job is always started when nothing else is running.
+The checks are skipped on platforms that do not provide the information
+(i.e. the memory check requires /proc/meminfo, the load check requires
+os.getloadavg()).
+"""
+
+import os
+import time
+import collections
+
+#
+from . import utils
+
+
+# Time (in seconds) between re-evaluations while a job is held
+POLL_INTERVAL = 0.25
+
+# The expected peak memory of a job is scaled by this factor (i.e. a safety margin)
+MEMORY_MARGIN = 1.1
+
+# Time window (in seconds) over which the build's contribution to the load average is tracked
+LOAD_WINDOW = 60
+
+
+#-----------------------------------------------------------------------------
+def get_reserve():
+    """ Returns the memory (in bytes) that is never used by compile jobs"""
+    try:
+        return int( os.environ.get( 'NQBP_MEM_RESERVE', '256' ) ) * 1024 * 1024
+    except ValueError:
+        return 256 * 1024 * 1024
+
+
+def get_available_memory():
+    """ Returns the available memory in bytes (None if unknown)"""
+    try:
+        with open( '/proc/meminfo', 'r' ) as f:
+            for line in f:
+                if ( line.startswith( 'MemAvailable:' ) ):
+                    return int( line.split()[1] ) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def get_load_average():
+    """ Returns the 1 minute load average (None if unknown)"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+#=============================================================================
+class Throttle:
+    """ Decides if a job can be started (see Scheduler)"""
+
+    #-------------------------------------------------------------------------
+    def __init__( self, printer, reserve=None ):
+        self._printer  = printer
+        self._reserve  = reserve if reserve != None else get_reserve()
+        self._cpus     = os.cpu_count() or 1
+        self._recent   = collections.deque()   # (time, number of running jobs)
+        self._held     = (None, None)          # The held job and the reason
+
+    def can_start( self, job, running ):
+        """ Returns True if 'job' can be started.  'running' is the list of
+            the running jobs
+        """
+        self._track( len(running) )
+        if ( job.category != 'compile' or len(running) == 0 ):
+            return self._admit( job )
+
+        reason = self._check_memory( job, running ) or self._check_load( running )
+        if ( reason == None ):
+            return self._admit( job )
+
+        if ( self._held[0] != job ):
+            self._printer.verbose( "= Throttle: holding {} ({}, {} running)".format( job.name, reason, len(running) ) )
+            self._held = (job, reason)
+        return False
+
+    #-------------------------------------------------------------------------
+    def _admit( self, job ):
+        if ( self._held[0] == job ):
+            self._printer.verbose( "= Throttle: starting {}".format( job.name ) )
+            self._held = (None, None)
+        return True
+
+    def _check_memory( self, job, running ):
+        available = get_available_memory()
+        if ( available == None ):
+            return None
+
+        expected = sum( _get_memory( j ) for j in running if j.category == 'compile' )
+        free     = available + utils.get_processes_rss() - expected - self._reserve
+        needed   = _get_memory( job )
+        if ( needed <= free ):
+            return None
+        return "needs {}MB, {}MB available".format( needed // (1024*1024), max( 0, free ) // (1024*1024) )
+
+    def _check_load( self, running ):
+        load = get_load_average()
+        if ( load == None ):
+            return None
+
+        external = max( 0.0, load - max( n for t, n in self._recent ) )
+        if ( external + len(running) + 1 <= self._cpus ):
+            return None
+        return "load {:.1f} on {} CPUs".format( load, self._cpus )
+
+    def _track( self, num_running ):
+        now = time.time()
+        self._recent.append( (now, num_running) )
+        while( self._recent[0][0] < now - LOAD_WINDOW ):
+            self._recent.popleft()
+
+
+#-----------------------------------------------------------------------------
+def _get_memory( job ):
+    memory = job.memory if job.memory != None else 0
+    return int( memory * MEMORY_MARGIN )
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""Build timeline
+
+Records a 'span' (start time, duration, worker slot, directory) for each
+step of the build and writes the spans as a trace-event JSON file that can
+be opened in a trace viewer (e.g. chrome://tracing or ui.perfetto.dev). The
+trace 'thread id' of a span is the scheduler's worker slot that executed the
+step (slot 0 is the main thread).
+
+Nothing is recorded unless enable() has been called.
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+# Recorded spans (None when the timeline is disabled)
+_events = None
+_lock   = threading.Lock()
+_local  = threading.local()
+_origin = time.perf_counter()
+
+
+#-----------------------------------------------------------------------------
+def enable():
+    """ Starts recording spans"""
+    global _events
+    _events = []
+
+
+def disable():
+    """ Stops recording spans (and discards the recorded spans)"""
+    global _events
+    _events = None
+
+
+def is_enabled():
+    return _events != None
+
+
+def set_slot( slot ):
+    """ Sets the worker slot of the calling thread"""
+    _local.slot = slot
+
+
+def get_slot():
+    return getattr( _local, 'slot', 0 )
+
+
+#-----------------------------------------------------------------------------
+@contextlib.contextmanager
+def span( category, name, dir=None ):
+    """ Context manager that records a span for the enclosed code"""
+    if ( _events == None ):
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span( category, name, start, time.perf_counter(), dir )
+
+
+def add_span( category, name, start, end, dir=None ):
+    """ Records a span. 'start' and 'end' are time.perf_counter() values"""
+    if ( _events == None ):
+        return
+
+    event = { 'name':name, 'cat':category, 'ph':'X', 'pid':os.getpid(), 'tid':get_slot(),
+              'ts':round( (start - _origin) * 1000000 ), 'dur':round( (end - start) * 1000000 ),
+              'args':{ 'dir': dir if dir != None else '' } }
+    with _lock:
+        _events.append( event )
+
+
+#-----------------------------------------------------------------------------
+def write( fname ):
+    """ Writes the recorded spans as a trace-event JSON file"""
+    with _lock:
+        events = list( _events ) if _events != None else []
+
+    # Name the 'threads' after the worker slots
+    pid  = os.getpid()
+    meta = [ { 'name':'process_name', 'ph':'M', 'pid':pid, 'tid':0, 'args':{ 'name':'nqbp' } } ]
+    for slot in sorted( set( e['tid'] for e in events ) | {0} ):
+        label = 'main' if slot == 0 else 'slot {}'.format( slot )
+        meta.append( { 'name':'thread_name', 'ph':'M', 'pid':pid, 'tid':slot, 'args':{ 'name':label } } )
+        meta.append( { 'name':'thread_sort_index', 'ph':'M', 'pid':pid, 'tid':slot, 'args':{ 'sort_index':slot } } )
+
+    with open( fname, 'w' ) as f:
+        json.dump( { 'traceEvents': meta + events, 'displayTimeUnit':'ms' }, f )
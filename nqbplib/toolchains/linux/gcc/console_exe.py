@@ -29,6 +29,10 @@ class ToolChain( base.ToolChain ):
             self._ar       = os.path.join(gcc_bin, 'ar' )  
             self._objcpy   = os.path.join(gcc_bin, 'objcpy')
 
+        # Archive/link options (Note: Archives are incrementally updated by default)
+        #self._ar_thin      = True     # Use GNU 'thin' archives
+        #self._link_objects = True     # Link the object files directly (i.e. no archives)
+
 
         #
         # Build Config/Variant: "xyz"
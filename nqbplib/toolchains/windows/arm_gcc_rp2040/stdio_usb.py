@@ -34,6 +34,7 @@ class ToolChain( base.ToolChain ):
         self._pioasm     = os.path.join( pico_root, 'xsrc', 'pico-sdk', 'tools', 'pioasm.exe' )
         self._asm_ext    = 'asm'    
         self._asm_ext2   = 'S'   
+        self._asm_depfile_option = '-MMD'
 
         self._clean_pkg_dirs.extend( ['_pico'] )
 
@@ -116,6 +117,7 @@ class ToolChain( base.ToolChain ):
         boot_linker_script              = os.path.join( pico_root, 'xsrc', 'pico-sdk', "src", "rp2_common", "boot_stage2", "boot_stage2.ld" )
         boot_obj                        = r'..\xsrc\pico-sdk\src\rp2_common\boot_stage2\compile_time_choice.o'
         self._bootloader_link_flags     = f'{mcu} -O3 -DNDEBUG -Wl,--build-id=none --specs=nosys.specs -nostartfiles -Wl,--script={boot_linker_script} -Wl,-Map=bs2_default.elf.map {boot_obj} -o bs2_default.elf'   
+        self._link_extra_inputs         = [ boot_obj, boot_linker_script ]
         
 
         # 
@@ -286,6 +288,11 @@ class ToolChain( base.ToolChain ):
         utils.pop_dir()
         
 
+    #--------------------------------------------------------------------------
+    def _get_link_signature( self, ld ):
+        # The Boot2 link is part of the link step
+        return base.ToolChain._get_link_signature( self, ld + ' ' + self._bootloader_link_flags )
+
     #--------------------------------------------------------------------------
     def get_asm_extensions(self):
         extlist = [ self._asm_ext, self._asm_ext2 ]
@@ -26,6 +26,7 @@ class ToolChain( base.ToolChain ):
 
         self._asm_ext  = 'asm'    
         self._asm_ext2 = 'S'   
+        self._asm_depfile_option = '-MMD'
 
         # Cache potential error for environment variables not set
         self._env_error = env_error;
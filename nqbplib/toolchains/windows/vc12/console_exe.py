@@ -34,6 +34,17 @@ class ToolChain( base.ToolChain ):
         
         self._validate_cc_options = ''
         
+        self._cc_depfile_option  = '/showIncludes'
+        self._cc_show_includes   = True
+        
+        self._cc_preprocess_option = '/E'
+        self._pch_create_option    = '/Yc"{hdr}" /Fp"{pch}" /Fo"{obj}" "{src}"'
+        self._pch_use_option       = '/Yu"{hdr}" /Fp"{pch}" /FI"{hdr}"'
+        self._pch_ext              = '.pch'
+        self._pch_stub             = True
+        self._pch_link_obj         = True
+        self._remote_file_types    = []
+        
         self._cflag_symdef               = '/D '
         self._asmflag_symdef             = '/D '
         self._cflag_symvalue_delimiter   = '"'
@@ -41,6 +52,7 @@ class ToolChain( base.ToolChain ):
 
         self._ar_library_name = 'library.lib'
         self._ar_options      = '/NOLOGO /OUT:' + self._ar_library_name
+        self._ar_incremental  = False
         
         self._link_lib_prefix       = ''
         self._linker_libgroup_start = ''
@@ -10,6 +10,13 @@ import platform
 import collections
 import fnmatch
 import re
+import json
+import shlex
+import time
+import shutil
+import signal
+import threading
+import concurrent.futures
 
 # Globals
 from .my_globals import NQBP_WORK_ROOT
@@ -24,12 +31,30 @@ from .my_globals import NQBP_PKG_TOP
 from .my_globals import NQBP_WRKPKGS_DIRNAME
 from .my_globals import NQBP_PRE_PROCESS_SCRIPT
 from .my_globals import NQBP_PRE_PROCESS_SCRIPT_ARGS
+from .my_globals import NQBP_STATE_DIRNAME
 from .my_globals import OUT
 
+#
+from . import timeline
+from . import preprocessing
+
 # Module globals
 _dirstack = []
 verbose_mode = False
 
+# Running processes started by popen() (see kill_processes())
+_processes        = set()
+_processes_lock   = threading.Lock()
+_processes_killed = False
+
+# Per thread state (see get_last_peak_rss())
+_local = threading.local()
+
+_PAGE_SIZE = os.sysconf( 'SC_PAGE_SIZE' ) if hasattr( os, 'sysconf' ) else 4096
+
+# Source file lists of get_files_to_build() (key: directory, sources.b file, extensions)
+_files_cache = {}
+
 
 
 #-----------------------------------------------------------------------------
@@ -80,32 +105,176 @@ def walk_file_list( pattern, pkgpath, skipdir=None ):
     return list  
 
 #-----------------------------------------------------------------------------
-def run_shell( printer, cmd, capture_output=True ):
-    p = subprocess.Popen( cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE ) if capture_output else subprocess.Popen( cmd, shell=True ) 
-    r = p.communicate()
-
-    if ( r[0] != None ):
-        line =  r[0].decode().rstrip()
-        if ( line != "" ):
-            printer.output( line )
-            
-    if ( r[1] != None ):
-        line =  r[1].decode().rstrip()
-        if ( line != "" ):
-            printer.output( line )
+def run_shell( printer, cmd, capture_output=True, output_filter=None, cwd=None ):
+    """ Runs 'cmd' and streams its stdout/stderr, line by line as it 
+        arrives, via 'printer'.  When 'output_filter' is not None, each line
+        of output is passed through the filter function before being output.
+        When 'cwd' is not None, the command is run in the 'cwd' directory. 
+        See popen() for how 'cmd' is executed.  The peak memory usage of the
+        command is available via get_last_peak_rss().
+    """
+    with timeline.span( 'tool', _get_tool_name( cmd ), cwd if cwd != None else os.getcwd() ):
+        if ( not capture_output ):
+            p = popen( cmd, cwd=cwd )
+            _wait( p )
+            return p.returncode
+
+        p = popen( cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd )
+        with p.stdout:
+            for raw in p.stdout:
+                line = raw.decode( errors='replace' ).rstrip()
+                if ( output_filter != None ):
+                    line = output_filter( line ).rstrip()
+                if ( line != "" ):
+                    printer.stream( line )
+        _wait( p )
 
     return p.returncode
 
+def get_last_peak_rss():
+    """ Returns the peak resident memory (in bytes) of the most recent
+        command executed by run_shell() in the calling thread, i.e. the
+        largest of the command and its child processes.  Returns None
+        when not supported by the platform
+    """
+    return getattr( _local, 'peak_rss', None )
+
+# Waits for the process to exit (and records its peak memory usage)
+def _wait( p ):
+    _local.peak_rss = None
+    if ( not hasattr( os, 'wait4' ) ):
+        p.wait()
+        return
+
+    pid, status, usage = os.wait4( p.pid, 0 )
+    p.returncode        = os.waitstatus_to_exitcode( status )
+    _local.peak_rss     = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+#
+def get_processes_rss():
+    """ Returns the current resident memory (in bytes) of all running
+        processes started by popen() (including their child processes).
+        Returns 0 when not supported by the platform (Linux only)
+    """
+    with _processes_lock:
+        pids = [ p.pid for p in _processes if p.returncode == None ]
+    total = 0
+    for pid in pids:
+        total += _get_tree_rss( pid )
+    return total
+
+def _get_tree_rss( pid ):
+    try:
+        with open( '/proc/{}/statm'.format( pid ), 'r' ) as f:
+            rss = int( f.read().split()[1] ) * _PAGE_SIZE
+        with open( '/proc/{}/task/{}/children'.format( pid, pid ), 'r' ) as f:
+            children = f.read().split()
+    except (OSError, ValueError, IndexError):
+        return 0
+    return rss + sum( _get_tree_rss( c ) for c in children )
+
+# Returns the name of the program being executed by 'cmd'
+def _get_tool_name( cmd ):
+    words = cmd.split() if isinstance( cmd, str ) else cmd
+    return os.path.basename( words[0].strip('"') ) if len(words) > 0 else ''
+
+#
+def popen( cmd, **kwargs ):
+    """ Starts the command 'cmd'.  When 'cmd' is a string, the command is run
+        via the shell.  When 'cmd' is a list (as returned by split_command()),
+        the program is executed directly, i.e. no shell process is created.
+        The process is started in its own process group (see kill_processes())
+    """
+    shell = isinstance( cmd, str )
+
+    # The Windows arguments retain their original quoting (see split_command())
+    if ( platform.system() == 'Windows' ):
+        if ( not shell ):
+            cmd = ' '.join( cmd )
+        kwargs.setdefault( 'creationflags', subprocess.CREATE_NEW_PROCESS_GROUP )
+    else:
+        kwargs.setdefault( 'start_new_session', True )
+
+    global _processes
+    with _processes_lock:
+        if ( _processes_killed ):
+            sys.exit( 1 )
+        p = subprocess.Popen( cmd, shell=shell, **kwargs )
+        _processes = set( x for x in _processes if x.returncode == None )
+        _processes.add( p )
+    return p
+
+#
+def kill_processes():
+    """ Kills (the process groups of) all processes started by popen() that
+        are still running.  No new processes can be started (i.e. popen()
+        exits) until allow_processes() is called
+    """
+    global _processes_killed
+    with _processes_lock:
+        _processes_killed = True
+        for p in _processes:
+            if ( p.returncode != None ):
+                continue
+            try:
+                if ( platform.system() == 'Windows' ):
+                    subprocess.run( ['taskkill', '/F', '/T', '/PID', str(p.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL )
+                else:
+                    os.killpg( p.pid, signal.SIGKILL )
+            except OSError:
+                pass
+
+def processes_killed():
+    """ Returns True if kill_processes() has been called (and the processes
+        have not been allowed again)
+    """
+    return _processes_killed
+
+def allow_processes():
+    """ Allows popen() to start processes (again)"""
+    global _processes_killed
+    with _processes_lock:
+        _processes_killed = False
+
+#
+def split_command( cmd ):
+    """ Splits the command line 'cmd' into a list of arguments that can be 
+        executed without a shell (see popen()).  Returns None if the command
+        requires a shell, i.e. it contains shell meta characters. Note: On 
+        Windows the arguments retain their quotes because the command line is
+        parsed by the program being executed (not by the shell).
+    """
+    if ( platform.system() == 'Windows' ):
+        if ( re.search( r'[%|&<>^]', cmd ) ):
+            return None
+        return re.findall( r'(?:[^\s"]|"[^"]*")+', cmd )
+
+    if ( re.search( r'[$`|&;<>*?~(){}\[\]!#]', cmd ) ):
+        return None
+    try:
+        return shlex.split( cmd )
+    except ValueError:
+        return None
+
 #
-def run_shell2( cmd, stdout=False, on_err_msg=None ):
+def run_shell2( cmd, stdout=False, on_err_msg=None, cwd=None ):
     """ Alternate semantics use internal 'verbose' flag instead of a printer
     """
 
     print_verbose( cmd )
-    if ( stdout ):
-        p = subprocess.Popen( cmd, shell=True )
+    if ( stdout and sys.stdout is sys.__stdout__ ):
+        p = popen( cmd, cwd=cwd )
+
+    # stdout has been redirected (e.g. by the build daemon) -->forward the command's output
+    elif ( stdout ):
+        p = popen( cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd )
+        r = p.communicate()
+        sys.stdout.write( r[0].decode( errors='replace' ) )
+        if ( p.returncode != 0 and on_err_msg != None ):
+            sys.exit(on_err_msg)
+        return (p.returncode, r[0].decode( errors='replace' ))
     else:
-        p = subprocess.Popen( cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+        p = popen( cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd )
 
     r  = p.communicate()
     r0 = '' if r[0] == None else r[0].decode()
@@ -163,10 +332,56 @@ def replace_environ_variable( printer, line, marker='$' ):
     return replace_environ_variable(printer,line,marker)
 
 #-----------------------------------------------------------------------------
-def create_working_libdirs( printer, inf, arguments, libdirs, libnames, local_external_flag, variant, parent=None ):
+def load_working_libdirs( printer, inf, arguments, libdirs, libnames, local_external_flag, variant ):
+    """ Same as create_working_libdirs() except that the expanded list is
+        retrieved from (or stored in) the persistent libdirs cache.  The cache
+        entry is invalidated when any of the libdirs.b files visited or any of
+        the referenced environment variables change
+    """
+    cachefile = os.path.join( NQBP_PRJ_DIR(), NQBP_STATE_DIRNAME(), 'libdirs_cache.json' )
+    fname     = os.path.abspath( inf.name )
+    key       = json.dumps( [fname, local_external_flag, variant] + [ arguments.get(k) for k in ('-p', '-x', '-q', '-Q', '-c', '-C', '--noabs') ] )
+    
+    # Cache hit?
+    cache = _read_json_file( cachefile, {} )
+    entry = cache.get( key )
+    if ( entry != None and _is_libdirs_entry_current( entry ) ):
+        printer.debug( "# Using cached libdirs for: " + fname )
+        for d, e in entry['libdirs']:
+            libdirs.append( ((d[0], d[1], d[2]), e) )
+        libnames.extend( entry['libnames'] )
+        return
+
+    # Parse the libdirs.b file(s)
+    visited = { 'files':[fname], 'env':[] }
+    newdirs = []
+    newnames = []
+    with timeline.span( 'libdirs', 'parse ' + os.path.basename( fname ), os.path.dirname( fname ) ):
+        create_working_libdirs( printer, inf, arguments, newdirs, newnames, local_external_flag, variant, visited=visited )
+    libdirs.extend( newdirs )
+    libnames.extend( newnames )
+
+    # Do not cache a list with duplicates (i.e. an error that is only ignored when debugging)
+    if ( len(newnames) != len(set(newnames)) ):
+        return
+
+    files      = {}
+    for f in visited['files']:
+        files[f] = _get_file_stamp( f )
+    env        = {}
+    for v in visited['env']:
+        env[v] = os.environ.get( v )
+    cache[key] = { 'files':files, 'env':env, 'libdirs':newdirs, 'libnames':newnames }
+    _write_json_file( cachefile, cache )
+
+def create_working_libdirs( printer, inf, arguments, libdirs, libnames, local_external_flag, variant, parent=None, visited=None ):
 
     # process all entries in the file        
     for line in inf:
+        # Capture the environment variables referenced (for the libdirs cache)
+        if ( visited != None ):
+            visited['env'].extend( re.findall( r'\$([^$]+)\$', line ) )
+
         # 'normalize' the file entries
         line      = standardize_dir_sep( line.strip() )
         entry     = local_external_flag
@@ -249,8 +464,10 @@ def create_working_libdirs( printer, inf, arguments, libdirs, libnames, local_ex
                 sys.exit(1)
                 
             printer.debug( "# Nested libdirs file: " + path+line )
+            if ( visited != None ):
+                visited['files'].append( os.path.abspath( fname ) )
             f = open( path+line, 'r' )
-            create_working_libdirs( printer, f, arguments, libdirs, libnames, entry, variant, newparent )
+            create_working_libdirs( printer, f, arguments, libdirs, libnames, entry, variant, newparent, visited )
             f.close()
             continue               
 
@@ -284,6 +501,45 @@ def create_working_libdirs( printer, inf, arguments, libdirs, libnames, local_ex
     if ( duplicates and not arguments['--debug'] ):
         sys.exit( "ERROR Duplicate entries in libdirs.b" )
 
+
+def _is_libdirs_entry_current( entry ):
+    for f, stamp in entry['files'].items():
+        if ( _get_file_stamp( f ) != stamp ):
+            return False
+    for v, value in entry['env'].items():
+        if ( os.environ.get( v ) != value ):
+            return False
+    return True
+
+def _get_file_stamp( fname ):
+    try:
+        st = os.stat( fname )
+        return [st.st_mtime_ns, st.st_size]
+    except OSError:
+        return None
+
+def _is_stamp_settled( stamp ):
+    # Returns True if none of the time stamps is within the last 2 seconds (i.e. coarse file system time stamps)
+    now = time.time_ns()
+    return all( s == None or now - s[0] > 2000000000 for s in stamp )
+
+def _read_json_file( fname, default ):
+    try:
+        with open( fname, 'r' ) as f:
+            return json.load( f )
+    except (OSError, ValueError):
+        return default
+
+def _write_json_file( fname, content ):
+    # Write to a temporary file first so that a partial file is never read
+    try:
+        os.makedirs( os.path.dirname( fname ), exist_ok=True )
+        tmp = '{}.{}.tmp'.format( fname, os.getpid() )
+        with open( tmp, 'w' ) as f:
+            json.dump( content, f )
+        os.replace( tmp, fname )
+    except OSError:
+        pass
         
 # 
 def find_libdir_entry( libdirs, dir_path, entry_type=None ):
@@ -299,7 +555,7 @@ def find_libdir_entry( libdirs, dir_path, entry_type=None ):
     return (False, (dir_path, None, None), entry_type)
 
 #-----------------------------------------------------------------------------
-def run_pre_processing_script( printer, current_dir, work_root, pkg_root, prj_dirname, preprocess_script, preprocess_args, build_clean="build", verbose=False ):
+def run_pre_processing_script( printer, current_dir, work_root, pkg_root, prj_dirname, preprocess_script, preprocess_args, build_clean="build", verbose=False, cwd=None ):
     # Do nothing if feature not enabled
     if ( preprocess_script != None ):
         script = os.path.join( current_dir, preprocess_script )
@@ -307,34 +563,79 @@ def run_pre_processing_script( printer, current_dir, work_root, pkg_root, prj_di
         # Do nothing if no pre-process script is present
         if ( os.path.isfile( script) ):
             verbose_opt = "verbose" if verbose else "terse"
+
+            # Call the script in-process (when it supports it)
+            if ( preprocessing.is_in_process_script( script ) ):
+                argv = [script, build_clean, verbose_opt, work_root, pkg_root, prj_dirname, current_dir] + shlex.split( preprocess_args )
+                run_in_process_pre_processing( printer, script, argv, cwd if cwd != None else os.getcwd(), "Running PreProcess Script Failed!" )
+                return
+
             printer.output( "= Running Pre-Process script: " + preprocess_script )
             cmd = "{} {} {} {} {} {} {} {}".format( script, build_clean, verbose_opt, work_root, pkg_root, prj_dirname, current_dir, preprocess_args)
             printer.debug( "# PreProcessing cmd = " + cmd )
-            run_shell2( cmd, stdout=True, on_err_msg="Running PreProcess Script Failed!")
+
+            # The script's output goes through the printer (i.e. it stays together with the rest of the job's output)
+            with timeline.span( 'pre-process', preprocess_script, current_dir ):
+                if ( run_shell( printer, cmd, cwd=cwd ) ):
+                    sys.exit( "Running PreProcess Script Failed!" )
+
+#
+def run_in_process_pre_processing( printer, script, argv, cwd, on_err_msg ):
+    # Skip the build step when the script's outputs are up-to-date
+    name = os.path.basename( script )
+    try:
+        if ( argv[1] == 'build' and preprocessing.is_up_to_date( script, argv ) ):
+            printer.verbose( "= Pre-Process script is up-to-date: " + name )
+            return
+
+        printer.output( "= {} Pre-Process script: {}".format( "Running" if argv[1] == 'build' else "Cleaning", name ) )
+        printer.debug( "# PreProcessing (in-process) argv = {}".format( argv ) )
+        with timeline.span( 'pre-process', name, argv[6] ):
+            rc = preprocessing.run( printer, script, argv, cwd )
+    except Exception as e:
+        printer.output( "ERROR: {}: {}".format( script, e ) )
+        rc = 1
+    if ( rc != 0 ):
+        sys.exit( on_err_msg )
 
 
 #
-def run_clean_pre_processing( printer, libdirs, clean_pkg=False, clean_local=False, clean_xpkgs=False, clean_absolute=False ):
+def run_clean_pre_processing( printer, libdirs, clean_pkg=False, clean_local=False, clean_xpkgs=False, clean_absolute=False, extra_dirs=[] ):
     # Do nothing if no pre-processing script is defined
-    if ( NQBP_PRE_PROCESS_SCRIPT() != None and len(libdirs) > 0 ):
+    if ( NQBP_PRE_PROCESS_SCRIPT() != None and (len(libdirs) > 0 or len(extra_dirs) > 0) ):
         
         # Walk list of possible directories
+        dirs = list( extra_dirs )
         for d,e in libdirs:
             line,srctype,srclist = d
 
             # Clean Local and PKG dirs
             if ( (clean_pkg and e == 'local') or (clean_local and e == 'pkg') ):
-                dir = os.path.join( NQBP_PKG_ROOT(), line )
-                run_clean_dir_pre_processing( dir, printer )
+                dirs.append( os.path.join( NQBP_PKG_ROOT(), line ) )
 
             # Clean External Packages
             if ( clean_xpkgs and e == 'xpkg' ):
-                dir = os.path.join( NQBP_WORK_ROOT(), NQBP_WRKPKGS_DIRNAME(), line )
-                run_clean_dir_pre_processing( dir, printer )
+                dirs.append( os.path.join( NQBP_WORK_ROOT(), NQBP_WRKPKGS_DIRNAME(), line ) )
 
             # Clean Absolute directories
             if ( clean_absolute and e == 'absolute' ):
-                run_clean_dir_pre_processing( line, printer )
+                dirs.append( line )
+
+        # Run the scripts in parallel (the output of each script is displayed as a single block)
+        dirs = [ d for d in dirs if os.path.isfile( os.path.join( d, NQBP_PRE_PROCESS_SCRIPT() ) ) ]
+        if ( len(dirs) > 1 ):
+            with concurrent.futures.ThreadPoolExecutor( min( len(dirs), os.cpu_count() or 1 ) ) as pool:
+                for f in [ pool.submit( _run_captured_clean_dir_pre_processing, d, printer ) for d in dirs ]:
+                    f.result()
+        elif ( len(dirs) == 1 ):
+            run_clean_dir_pre_processing( dirs[0], printer )
+
+def _run_captured_clean_dir_pre_processing( dir, printer ):
+    printer.begin_capture()
+    try:
+        run_clean_dir_pre_processing( dir, printer )
+    finally:
+        printer.end_capture()
 
 #
 def run_clean_dir_pre_processing( dir, printer ):
@@ -347,11 +648,88 @@ def run_clean_dir_pre_processing( dir, printer ):
     
         # Run script if it exists
         script = os.path.join( dir, NQBP_PRE_PROCESS_SCRIPT() )
-        if ( os.path.isfile( script) ):
+        if ( os.path.isfile( script) and preprocessing.is_in_process_script( script ) ):
+            argv = [script, "clean", verbose_opt, NQBP_WORK_ROOT(), NQBP_PKG_ROOT(), NQBP_PRJ_DIR(), dir] + shlex.split( NQBP_PRE_PROCESS_SCRIPT_ARGS() )
+            run_in_process_pre_processing( printer, script, argv, os.getcwd(), "Cleaning PreProcess Script Failed!" )
+
+        elif ( os.path.isfile( script) ):
             printer.output( "= Cleaning Pre-Process script: " + NQBP_PRE_PROCESS_SCRIPT() )
             cmd = "{} {} {} {} {} {} {} {}".format( script, "clean", verbose_opt, NQBP_WORK_ROOT(), NQBP_PKG_ROOT(), NQBP_PRJ_DIR (), dir, NQBP_PRE_PROCESS_SCRIPT_ARGS())
             printer.debug( "# Clean PreProcessing cmd = " + cmd )
-            run_shell2( cmd, stdout=True, on_err_msg="Cleaning PreProcess Script Failed!")
+
+            # The script's output goes through the printer (i.e. it is not interleaved with the output of other scripts)
+            with timeline.span( 'pre-process', NQBP_PRE_PROCESS_SCRIPT(), dir ):
+                p = subprocess.run( cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT )
+            text = p.stdout.decode( errors='replace' ).rstrip()
+            if ( text != '' ):
+                printer.output( text )
+            if ( p.returncode != 0 ):
+                sys.exit( "Cleaning PreProcess Script Failed!" )
+
+
+#-----------------------------------------------------------------------------
+# Trash directory: derived directories are 'removed' by renaming them into the
+# trash directory, the trash directory is emptied by a background thread. 
+# Anything left over (e.g. the build exited before the thread finished) is 
+# removed by the next build.
+_trash_lock   = threading.Lock()
+_trash_thread = None
+
+def get_state_file( subdir, variant ):
+    """ Returns the name of a per build variant file in the project's state
+        directory, e.g. .nqbp/<subdir>/<variant>.json
+    """
+    name = re.sub( r'[^\w.-]+', '_', variant ).strip( '_' ) + '.json'
+    return os.path.join( NQBP_PRJ_DIR(), NQBP_STATE_DIRNAME(), subdir, name )
+
+def get_trash_dir():
+    return os.path.join( NQBP_PRJ_DIR(), NQBP_STATE_DIRNAME(), 'trash' )
+
+def remove_tree( path ):
+    """ Removes the directory tree 'path'.  The tree is moved to the trash
+        directory and deleted in the background.  The tree is deleted 
+        immediately when it cannot be moved (e.g. it is on different drive)
+    """
+    if ( not os.path.exists( path ) ):
+        return
+    trash = get_trash_dir()
+    try:
+        os.makedirs( trash, exist_ok=True )
+        os.rename( path, os.path.join( trash, '{}-{}-{}'.format( os.getpid(), time.time_ns(), os.path.basename( os.path.normpath( path ) ) ) ) )
+    except OSError:
+        shutil.rmtree( path, True )
+        return
+    empty_trash()
+
+def empty_trash():
+    """ Starts deleting the content of the trash directory (in the background)"""
+    global _trash_thread
+    trash = get_trash_dir()
+    if ( not os.path.isdir( trash ) ):
+        return
+    with _trash_lock:
+        if ( _trash_thread == None ):
+            _trash_thread = threading.Thread( target=_delete_trash, args=(trash,), daemon=True )
+            _trash_thread.start()
+
+def _delete_trash( trash ):
+    global _trash_thread
+    failed = set()
+    while( True ):
+        # Exit (under the lock) only when there is nothing (new) to delete
+        with _trash_lock:
+            try:
+                names = [ n for n in os.listdir( trash ) if n not in failed ]
+            except OSError:
+                names = []
+            if ( len(names) == 0 ):
+                _trash_thread = None
+                return
+        for n in names:
+            path = os.path.join( trash, n )
+            shutil.rmtree( path, True )
+            if ( os.path.lexists( path ) ):
+                failed.add( n )
 
            
 # 
@@ -445,6 +823,21 @@ def _get_marker_dir( from_fname, marker ):
         result = _test_for_top( result, marker )    
     
     return result
+
+#
+def write_file_if_changed( fname, content ):
+    """ Writes 'content' to the text file 'fname' ONLY when the file does not
+        already have the same content (i.e. the file's time stamp is not 
+        changed when the content is the same)
+    """
+    try:
+        with open( fname, 'r' ) as f:
+            if ( f.read() == content ):
+                return
+    except OSError:
+        pass
+    with open( fname, 'w' ) as f:
+        f.write( content )
     
 
 def _test_for_top( dir, marker ):
@@ -530,11 +923,19 @@ def derive_src_path( pkg_root, work_root, pkgs_dirname, entry, dir ):
 
 def get_files_to_build( printer, toolchain, dir, sources_b ):
     files = []
+    exts  = ['c', 'cpp'] + toolchain.get_asm_extensions()
     
-    # get the list of potential file to build (when no 'sources.b' is present)
+    # Re-use the previous list (e.g. when running as the build daemon) when the directory and 'sources.b' are unchanged
     src_b = os.path.join( dir, sources_b )
-    if ( not os.path.isfile( src_b) ):
-        exts = ['c', 'cpp'] + toolchain.get_asm_extensions()
+    key   = (os.path.abspath( src_b ), tuple(exts))
+    stamp = (_get_file_stamp( dir ), _get_file_stamp( src_b ))
+    entry = _files_cache.get( key )
+    if ( entry != None and entry[0] == stamp ):
+        printer.debug( "# Cached file list to build for dir: {}. {}".format( dir, entry[1] )  )
+        return list( entry[1] )
+
+    # get the list of potential file to build (when no 'sources.b' is present)
+    if ( stamp[1] == None ):
         printer.debug( "# Creating auto.sources.b for dir: {}. Extensions={}".format( dir, exts )  )
         files = dir_list_filter_by_ext(dir, exts )
                 
@@ -553,6 +954,10 @@ def get_files_to_build( printer, toolchain, dir, sources_b ):
        
         inf.close()
              
+    # Do not cache a list that was read in the same time stamp 'tick' as a change to the directory (i.e. a later change may not be detected)
+    if ( stamp[0] != None and _is_stamp_settled( stamp ) ):
+        _files_cache[key] = (stamp, list(files))
+
     # return the file list
     printer.debug( "# Default file list to build for dir: {}. {}".format( dir, files )  )
     return files                
@@ -617,8 +1022,10 @@ def replace_build_dir_symbols( toolchain, objects_string, libdirs, new_root ):
             print( "ERROR: Cannot find directory entry (in libdirs.b) for {}".format( objects_string ) )
             sys.exit(1)
 
-        # convert source list to an object list
-        final += ' ' + get_objects_list(toolchain._obj_ext, dir[0], new_root )
+        # convert source list to an object list (using the build manifest)
+        objpath = os.path.join( "__abs", dir[0].replace(':','',1).lstrip(os.sep) ) if entry == 'absolute' else dir[0]
+        for o in toolchain.get_dir_objects( os.path.join( toolchain.get_obj_root(), objpath ) ):
+            final += ' ' + os.path.join( new_root, objpath, o )
 
         # Nothing left to parse
         if ( len(tokens) == 1 ):
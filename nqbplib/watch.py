@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+"""File system watcher (used by the --watch option)
+
+Watches a set of directories (NOT recursively) for changes to files with
+specific extensions.  On Linux inotify is used (via ctypes), all other
+platforms (or when inotify is not available) poll the directories.
+
+A 'burst' of changes (e.g. an editor saving several files, or writing a file
+via a temporary file) is reported as a single change, i.e. wait() returns
+once no more changes have been detected for DEBOUNCE_TIME seconds.  Changes
+that occur while the caller is busy are reported by the next call to wait()
+unless the caller discards them (see discard()), e.g. the files written by a
+build's pre-processing scripts.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+
+# Time (in seconds) without changes before a burst of changes is reported
+DEBOUNCE_TIME = 0.3
+
+# Time (in seconds) between scans when polling
+POLL_INTERVAL = 0.5
+
+# inotify constants (see <sys/inotify.h>)
+_IN_ATTRIB      = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM  = 0x00000040
+_IN_MOVED_TO    = 0x00000080
+_IN_CREATE      = 0x00000100
+_IN_DELETE      = 0x00000200
+_IN_Q_OVERFLOW  = 0x00004000
+_IN_IGNORED     = 0x00008000
+_IN_ONLYDIR     = 0x01000000
+_IN_MASK        = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_ONLYDIR
+_EVENT_HEADER   = struct.Struct( 'iIII' )
+
+
+#-----------------------------------------------------------------------------
+def create_watcher( extensions ):
+    """ Returns an inotify watcher when supported, else a polling watcher.
+        'extensions' is the list of file extensions (no '.') to watch.  An
+        extension can also be a complete file name (e.g. 'libdirs.b')
+    """
+    if ( sys.platform.startswith( 'linux' ) ):
+        try:
+            return InotifyWatcher( extensions )
+        except OSError:
+            pass
+    return PollingWatcher( extensions )
+
+
+#=============================================================================
+class PollingWatcher:
+    """ Detects changes by comparing the time stamps of the files"""
+
+    #-------------------------------------------------------------------------
+    def __init__( self, extensions ):
+        self._extensions = set( extensions )
+        self._dirs       = []
+        self._snapshot   = {}
+
+    def update( self, dirs ):
+        """ Sets the directories to watch"""
+        new            = [ d for d in dirs if d not in self._dirs ]
+        self._dirs     = list( dirs )
+        self._snapshot = { f: s for f, s in self._snapshot.items() if os.path.dirname( f ) in self._dirs }
+        for d in new:
+            self._snapshot.update( self._scan( d ) )
+
+    def get_num_dirs( self ):
+        return len(self._dirs)
+
+    def discard( self ):
+        """ Discards the changes that have not been reported yet"""
+        self._snapshot = {}
+        for d in self._dirs:
+            self._snapshot.update( self._scan( d ) )
+
+    def wait( self ):
+        """ Blocks until a change is detected.  Returns the list of changed files"""
+        changes = set()
+        while( True ):
+            current = {}
+            for d in self._dirs:
+                current.update( self._scan( d ) )
+            new = [ f for f in set( current ) | set( self._snapshot ) if current.get( f ) != self._snapshot.get( f ) ]
+            self._snapshot = current
+            changes.update( new )
+
+            # Report the changes once the files have settled
+            if ( len(changes) > 0 and len(new) == 0 ):
+                return sorted( changes )
+            time.sleep( DEBOUNCE_TIME if len(new) > 0 else POLL_INTERVAL )
+
+    def close( self ):
+        pass
+
+    #-------------------------------------------------------------------------
+    def _scan( self, dir ):
+        stamps = {}
+        try:
+            names = os.listdir( dir )
+        except OSError:
+            return stamps
+        for name in names:
+            if ( _is_watched( name, self._extensions ) ):
+                fname = os.path.join( dir, name )
+                try:
+                    st = os.stat( fname )
+                    stamps[fname] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    pass
+        return stamps
+
+
+#=============================================================================
+class InotifyWatcher:
+    """ Detects changes using the Linux inotify API"""
+
+    #-------------------------------------------------------------------------
+    def __init__( self, extensions ):
+        self._extensions = set( extensions )
+        self._libc       = ctypes.CDLL( ctypes.util.find_library( 'c' ) or 'libc.so.6', use_errno=True )
+        self._fd         = self._libc.inotify_init1( os.O_NONBLOCK | os.O_CLOEXEC )
+        if ( self._fd < 0 ):
+            raise OSError( ctypes.get_errno(), 'inotify_init1 failed' )
+        self._watches    = {}
+        self._dirs       = {}
+
+    def update( self, dirs ):
+        """ Adds the directories to watch.  A directory that does not exist
+            (yet) is ignored
+        """
+        for d in dirs:
+            if ( d in self._dirs ):
+                continue
+            wd = self._libc.inotify_add_watch( self._fd, os.fsencode( d ), _IN_MASK )
+            if ( wd >= 0 ):
+                self._watches[wd] = d
+                self._dirs[d]     = wd
+
+    def get_num_dirs( self ):
+        return len(self._dirs)
+
+    def discard( self ):
+        """ Discards the changes that have not been reported yet"""
+        while( select.select( [self._fd], [], [], 0 )[0] ):
+            self._read_events()
+
+    def wait( self ):
+        """ Blocks until a change is detected.  Returns the list of changed files"""
+        changes = set()
+        timeout = None
+        while( True ):
+            ready, _, _ = select.select( [self._fd], [], [], timeout )
+            if ( not ready ):
+                if ( len(changes) > 0 ):
+                    return sorted( changes )
+                timeout = None
+                continue
+
+            changes.update( self._read_events() )
+            timeout = DEBOUNCE_TIME if len(changes) > 0 else None
+
+    def close( self ):
+        if ( self._fd >= 0 ):
+            os.close( self._fd )
+            self._fd = -1
+
+    #-------------------------------------------------------------------------
+    def _read_events( self ):
+        changes = []
+        try:
+            data = os.read( self._fd, 64 * 1024 )
+        except OSError as e:
+            if ( e.errno == errno.EAGAIN ):
+                return changes
+            raise
+
+        offset = 0
+        while( offset + _EVENT_HEADER.size <= len(data) ):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from( data, offset )
+            name    = os.fsdecode( data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip( b'\0' ) )
+            offset += _EVENT_HEADER.size + length
+
+            # Events were dropped -->assume everything changed
+            if ( mask & _IN_Q_OVERFLOW ):
+                changes.append( '*' )
+
+            # The directory was deleted -->it is watched again when it is re-created (see update())
+            elif ( mask & _IN_IGNORED ):
+                if ( wd in self._watches ):
+                    del self._dirs[self._watches.pop( wd )]
+            elif ( wd in self._watches and _is_watched( name, self._extensions ) ):
+                changes.append( os.path.join( self._watches[wd], name ) )
+        return changes
+
+
+#-----------------------------------------------------------------------------
+def _is_watched( name, extensions ):
+    return name in extensions or os.path.splitext( name )[1][1:] in extensions
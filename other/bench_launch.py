@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark of the per-compile launch overhead
+===============================================================================
+usage: bench_launch [options]
+
+Options:
+    --exe PROGRAM        Program that is launched in place of the compiler.
+                         The program is launched with a synthetic compiler
+                         command line. The default is 'true' (i.e. a no-op
+                         program) so that only the launch overhead is measured.
+    -n COUNT             Number of launches [Default: 200]
+    --incs N             Number of '-I' options [Default: 45]
+    --defs N             Number of '-D' options [Default: 60]
+    -h, --help           Display help for common options/usage
+
+Notes:
+    Compares the two ways that NQBP has launched a compile:
+        string   The command line is formatted from the build options, the
+                 ME_CC_BASE_FILENAME symbol is replaced, and the command is
+                 run via the shell (i.e. an additional /bin/sh process per
+                 compile)
+        argv     The command line is tokenized once, the per-file values are
+                 substituted in a copy of the argument list, and the program
+                 is executed directly (no shell)
+
+    The default number of include paths and defines is comparable to the
+    rp2040 toolchains.
+"""
+
+import sys
+import os
+import time
+import subprocess
+import shutil
+
+sys.path.append( os.path.dirname(__file__) + os.sep + ".." )
+from nqbplib.docopt.docopt import docopt
+from nqbplib import utils
+
+
+#------------------------------------------------------------------------------
+def _make_options( num_incs, num_defs ):
+    inc    = ' '.join( [ '-I/opt/sdk/src/rp2_common/hardware_module{}/include'.format( i ) for i in range(num_incs) ] )
+    cflags = ' '.join( [ '-DLIB_PICO_FEATURE_{}=1'.format( i ) for i in range(num_defs) ] )
+    cflags = '-c -mcpu=cortex-m0plus -mthumb -Os -ffunction-sections -fdata-sections -Wa,-alhs=ME_CC_BASE_FILENAME.lst ' + cflags
+    return cflags, inc
+
+
+def _run_string( exe, cflags, inc, fname ):
+    basename = os.path.splitext( os.path.basename( fname ) )[0]
+    cc = ' {} {} {} '.format( exe, cflags, inc )
+    cc = cc.replace( 'ME_CC_BASE_FILENAME', basename ) + ' ' + fname
+    p  = subprocess.Popen( cc, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+    p.communicate()
+
+
+def _run_argv( template, fname ):
+    basename      = os.path.splitext( os.path.basename( fname ) )[0]
+    argv, indexes = template
+    argv = list( argv )
+    for i in indexes:
+        argv[i] = argv[i].replace( 'ME_CC_BASE_FILENAME', basename )
+    p = utils.popen( argv + [fname], stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+    p.communicate()
+
+
+def _measure( label, count, func, *args ):
+    start = time.perf_counter()
+    for i in range(count):
+        func( *args )
+    elapsed = time.perf_counter() - start
+    print( "{:<8} {:>8.3f} ms/launch  ({} launches)".format( label, elapsed * 1000 / count, count ) )
+    return elapsed
+
+
+#------------------------------------------------------------------------------
+if __name__ == '__main__':
+    args  = docopt(__doc__)
+    exe   = args['--exe'] if args['--exe'] else shutil.which( 'true' )
+    count = int( args['-n'] )
+    if ( exe == None ):
+        sys.exit( "ERROR: Cannot find the program to launch (use the --exe option)" )
+
+    cflags, inc = _make_options( int(args['--incs']), int(args['--defs']) )
+    argv        = utils.split_command( ' {} {} {} '.format( exe, cflags, inc ) )
+    if ( argv == None ):
+        sys.exit( "ERROR: The synthetic command line requires a shell" )
+    template = (argv, [ i for i, a in enumerate( argv ) if 'ME_CC_BASE_FILENAME' in a ])
+
+    print( "Program: {}, command line length: {} bytes, {} arguments".format( exe, len(' '.join(argv)), len(argv) ) )
+    before = _measure( 'string', count, _run_string, exe, cflags, inc, 'src/module.c' )
+    after  = _measure( 'argv',   count, _run_argv, template, 'src/module.c' )
+    print( "Speedup: {:.2f}x".format( before / after ) )
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+"""
+ 
+nqbp-worker is a daemon that compiles files for NQBP's remote compiles
+===============================================================================
+usage: nqbp-worker [options]
+
+Arguments:
+  --host HOST       Network interface to listen on. Use 0.0.0.0 to accept
+                    connections from other machines [default: 127.0.0.1]
+  -p PORT           TCP port of the (first) worker instance [default: 7878]
+  -n COUNT          Number of worker instances to run. The instances listen on
+                    consecutive ports starting with 'PORT'. [default: 1]
+  -j JOBS           Maximum number of concurrent compiles per instance. The
+                    default is the number of CPUs.
+  -v                Be verbose, i.e. log each compile request.
+  -h, --help        Display help for common options/usage.
+    
+
+NOTES:
+  1. The NQBP build enables remote compiles with the '--remote' option. The 
+     workers are specified by the NQBP_WORKERS environment variable, e.g.
+     for three instances on the local host: 
+        NQBP_WORKERS=127.0.0.1:7878,127.0.0.1:7879,127.0.0.1:7880
+  2. Only run workers on a trusted network. A worker executes the compilers
+     requested by its clients (with some restrictions).
+  3. Stop the worker(s) with Ctrl-C.
+
+"""
+
+import sys
+import os
+import time
+import threading
+import multiprocessing
+
+from nqbplib.docopt.docopt import docopt
+from nqbplib import remote
+
+
+#------------------------------------------------------------------------------
+def run( argv ):
+
+    # Process command line args...
+    args  = docopt(__doc__, argv=argv[1:] )
+    jobs  = int(args['-j']) if args['-j'] else multiprocessing.cpu_count()
+    port  = int(args['-p'])
+    count = int(args['-n'])
+    log   = (lambda msg: print( msg, flush=True )) if args['-v'] else None
+
+    # Start the worker instances
+    servers = []
+    for i in range(count):
+        try:
+            server = remote.serve( args['--host'], port + i, jobs, log )
+        except OSError as e:
+            sys.exit( "ERROR: Cannot start a worker on {}:{} ({})".format( args['--host'], port + i, e ) )
+        threading.Thread( target=server.serve_forever, daemon=True ).start()
+        servers.append( server )
+        print( "nqbp-worker listening on {}:{} (max {} concurrent compiles)".format( args['--host'], port + i, jobs ), flush=True )
+
+    # Run until Ctrl-C
+    try:
+        while( True ):
+            time.sleep( 1 )
+    except KeyboardInterrupt:
+        pass
+    for s in servers:
+        s.shutdown()
+        s.server_close()
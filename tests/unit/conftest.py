@@ -0,0 +1,5 @@
+# Makes the nqbplib package importable when running: python -m pytest tests/unit
+import os
+import sys
+
+sys.path.insert( 0, os.path.abspath( os.path.join( os.path.dirname( __file__ ), '..', '..' ) ) )
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+"""Unit tests for the local compile cache"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+#
+from nqbplib import cache
+
+
+class TestCompileCache( unittest.TestCase ):
+
+    def setUp( self ):
+        self.dir   = tempfile.mkdtemp()
+        self.store = os.path.join( self.dir, 'cache' )
+
+    def tearDown( self ):
+        shutil.rmtree( self.dir, True )
+
+    def make_file( self, name, content ):
+        fname = os.path.join( self.dir, name )
+        with open( fname, 'w' ) as f:
+            f.write( content )
+        return fname
+
+    #-------------------------------------------------------------------------
+    def test_key( self ):
+        c   = cache.CompileCache( self.store, 1024 )
+        key = c.make_key( 'gcc 12', 'c', '-O2', b'int x;' )
+        self.assertEqual( key, c.make_key( 'gcc 12', 'c', '-O2', b'int x;' ) )
+        self.assertNotEqual( key, c.make_key( 'gcc 13', 'c', '-O2', b'int x;' ) )
+        self.assertNotEqual( key, c.make_key( 'gcc 12', 'cpp', '-O2', b'int x;' ) )
+        self.assertNotEqual( key, c.make_key( 'gcc 12', 'c', '-O0', b'int x;' ) )
+        self.assertNotEqual( key, c.make_key( 'gcc 12', 'c', '-O2', b'int y;' ) )
+
+        # The fields are separated, i.e. moving text between fields changes the key
+        self.assertNotEqual( c.make_key( 'ab', 'c', '', b'' ), c.make_key( 'a', 'bc', '', b'' ) )
+
+    def test_store_and_restore( self ):
+        c   = cache.CompileCache( self.store, 1024 * 1024 )
+        key = c.make_key( 'gcc', 'c', '', b'int x;' )
+        obj = self.make_file( 'a.o', 'object' )
+        dep = self.make_file( 'a.d', 'a.o: a.c' )
+        self.assertFalse( c.restore( key, obj, dep ) )
+
+        c.store( key, obj, dep )
+        os.remove( obj )
+        os.remove( dep )
+        self.assertTrue( c.restore( key, obj, dep ) )
+        with open( obj ) as f:
+            self.assertEqual( f.read(), 'object' )
+        self.assertTrue( os.path.isfile( dep ) )
+        self.assertEqual( c.get_stats(), (1, 1, 0) )
+
+    def test_trim_evicts_least_recently_used( self ):
+        c    = cache.CompileCache( self.store, 250 )
+        keys = []
+        for i in range( 3 ):
+            key = c.make_key( 'gcc', 'c', '', str(i).encode() )
+            c.store( key, self.make_file( 'a.o', str(i) * 100 ) )
+            os.utime( c._entry_name( key, 'a.o' ), (1000 + i, 1000 + i) )
+            keys.append( key )
+
+        # Using an entry makes it the most recently used
+        self.assertTrue( c.restore( keys[0], os.path.join( self.dir, 'b.o' ) ) )
+
+        self.assertEqual( c.trim(), 1 )
+        self.assertTrue( os.path.isfile( c._entry_name( keys[0], 'a.o' ) ) )
+        self.assertFalse( os.path.isfile( c._entry_name( keys[1], 'a.o' ) ) )
+        self.assertTrue( os.path.isfile( c._entry_name( keys[2], 'a.o' ) ) )
+        self.assertEqual( c.trim(), 0 )
+        self.assertEqual( c.get_stats()[2], 1 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+"""Unit tests for the compiler crash detection and the crash retries"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+#
+from nqbplib import mk
+from nqbplib import crash
+from nqbplib import scheduler
+from nqbplib import my_globals
+
+
+class FakePrinter:
+    def __init__( self ):
+        self.lines = []
+
+    def output( self, line ):
+        self.lines.append( line )
+
+    def begin_capture( self ):
+        pass
+
+    def end_capture( self, discard=False ):
+        pass
+
+
+class FakeToolchain:
+    _cc = '/usr/bin/arm-none-eabi-gcc -c'
+
+    def __init__( self ):
+        self.stable = []
+
+    def get_ccname( self ):
+        return 'GCC'
+
+    def get_crash_stability( self ):
+        toolchain = self
+        class Stability:
+            def crashed( self, stable_jobs ):
+                toolchain.stable.append( stable_jobs )
+        return Stability()
+
+
+class TestCrashDetection( unittest.TestCase ):
+
+    def test_retry_levels( self ):
+        self.assertEqual( crash.get_retry_levels( 8 ), [4, 1] )
+        self.assertEqual( crash.get_retry_levels( 3 ), [1] )
+        self.assertEqual( crash.get_retry_levels( 2 ), [1] )
+        self.assertEqual( crash.get_retry_levels( 1 ), [] )
+
+    def test_is_crash( self ):
+        detector = crash.CrashDetector()
+        self.assertFalse( crash.is_crash( 1, detector ) )
+        self.assertTrue( crash.is_crash( -11, detector ) )
+        self.assertTrue( crash.is_crash( 139, detector ) )
+        self.assertTrue( crash.is_crash( 0xC0000005, detector ) )
+
+        detector( "a.c:3:1: error: expected ';'" )
+        self.assertFalse( crash.is_crash( 1, detector ) )
+        detector( "a.c:9:1: internal compiler error: Segmentation fault" )
+        self.assertTrue( crash.is_crash( 1, detector ) )
+
+    def test_detector_applies_inner_filter( self ):
+        detector = crash.CrashDetector( lambda line: line.upper() )
+        self.assertEqual( detector( 'abc' ), 'ABC' )
+
+
+class TestCrashRetry( unittest.TestCase ):
+
+    def build( self, crashes, num_slots ):
+        # Returns the 'max_parallel' value of each compile attempt
+        printer   = FakePrinter()
+        toolchain = FakeToolchain()
+        sched     = scheduler.Scheduler( printer, num_slots )
+        attempts  = []
+        def compile():
+            attempts.append( None )
+            if ( len(attempts) <= crashes ):
+                raise crash.CompilerCrash()
+        done    = scheduler.Job( 'done', lambda: None )
+        objects = {}
+        job     = scheduler.Job( 'a.c', compile, category='compile' )
+        mk.add_compile_job( sched, printer, toolchain, job, [], done, objects )
+        sched.add_job( done )
+        levels = []
+        orig   = sched._execute
+        def execute( j, slot ):
+            if ( j.category == 'compile' ):
+                levels.append( j.max_parallel )
+            orig( j, slot )
+        sched._execute = execute
+        return sched.run(), levels, toolchain.stable, objects
+
+    def test_no_crash( self ):
+        self.assertEqual( self.build( 0, 8 ), (True, [None], [], {'a.c': ['a.c']}) )
+
+    def test_retry_succeeds( self ):
+        self.assertEqual( self.build( 1, 8 ), (True, [None, 4], [4], {'a.c': ['a.c']}) )
+        self.assertEqual( self.build( 2, 8 ), (True, [None, 4, 1], [1], {'a.c': ['a.c']}) )
+
+    def test_retries_exhausted( self ):
+        ok, levels, stable, objects = self.build( 3, 8 )
+        self.assertFalse( ok )
+        self.assertEqual( (levels, stable, objects), ([None, 4, 1], [], {}) )
+
+
+class TestStability( unittest.TestCase ):
+
+    def setUp( self ):
+        self.prjdir = my_globals.NQBP_PRJ_DIR()
+        self.dir    = tempfile.mkdtemp()
+        my_globals.NQBP_PRJ_DIR( self.dir )
+
+    def tearDown( self ):
+        my_globals._NQBP_PRJ_DIR = self.prjdir
+        shutil.rmtree( self.dir, True )
+
+    def test_probing( self ):
+        s = crash.Stability( FakeToolchain() )
+        self.assertIsNone( s.get_max_jobs() )
+        s.crashed( 4 )
+        s.crashed( 2 )
+        s.build_completed( 8 )
+        self.assertEqual( crash.Stability( FakeToolchain() ).get_max_jobs(), 2 )
+
+        # The bound is doubled after PROBE_BUILDS crash free builds (and removed once it exceeds the number of jobs)
+        s = crash.Stability( FakeToolchain() )
+        for i in range( crash.PROBE_BUILDS ):
+            s.build_completed( 8 )
+        self.assertEqual( s.get_max_jobs(), 4 )
+        for i in range( crash.PROBE_BUILDS * 2 ):
+            s.build_completed( 8 )
+        self.assertIsNone( s.get_max_jobs() )
+        self.assertFalse( os.path.isfile( s.fname ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
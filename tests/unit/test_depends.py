@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""Unit tests for the 'what-has-changed' checking of incremental builds"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+#
+from nqbplib import depends
+
+
+class TestDepends( unittest.TestCase ):
+
+    def setUp( self ):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.dir, True )
+
+    def make_file( self, name, content='', mtime=None ):
+        fname = os.path.join( self.dir, name )
+        with open( fname, 'w' ) as f:
+            f.write( content )
+        if ( mtime != None ):
+            os.utime( fname, (mtime, mtime) )
+        return fname
+
+    #-------------------------------------------------------------------------
+    def test_parse_depfile( self ):
+        fname = self.make_file( 'a.d', 'a.o: src/a.c inc/a.h \\\n  C:\\inc\\b.h my\\ file.h \\\r\n  x$$y.h\n\ninc/a.h:\n' )
+        self.assertEqual( depends.parse_depfile( fname ), [ 'src/a.c', 'inc/a.h', 'C:\\inc\\b.h', 'my file.h', 'x$y.h' ] )
+
+    def test_parse_missing_depfile( self ):
+        self.assertIsNone( depends.parse_depfile( os.path.join( self.dir, 'none.d' ) ) )
+
+    def test_write_depfile( self ):
+        fname = os.path.join( self.dir, 'a.d' )
+        depends.write_depfile( fname, 'a.o', [ 'a.c', 'my file.h', 'x$y.h' ] )
+        self.assertEqual( depends.parse_depfile( fname ), [ 'a.c', 'my file.h', 'x$y.h' ] )
+
+    def test_filter_show_includes( self ):
+        includes = []
+        text     = depends.filter_show_includes( 'a.c\nNote: including file:  c:\\inc\\a.h\nwarning', includes )
+        self.assertEqual( includes, [ 'c:\\inc\\a.h' ] )
+        self.assertEqual( text.splitlines(), [ 'a.c', 'warning' ] )
+
+    #-------------------------------------------------------------------------
+    def test_signature_ignores_build_time( self ):
+        self.assertEqual( depends.make_signature( 'gcc  -c -DBUILD_TIME_UTC=123 a.c' ), depends.make_signature( 'gcc -c -DBUILD_TIME_UTC=456  a.c' ) )
+        self.assertNotEqual( depends.make_signature( 'gcc -c -O2 a.c' ), depends.make_signature( 'gcc -c -O0 a.c' ) )
+
+    def test_is_up_to_date( self ):
+        src       = self.make_file( 'a.c', mtime=1000 )
+        hdr       = self.make_file( 'a.h', mtime=1000 )
+        obj       = self.make_file( 'a.o', mtime=2000 )
+        dep       = self.make_file( 'a.d', 'a.o: a.c a.h\n' )
+        sig       = os.path.join( self.dir, 'a.cmd' )
+        signature = depends.make_signature( 'gcc -c a.c' )
+        self.assertEqual( depends.is_up_to_date( obj, src, dep, sig, signature, self.dir ), (False, 'command line changed') )
+
+        depends.write_signature( sig, signature )
+        self.assertEqual( depends.is_up_to_date( obj, src, dep, sig, signature, self.dir ), (True, 'up-to-date') )
+        self.assertEqual( depends.is_up_to_date( obj, src, dep, sig, depends.make_signature( 'gcc -c -O2 a.c' ), self.dir )[0], False )
+
+        os.utime( hdr, (3000, 3000) )
+        self.assertEqual( depends.is_up_to_date( obj, src, dep, sig, signature, self.dir ), (False, 'header file changed: a.h') )
+        self.assertEqual( depends.is_up_to_date( obj, src, None, sig, signature, self.dir ), (True, 'up-to-date') )
+
+        os.utime( src, (3000, 3000) )
+        self.assertEqual( depends.is_up_to_date( obj, src, None, sig, signature, self.dir ), (False, 'source file changed') )
+
+    def test_missing_files( self ):
+        src = self.make_file( 'a.c', mtime=1000 )
+        sig = self.make_file( 'a.cmd', 'gcc -c a.c' )
+        self.assertEqual( depends.is_up_to_date( os.path.join( self.dir, 'a.o' ), src, None, sig, 'gcc -c a.c' ), (False, 'no object file') )
+        obj = self.make_file( 'a.o', mtime=2000 )
+        self.assertEqual( depends.is_up_to_date( obj, src, os.path.join( self.dir, 'a.d' ), sig, 'gcc -c a.c' ), (False, 'no dependency file') )
+
+    def test_manifest_relative_to_cwd( self ):
+        # The link manifest is checked without changing the current working directory
+        os.makedirs( os.path.join( self.dir, 'lib' ) )
+        self.make_file( os.path.join( 'lib', 'a.a' ), 'a', mtime=1000 )
+        self.make_file( 'a.exe', 'exe', mtime=2000 )
+        fname = os.path.join( self.dir, 'link.json' )
+        depends.write_manifest( fname, 'ld', [ 'lib/a.a' ], [ 'a.exe' ], self.dir )
+        self.assertTrue( depends.is_manifest_current( fname, 'ld', [ 'lib/a.a' ], self.dir ) )
+        self.assertFalse( depends.is_manifest_current( fname, 'ld -g', [ 'lib/a.a' ], self.dir ) )
+
+        os.utime( os.path.join( self.dir, 'a.exe' ), (3000, 3000) )
+        self.assertFalse( depends.is_manifest_current( fname, 'ld', [ 'lib/a.a' ], self.dir ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
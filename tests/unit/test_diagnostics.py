@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""Unit tests for the de-duplication and counting of compiler diagnostics"""
+
+import os
+import tempfile
+import unittest
+
+#
+from nqbplib import base
+from nqbplib import diagnostics
+
+
+WARNING = "common.h:3:12: warning: unused variable 'x' [-Wunused-variable]"
+CONTEXT = "In file included from a.c:1:"
+ERROR   = "a.c:5:1: error: expected ';' before '}' token"
+
+
+def run_filter( output_filter, lines ):
+    # Returns the output lines (like utils.run_shell())
+    result = [ output_filter( l ).rstrip() for l in lines ] + [ output_filter.flush() ]
+    return [ l for l in result if l != '' ]
+
+
+class TestParseLine( unittest.TestCase ):
+
+    def test_gcc( self ):
+        r = diagnostics.parse_line( WARNING, os.sep + 'src' )
+        self.assertEqual( r, { 'file': os.path.normpath( os.sep + 'src/common.h' ), 'line': 3, 'column': 12, 'severity': 'warning',
+                               'flag': '-Wunused-variable', 'message': "unused variable 'x'" } )
+        self.assertEqual( diagnostics.parse_line( "a.c:5: fatal error: x.h: No such file" )['severity'], 'error' )
+        self.assertEqual( diagnostics.parse_line( "b.c:1:2: error: bad [-Werror=shadow]" )['flag'], '-Wshadow' )
+
+    def test_msvc( self ):
+        r = diagnostics.parse_line( "c:\\src\\a.c(10,4): warning C4100: 'x': unreferenced parameter" )
+        self.assertEqual( (r['line'], r['column'], r['severity'], r['flag']), (10, 4, 'warning', 'C4100') )
+
+    def test_not_a_diagnostic( self ):
+        self.assertIsNone( diagnostics.parse_line( "= Compiling: a.c" ) )
+
+
+class TestOutputFilter( unittest.TestCase ):
+
+    def test_repeated_warning_is_suppressed( self ):
+        collector = diagnostics.Collector()
+        f1        = diagnostics.OutputFilter( collector, 'a.c', None )
+        self.assertEqual( run_filter( f1, [ CONTEXT, WARNING, "    int x;" ] ), [ CONTEXT + '\n' + WARNING, "    int x;" ] )
+        f1.commit()
+
+        f2 = diagnostics.OutputFilter( collector, 'b.c', None )
+        self.assertEqual( run_filter( f2, [ CONTEXT, WARNING, "    int x;", ERROR ] ), [ ERROR ] )
+        f2.commit()
+
+        self.assertEqual( collector.get_counts(), (1, 1, 1) )
+        self.assertEqual( [ r['tus'] for r in collector.get_records() if r['severity'] == 'warning' ], [ ['a.c', 'b.c'] ] )
+
+    def test_errors_are_never_suppressed( self ):
+        collector = diagnostics.Collector()
+        for tu in ( 'a.c', 'b.c' ):
+            f = diagnostics.OutputFilter( collector, tu, None )
+            self.assertEqual( run_filter( f, [ ERROR ] ), [ ERROR ] )
+            f.commit()
+        self.assertEqual( collector.get_counts(), (1, 0, 0) )
+
+    def test_records_are_buffered( self ):
+        # The records of a discarded attempt are never reported
+        collector = diagnostics.Collector()
+        f1        = diagnostics.OutputFilter( collector, 'nqbp_unity_0.c', None )
+        run_filter( f1, [ WARNING, ERROR ] )
+        self.assertEqual( collector.get_counts(), (0, 0, 0) )
+        self.assertEqual( len(f1.records), 2 )
+
+        f2 = diagnostics.OutputFilter( collector, 'a.c', None )
+        self.assertEqual( run_filter( f2, [ WARNING ] ), [ WARNING ] )
+        f2.commit()
+        self.assertEqual( collector.get_counts(), (0, 1, 0) )
+
+    def test_remote_output( self ):
+        class Remote:
+            def compile( self, compiler, flags, file_type, preprocessed ):
+                return (b'obj', WARNING + '\n' + WARNING + '\n')
+
+        class Printer:
+            def __init__( self ):
+                self.lines = []
+
+            def stream( self, line ):
+                self.lines.append( line )
+
+        toolchain          = base.ToolChain.__new__( base.ToolChain )
+        toolchain._remote  = Remote()
+        toolchain._printer = Printer()
+        collector          = diagnostics.Collector()
+        output_filter      = diagnostics.OutputFilter( collector, 'a.c', os.sep + 'src' )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertTrue( toolchain._compile_remote( 'gcc', [], 'c', b'', os.path.join( tmpdir, 'a.o' ), output_filter ) )
+        output_filter.commit()
+        self.assertEqual( toolchain._printer.lines, [ WARNING ] )
+        self.assertEqual( collector.get_counts(), (0, 1, 1) )
+        self.assertEqual( collector.get_records()[0]['file'], os.path.normpath( os.sep + 'src/common.h' ) )
+
+
+class TestReport( unittest.TestCase ):
+
+    def test_write( self ):
+        collector = diagnostics.Collector()
+        collector.add( diagnostics.parse_line( WARNING ), 'a.c' )
+        collector.add( diagnostics.parse_line( WARNING ), 'b.c' )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            collector.write( os.path.join( tmpdir, 'd.sarif' ), 'gcc' )
+            collector.write( os.path.join( tmpdir, 'd.json' ), 'gcc' )
+            sarif  = diagnostics.load_records( os.path.join( tmpdir, 'd.sarif' ) )
+            report = diagnostics.load_records( os.path.join( tmpdir, 'd.json' ) )
+        result = sarif['runs'][0]['results'][0]
+        self.assertEqual( (result['level'], result['ruleId'], result['occurrenceCount']), ('warning', '-Wunused-variable', 2) )
+        self.assertEqual( (report['errors'], report['warnings'], len(report['diagnostics'])), (0, 1, 1) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+"""Unit tests for the build manifest"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+#
+from nqbplib import base
+from nqbplib import manifest
+
+
+class TestBuildManifest( unittest.TestCase ):
+
+    def setUp( self ):
+        self.dir                 = tempfile.mkdtemp()
+        self.toolchain           = base.ToolChain.__new__( base.ToolChain )
+        self.toolchain._obj_root = self.dir
+        self.toolchain._obj_ext  = 'o'
+        self.toolchain._manifest = manifest.BuildManifest( os.path.join( self.dir, 'manifest.json' ) )
+        self.toolchain._link_objects    = False
+        self.toolchain._ar_library_name = 'library.a'
+        self.objdir = os.path.join( self.dir, 'src', 'bob' )
+        os.makedirs( self.objdir )
+
+    def tearDown( self ):
+        shutil.rmtree( self.dir, True )
+
+    def test_set_and_save( self ):
+        self.toolchain.set_dir_objects( self.objdir, [ 'hello.c', 'world.cpp', 'hello.c' ] )
+        self.toolchain.save_build_manifest()
+        saved = manifest.BuildManifest( os.path.join( self.dir, 'manifest.json' ) )
+        self.assertEqual( saved.get_objects( os.path.join( 'src', 'bob' ) ), [ 'hello.o', 'world.o' ] )
+        self.assertEqual( saved.get_archive( os.path.join( 'src', 'bob' ) ), os.path.join( 'src', 'bob', 'library.a' ) )
+
+    def test_add_single_file( self ):
+        # A file compiled by itself (-f) is added to the directory's entry
+        self.toolchain.set_dir_objects( self.objdir, [ 'hello.c' ] )
+        self.toolchain.add_dir_object( self.objdir, 'src/bob/extra.c' )
+        self.toolchain.add_dir_object( self.objdir, 'src/bob/hello.c' )
+        self.assertEqual( self.toolchain.get_dir_objects( self.objdir ), [ 'hello.o', 'extra.o' ] )
+
+    def test_no_entry_lists_the_directory( self ):
+        open( os.path.join( self.objdir, 'hello.o' ), 'w' ).close()
+        self.toolchain.add_dir_object( self.objdir, 'extra.c' )
+        self.assertEqual( [ os.path.basename( f ) for f in self.toolchain.get_dir_objects( self.objdir ) ], [ 'hello.o' ] )
+
+
+if __name__ == '__main__':
+    unittest.main()
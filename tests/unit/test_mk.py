@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""Unit tests for the compile/archive jobs of a directory (unity builds)"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+#
+from nqbplib import mk
+from nqbplib import scheduler
+
+
+class FakePrinter:
+    def __init__( self ):
+        self.lines = []
+
+    def output( self, line ):
+        self.lines.append( line )
+
+    def verbose( self, line ):
+        pass
+
+    def begin_capture( self ):
+        pass
+
+    def end_capture( self, discard=False ):
+        pass
+
+
+class FakeToolchain:
+    """ Compiles by touching the object file.  Unity files fail to compile
+        when 'unity_fails' is set
+    """
+    _obj_ext     = 'o'
+    _depfile_ext = 'd'
+
+    def __init__( self, unity_fails ):
+        self.unity_fails = unity_fails
+        self.objects     = None
+        self.archived    = None
+
+    def cc( self, arguments, fullname, cwd=None, report_failure=True ):
+        name = os.path.basename( fullname )
+        if ( self.unity_fails and name.startswith( mk.UNITY_PREFIX ) ):
+            exit( 1 )
+        with open( os.path.join( cwd, os.path.splitext( name )[0] + '.o' ), 'w' ):
+            pass
+
+    def set_dir_objects( self, objdir, srcfiles ):
+        self.objects = [ os.path.splitext( f )[0] + '.o' for f in srcfiles ]
+
+    def ar( self, arguments, objdir ):
+        # Fails (like the archiver) when an object does not exist
+        for o in self.objects:
+            if ( not os.path.isfile( os.path.join( objdir, o ) ) ):
+                exit( 1 )
+        self.archived = self.objects
+
+    def get_crash_stability( self ):
+        return None
+
+
+class TestUnityBatches( unittest.TestCase ):
+
+    def test_split( self ):
+        files = [ 'a.c', 'b.c', 'c.c', 'x.cpp', 'y.cpp', 'z.s' ]
+        self.assertEqual( mk.split_unity_batches( {'--unity': None}, files ), (files, []) )
+        self.assertEqual( mk.split_unity_batches( {'--unity': '2'}, files ), ([ 'z.s', 'c.c' ], [ ('c', ['a.c', 'b.c']), ('cpp', ['x.cpp', 'y.cpp']) ]) )
+
+    def test_invalid_size( self ):
+        for size in ( 'x', '0', '-1' ):
+            with self.assertRaises( SystemExit ):
+                mk.get_unity_size( {'--unity': size} )
+        self.assertEqual( mk.get_unity_size( {'--unity': '3'} ), 3 )
+
+
+class TestUnityArchive( unittest.TestCase ):
+
+    def setUp( self ):
+        self.objdir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.objdir, True )
+
+    def build( self, toolchain, files, batch ):
+        printer = FakePrinter()
+        sched   = scheduler.Scheduler( printer, 2 )
+        name    = mk.UNITY_PREFIX + '0.c'
+        names   = files + [name]
+        objects = {}
+        archive = scheduler.Job( 'archive', mk.archive_directory, ({}, toolchain, self.objdir, names, objects), category='archive' )
+        for f in files:
+            mk.add_compile_job( sched, printer, toolchain, scheduler.Job( f, toolchain.cc, ({}, f, self.objdir), category='compile' ), [], archive, objects )
+        mk.add_compile_job( sched, printer, toolchain, scheduler.Job( name, mk.compile_unity_batch, (printer, {}, toolchain, 'src', self.objdir, name, batch), category='compile' ), [], archive, objects )
+        sched.add_job( archive )
+        return sched.run()
+
+    def test_unity_success( self ):
+        toolchain = FakeToolchain( unity_fails=False )
+        self.assertTrue( self.build( toolchain, ['main.c'], ['a.c', 'b.c'] ) )
+        self.assertEqual( toolchain.archived, ['main.o', 'nqbp_unity_0.o'] )
+
+    def test_unity_fallback( self ):
+        toolchain = FakeToolchain( unity_fails=True )
+        self.assertTrue( self.build( toolchain, ['main.c'], ['a.c', 'b.c'] ) )
+        self.assertEqual( toolchain.archived, ['main.o', 'a.o', 'b.o'] )
+        self.assertFalse( os.path.isfile( os.path.join( self.objdir, 'nqbp_unity_0.o' ) ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
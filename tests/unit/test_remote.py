@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+"""Unit tests for the flag filtering of remote compiles"""
+
+import unittest
+
+#
+from nqbplib import remote
+
+
+class TestRemoteFlags( unittest.TestCase ):
+
+    def test_preprocessor_flags_are_removed( self ):
+        args = [ '-c', '-O2', '-I', 'inc', '-Isrc', '-DFOO=1', '-D', 'BAR', '-MMD', '-MP', '-MF', 'x.d', '-include', 'pre.h', '-Wall' ]
+        self.assertEqual( remote.make_remote_flags( args ), [ '-c', '-O2', '-Wall' ] )
+
+    def test_allowed_flags( self ):
+        for flag in [ '-c', '-w', '-O0', '-Os', '-g', '-g3', '-ggdb', '-std=c++17', '-std=gnu11', '-Wall', '-Wextra', '-Werror=shadow',
+                      '-Wno-unused-parameter', '-fno-exceptions', '-ffunction-sections', '-fsanitize=address', '-mcpu=cortex-m4',
+                      '-mthumb', '-m32', '--param=max-inline-insns-single=100', '-pedantic' ]:
+            self.assertTrue( remote.is_allowed_flag( flag ), flag )
+        self.assertEqual( remote.make_remote_flags( [ '-c', '-g', '-mthumb' ] ), [ '-c', '-g', '-mthumb' ] )
+
+    def test_denied_flags( self ):
+        for flag in [ '@args.rsp', '-o', '-Bdir', '-specs=nano.specs', '--specs=nano.specs', '-wrapper', '-fplugin=x.so',
+                      '-aux-info', '-dumpdir', '-dumpbase', '-Xassembler', '-Xlinker', '-Wa,-adhln', '-Wl,-Map=x.map', '-Wp,-MD,x.d',
+                      '-fdump-tree-all', '-fdump-rtl-expand', '-fprofile-arcs', '-fprofile-use=/tmp/x', '-ftest-coverage', '--coverage',
+                      '-save-temps', '-fstack-usage', '-fcallgraph-info', '-ffile-prefix-map=/a=b', '-mfoo=/etc/passwd', '-v' ]:
+            self.assertFalse( remote.is_allowed_flag( flag ), flag )
+            self.assertIsNone( remote.make_remote_flags( [ '-c', flag ] ), flag )
+
+    def test_worker_rejects_preprocessor_flags( self ):
+        header = { 'version': remote.PROTOCOL_VERSION, 'compiler': 'gcc', 'flags': [ '-c', '-MF', '/etc/x.d' ], 'type': 'c' }
+        reply, payload = remote._compile_request( header, b'' )
+        self.assertEqual( reply, { 'error': 'unsupported flags' } )
+        self.assertEqual( payload, b'' )
+
+    def test_allowed_compilers( self ):
+        self.assertTrue( remote.is_allowed_compiler( '/usr/bin/gcc' ) )
+        self.assertTrue( remote.is_allowed_compiler( 'arm-none-eabi-g++.exe' ) )
+        self.assertFalse( remote.is_allowed_compiler( 'sh' ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
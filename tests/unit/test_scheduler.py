@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+"""Unit tests for the job scheduler"""
+
+import sys
+import time
+import unittest
+
+#
+from nqbplib import utils
+from nqbplib import scheduler
+
+
+class FakePrinter:
+    def __init__( self ):
+        self.lines = []
+
+    def output( self, line ):
+        self.lines.append( line )
+
+    def stream( self, line ):
+        self.lines.append( line )
+
+    def begin_capture( self ):
+        pass
+
+    def end_capture( self, discard=False ):
+        pass
+
+
+def fail( delay=0 ):
+    time.sleep( delay )
+    sys.exit( 1 )
+
+
+class TestScheduler( unittest.TestCase ):
+
+    def setUp( self ):
+        self.printer = FakePrinter()
+        self.order   = []
+
+    def job( self, name, priority=0, func=None, args=() ):
+        if ( func == None ):
+            func = self.order.append
+            args = (name,)
+        return scheduler.Job( name, func, args, priority=priority )
+
+    #-------------------------------------------------------------------------
+    def test_dependencies_and_priority( self ):
+        sched = scheduler.Scheduler( self.printer, 1 )
+        a     = sched.add_job( self.job( 'a', priority=1 ) )
+        b     = sched.add_job( self.job( 'b', priority=5 ) )
+        c     = sched.add_job( self.job( 'c', priority=9 ), [a, b] )
+        self.assertTrue( sched.run() )
+        self.assertEqual( self.order, ['b', 'a', 'c'] )
+
+    def test_on_done_adds_jobs( self ):
+        sched = scheduler.Scheduler( self.printer, 2 )
+        last  = self.job( 'last' )
+        def add_jobs( job ):
+            for n in ( 'x', 'y' ):
+                sched.add_dependency( last, sched.add_job( self.job( n ) ) )
+        first = sched.add_job( scheduler.Job( 'first', self.order.append, ('first',), on_done=add_jobs ) )
+        sched.add_job( last, [first] )
+        self.assertTrue( sched.run() )
+        self.assertEqual( self.order[0], 'first' )
+        self.assertEqual( self.order[-1], 'last' )
+        self.assertEqual( sorted( self.order ), ['first', 'last', 'x', 'y'] )
+
+    def test_fail_fast( self ):
+        # The failure kills the running tool process and no new jobs are started
+        sched   = scheduler.Scheduler( self.printer, 2 )
+        running = sched.add_job( self.job( 'sleep', priority=3, func=utils.run_shell, args=(self.printer, [sys.executable, '-c', 'import time; time.sleep(30)']) ) )
+        failed  = sched.add_job( self.job( 'fail', priority=2, func=fail, args=(0.5,) ) )
+        queued  = sched.add_job( self.job( 'queued', priority=1 ) )
+        start   = time.time()
+        self.assertFalse( sched.run() )
+        self.assertLess( time.time() - start, 20 )
+        self.assertEqual( sched.get_failed_jobs(), [failed] )
+        self.assertEqual( self.order, [] )
+        self.assertFalse( queued.done )
+        self.assertFalse( utils.processes_killed() )
+
+    def test_keep_going( self ):
+        # Only the jobs that depend on the failed job are skipped
+        sched     = scheduler.Scheduler( self.printer, 1, keep_going=True )
+        failed    = sched.add_job( self.job( 'fail', priority=9, func=fail ) )
+        dependent = sched.add_job( self.job( 'dependent' ), [failed] )
+        other     = sched.add_job( self.job( 'other' ) )
+        sched.add_job( self.job( 'after' ), [other] )
+        self.assertFalse( sched.run() )
+        self.assertEqual( sched.get_failed_jobs(), [failed] )
+        self.assertEqual( self.order, ['other', 'after'] )
+        self.assertFalse( dependent.done )
+
+    def test_exit_message_is_output( self ):
+        sched = scheduler.Scheduler( self.printer, 1, keep_going=True )
+        def on_done( job ):
+            sys.exit( "ERROR: on_done failed" )
+        sched.add_job( self.job( 'fail', func=sys.exit, args=("ERROR: job failed",) ) )
+        sched.add_job( scheduler.Job( 'done', self.order.append, ('done',), on_done=on_done ) )
+        sched.add_job( self.job( 'quiet', func=sys.exit, args=(3,) ) )
+        sched.add_job( self.job( 'success', func=sys.exit, args=(0,) ) )
+        self.assertFalse( sched.run() )
+        self.assertEqual( sorted( j.name for j in sched.get_failed_jobs() ), ['done', 'fail', 'quiet'] )
+        self.assertEqual( sorted( self.printer.lines ), ["ERROR: job failed", "ERROR: on_done failed"] )
+
+    def test_max_parallel( self ):
+        sched   = scheduler.Scheduler( self.printer, 4 )
+        active  = [0, 0]
+        def work():
+            active[0] += 1
+            active[1]  = max( active[1], active[0] )
+            time.sleep( 0.05 )
+            active[0] -= 1
+        for i in range( 6 ):
+            sched.add_job( scheduler.Job( str(i), work, max_parallel=1 ) )
+        self.assertTrue( sched.run() )
+        self.assertEqual( active[1], 1 )
+
+
+if __name__ == '__main__':
+    unittest.main()
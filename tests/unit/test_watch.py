@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""Unit tests for the file system watcher (--watch)"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+#
+from nqbplib import watch
+
+
+class WatcherTests:
+    """ Tests that apply to all watchers ('create()' returns the watcher)"""
+
+    def setUp( self ):
+        self.dir     = tempfile.mkdtemp()
+        self.watcher = self.create( [ 'c', 'h', 'libdirs.b' ] )
+        self.watcher.update( [ self.dir ] )
+
+    def tearDown( self ):
+        self.watcher.close()
+        shutil.rmtree( self.dir, True )
+
+    def write( self, name, content='x' ):
+        fname = os.path.join( self.dir, name )
+        with open( fname, 'w' ) as f:
+            f.write( content )
+        return fname
+
+    def wait( self ):
+        # Returns the changes (fails the test when wait() does not return)
+        result = []
+        t      = threading.Thread( target=lambda: result.extend( self.watcher.wait() ), daemon=True )
+        t.start()
+        t.join( 10 )
+        self.assertFalse( t.is_alive() )
+        return result
+
+    #-------------------------------------------------------------------------
+    def test_changes( self ):
+        self.write( 'a.o' )
+        fname = self.write( 'a.c' )
+        self.assertEqual( self.wait(), [ fname ] )
+
+    def test_discard( self ):
+        # Changes made while building (e.g. generated files) are dropped
+        self.write( 'gen.c' )
+        self.watcher.discard()
+        fname = self.write( 'libdirs.b' )
+        self.assertEqual( self.wait(), [ fname ] )
+
+
+class TestPollingWatcher( WatcherTests, unittest.TestCase ):
+    def create( self, extensions ):
+        return watch.PollingWatcher( extensions )
+
+
+@unittest.skipUnless( sys.platform.startswith( 'linux' ), 'inotify is only supported on Linux' )
+class TestInotifyWatcher( WatcherTests, unittest.TestCase ):
+    def create( self, extensions ):
+        return watch.InotifyWatcher( extensions )
+
+
+if __name__ == '__main__':
+    unittest.main()
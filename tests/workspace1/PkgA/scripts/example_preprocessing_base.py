@@ -21,6 +21,12 @@
 import sys
 
 # Do stuff...
-print( "--> Example Pre-Processing Script" )
-if (sys.argv[2] == 'verbose'):
-    print( "=  ECHO: " + '  '.join(sys.argv) )
+def run( argv ):
+    print( "--> Example Pre-Processing Script" )
+    if (argv[2] == 'verbose'):
+        print( "=  ECHO: " + '  '.join(argv) )
+    return 0
+
+# MAIN
+if __name__ == '__main__':
+    sys.exit( run( sys.argv ) )
@@ -23,11 +23,24 @@
 # Since the <preprocess-script.py> script MUST be in every (desired) source 
 # directory, users are encouraged that the <preprocess-script.py> ONLY be a 
 # simple shell/wrapper that calls a singe instance of the 'actual script'
+#
+# The script also supports being called in-process by NQBP (i.e. it defines
+# the nqbp_run() function, see nqbplib/preprocessing.py) which avoids 
+# starting a new python interpreter for every directory.
 #---------------------------------------------------------------------------
 
 # get definition of the Options structure
 import os
 import sys
+import importlib.util
+
+# Called by NQBP (in-process)
+def nqbp_run( argv, cwd ):
+    script = os.path.join(argv[4], "scripts", "example_preprocessing_base.py" )
+    spec   = importlib.util.spec_from_file_location( "example_preprocessing_base", script )
+    module = importlib.util.module_from_spec( spec )
+    spec.loader.exec_module( module )
+    return module.run( argv )
 
 # MAIN
 if __name__ == '__main__':